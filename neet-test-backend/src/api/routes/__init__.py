@@ -4,5 +4,6 @@ from .subjects import subjects_bp
 from .topics import topics_bp
 from .questions import questions_bp
 from .tests import tests_bp
+from .ai import ai_bp
 
-__all__ = ['subjects_bp', 'topics_bp', 'questions_bp', 'tests_bp']
\ No newline at end of file
+__all__ = ['subjects_bp', 'topics_bp', 'questions_bp', 'tests_bp', 'ai_bp']
\ No newline at end of file
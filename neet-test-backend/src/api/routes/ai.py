@@ -0,0 +1,106 @@
+from flask import Blueprint, jsonify, request
+from services.http_client import get_http_client
+from services.generation_cache import generation_cache
+from services.gemini_service_new import gemini_breaker
+from services.single_flight import single_flight
+from services.quota_governor import quota_governor
+from services.ai_scheduler import ai_scheduler
+from services.question_validator import question_validator
+from services.ai_usage import ai_usage
+from services.test_job_service import test_job_service
+from services.near_duplicates import near_duplicates
+from services.ai_providers import ai_providers
+from services.token_budget import token_budget
+from services.prewarm_scheduler import prewarm_scheduler
+from services.explanation_service import explanation_service
+from services.question_writer import question_writer
+from config.settings import current_config
+
+ai_bp = Blueprint('ai', __name__)
+
+@ai_bp.route('/ai/stats', methods=['GET'])
+def get_ai_stats():
+    """Get runtime statistics for the AI generation layer"""
+    try:
+        stats = {
+            'success': True,
+            'http_pool': get_http_client().stats(),
+            'generation_cache': generation_cache.stats(),
+            'circuit_breaker': gemini_breaker.stats(),
+            'single_flight': single_flight.stats(),
+            'quota': quota_governor.stats(),
+            'scheduler': ai_scheduler.stats(),
+            'validation': question_validator.stats(),
+            'test_jobs': test_job_service.stats(),
+            'near_duplicates': near_duplicates.stats(),
+            'providers': ai_providers.stats(),
+            'token_budget': token_budget.stats(),
+            'prewarm': prewarm_scheduler.stats(),
+            'explanations': explanation_service.stats(),
+            'question_writer': question_writer.stats()
+        }
+        if current_config.AI_CLIENT == 'async':
+            from services.async_gemini_service import get_async_transport
+            transport = get_async_transport(create=False)
+            stats['async_client'] = transport.stats() if transport else None
+        return jsonify(stats), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get AI stats: {str(e)}'
+        }), 500
+
+@ai_bp.route('/ai/prewarm', methods=['GET'])
+def get_prewarm_readiness():
+    """How ready the question stock is for each scheduled exam session"""
+    try:
+        sessions = prewarm_scheduler.report()
+        return jsonify({
+            'success': True,
+            'sessions': sessions,
+            'scheduler': prewarm_scheduler.stats()
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get prewarm readiness: {str(e)}'
+        }), 500
+
+@ai_bp.route('/ai/usage', methods=['GET'])
+def get_ai_usage():
+    """Token, latency and outcome totals of AI calls
+
+    Query parameters: hours (default 24, 0 for everything retained),
+    group_by (comma-separated subset of subject,topic,difficulty,kind) and
+    recent (number of latest individual calls to include, default 0).
+    """
+    try:
+        hours = request.args.get('hours', 24, type=float)
+        group_by = [column.strip() for column in request.args.get('group_by', 'subject,topic,difficulty').split(',') if column.strip()]
+        recent = request.args.get('recent', 0, type=int)
+
+        groups = ai_usage.summary(since_seconds=hours * 3600 if hours else None, group_by=group_by)
+        response = {
+            'success': True,
+            'hours': hours,
+            'group_by': group_by,
+            'groups': groups,
+            'totals': {
+                'calls': sum(group['calls'] for group in groups),
+                'upstream_calls': sum(group['upstream_calls'] for group in groups),
+                'prompt_tokens': sum(group['prompt_tokens'] for group in groups),
+                'output_tokens': sum(group['output_tokens'] for group in groups),
+                'retries': sum(group['retries'] for group in groups)
+            }
+        }
+        if recent:
+            response['recent'] = ai_usage.recent(recent)
+        return jsonify(response), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get AI usage: {str(e)}'
+        }), 500
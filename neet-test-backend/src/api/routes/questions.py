@@ -13,6 +13,7 @@ def generate_questions():
         topic_id = request.args.get('topic_id', type=int)
         count = request.args.get('count', default=5, type=int)
         difficulty = request.args.get('difficulty', default='medium')
+        fresh = request.args.get('fresh', 'false').lower() == 'true'  # Bypass the generation cache
 
         if not subject_id:
             return jsonify({
@@ -32,7 +33,8 @@ def generate_questions():
             subject_id=subject_id,
             topic_id=topic_id,
             num_questions=count,
-            difficulty=difficulty
+            difficulty=difficulty,
+            fresh=fresh
         )
         
         return jsonify(result), status_code
@@ -102,3 +104,23 @@ def get_question_details(question_id):
             'success': False,
             'message': f'Failed to fetch question: {str(e)}'
         }), 500
+
+@questions_bp.route('/questions/inventory', methods=['GET'])
+def get_question_inventory():
+    """Get current pre-generated question stock per subject/topic/difficulty"""
+    try:
+        from services.question_inventory import question_inventory
+        
+        stock = question_inventory.stock_levels()
+        
+        return jsonify({
+            'success': True,
+            'stock': stock,
+            'total_count': sum(item['count'] for item in stock)
+        }), 200
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to fetch question inventory: {str(e)}'
+        }), 500
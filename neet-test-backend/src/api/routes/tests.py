@@ -1,14 +1,31 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from services.test_service import TestService
+from services.test_job_service import test_job_service
 
 tests_bp = Blueprint('tests', __name__)
 test_service = TestService()
+test_job_service.bind_test_service(test_service)
+
+def valid_question_count(question_count):
+    """question_count must be a JSON integer (not a bool, float or string) from 1 to 100"""
+    return isinstance(question_count, int) and not isinstance(question_count, bool) and 1 <= question_count <= 100
+
+def valid_fresh(fresh):
+    """fresh must be a JSON boolean: the string "false" would otherwise read as true"""
+    return isinstance(fresh, bool)
 
 @tests_bp.route('/tests/start', methods=['POST'])
 @jwt_required()
 def start_test():
-    """Start a new test with timer functionality"""
+    """Start a new test with timer functionality
+    
+    In job mode (?mode=job or header Prefer: respond-async) the test is
+    created in the background: the response is 202 with a job id to poll at
+    GET /tests/jobs/<job_id>.
+    """
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
@@ -25,6 +42,9 @@ def start_test():
         subject_id = data.get('subject_id')
         topic_id = data.get('topic_id')  # Optional - can be None for mixed tests
         question_count = data.get('question_count', 10)
+        # Tests bypass the generation cache so students and retakes get different sets;
+        # fresh=false reuses cached batches (load tests, demos)
+        fresh = data.get('fresh', True)
 
         if not subject_id:
             return jsonify({
@@ -32,17 +52,38 @@ def start_test():
                 'message': 'Subject ID is required'
             }), 400
 
-        if question_count < 1 or question_count > 100:
+        if not valid_question_count(question_count):
             return jsonify({
                 'success': False,
                 'message': 'Number of questions must be between 1 and 100'
             }), 400
+
+        if not valid_fresh(fresh):
+            return jsonify({
+                'success': False,
+                'message': 'fresh must be true or false'
+            }), 400
+        
+        if request.args.get('mode') == 'job' or 'respond-async' in request.headers.get('Prefer', ''):
+            result, status_code = test_job_service.submit(
+                user_id=user_id,
+                subject_id=subject_id,
+                topic_id=topic_id,
+                question_count=question_count,
+                fresh=fresh
+            )
+            response = jsonify(result)
+            if status_code == 202:
+                response.headers['Location'] = result['status_url']
+                response.headers['Retry-After'] = '1'
+            return response, status_code
         
         result, status_code = test_service.start_test(
             user_id=user_id,
             subject_id=subject_id,
             topic_id=topic_id,
-            question_count=question_count
+            question_count=question_count,
+            fresh=fresh
         )
 
         return jsonify(result), status_code
@@ -56,9 +97,92 @@ def start_test():
             'message': f'Failed to start test: {str(e)}'
         }), 500
 
+@tests_bp.route('/tests/start/stream', methods=['POST'])
+@jwt_required()
+def start_test_stream():
+    """Start a test and stream questions to the client as they are generated
+    
+    Responds with newline-delimited JSON events, or Server-Sent Events when the
+    client sends Accept: text/event-stream (or ?format=sse).
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    if not data:
+        return jsonify({
+            'success': False,
+            'message': 'Request data is required'
+        }), 400
+
+    subject_id = data.get('subject_id')
+    topic_id = data.get('topic_id')
+    question_count = data.get('question_count', 10)
+    fresh = data.get('fresh', True)
+
+    if not subject_id:
+        return jsonify({
+            'success': False,
+            'message': 'Subject ID is required'
+        }), 400
+
+    if not valid_question_count(question_count):
+        return jsonify({
+            'success': False,
+            'message': 'Number of questions must be between 1 and 100'
+        }), 400
+
+    if not valid_fresh(fresh):
+        return jsonify({
+            'success': False,
+            'message': 'fresh must be true or false'
+        }), 400
+    
+    use_sse = request.args.get('format') == 'sse' or 'text/event-stream' in request.headers.get('Accept', '')
+    events = test_service.start_test_stream(
+        user_id=user_id,
+        subject_id=subject_id,
+        topic_id=topic_id,
+        question_count=question_count,
+        fresh=fresh
+    )
+
+    def generate():
+        try:
+            for event in events:
+                if use_sse:
+                    yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    yield json.dumps(event) + '\n'
+        finally:
+            # Client went away or stream finished - stop generation upstream
+            events.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@tests_bp.route('/tests/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_test_job(job_id):
+    """Poll a test started in job mode: status, progress and the test once ready"""
+    try:
+        result, status_code = test_job_service.get(job_id, get_jwt_identity())
+        response = jsonify(result)
+        if status_code == 200 and result['status'] in ('queued', 'running'):
+            response.headers['Retry-After'] = '1'
+        return response, status_code
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get test job: {str(e)}'
+        }), 500
+
 @tests_bp.route('/tests/<int:test_id>/submit', methods=['POST'])
 def submit_test(test_id):
-    """Submit complete test with all answers and optionally the test questions"""
+    """Submit complete test with all answers (graded against the test's stored manifest)"""
     try:
         data = request.get_json()
         
@@ -69,18 +193,17 @@ def submit_test(test_id):
             }), 400
 
         answers = data.get('answers', [])
-        test_questions = data.get('test_questions', None)  # Fresh questions from Azure OpenAI
         
         # Allow empty answers for auto-submit cases (all not attempted)
         # Validate answer format for any answers that are provided
         for answer in answers:
-            if 'question_id' not in answer:
+            if 'question_id' not in answer and 'position' not in answer:
                 return jsonify({
                     'success': False,
-                    'message': 'Each answer must have question_id'
+                    'message': 'Each answer must have question_id or position'
                 }), 400
 
-        result, status_code = test_service.submit_test(test_id, answers, test_questions)
+        result, status_code = test_service.submit_test(test_id, answers)
         return jsonify(result), status_code
 
     except Exception as e:
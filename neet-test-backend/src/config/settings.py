@@ -36,9 +36,127 @@ class Config:
     MAX_QUESTIONS_PER_TEST = 100
     MIN_QUESTIONS_PER_TEST = 1
     DEFAULT_TEST_TIME_LIMIT = 3600  # 1 hour in seconds
+    # Missing or invalid generated questions are re-requested until this many seconds after the start, then taken from the bank
+    TEST_START_DEADLINE_SECONDS = float(os.environ.get('TEST_START_DEADLINE_SECONDS', 30))
+    TEST_START_TOPUP_ROUNDS = int(os.environ.get('TEST_START_TOPUP_ROUNDS', 2))
     
-    # Rate limiting (if needed)
-    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL', 'memory://')
+    # Host-local SQLite file for runtime state shared by workers (cache, leases, quotas)
+    AI_RUNTIME_DB_PATH = os.environ.get('AI_RUNTIME_DB_PATH', os.path.join(BASE_DIR, 'ai_runtime.db'))
+
+    # Rate limiting - the AI quota governor keeps its shared buckets here (sqlite:///<path>)
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', os.environ.get('REDIS_URL', f'sqlite:///{AI_RUNTIME_DB_PATH}'))
+
+    # AI API quota shared by all workers on the host; interactive test starts get priority over background refills
+    AI_QUOTA_ENABLED = os.environ.get('AI_QUOTA_ENABLED', 'True').lower() == 'true'
+    AI_QUOTA_RPM = int(os.environ.get('AI_QUOTA_RPM', 60))
+    AI_QUOTA_TPM = int(os.environ.get('AI_QUOTA_TPM', 1000000))
+    AI_QUOTA_BACKGROUND_RESERVE = float(os.environ.get('AI_QUOTA_BACKGROUND_RESERVE', 0.2))  # share of each bucket background work may not use
+    AI_QUOTA_INTERACTIVE_DEADLINE = float(os.environ.get('AI_QUOTA_INTERACTIVE_DEADLINE', 10))  # seconds before serving stored questions instead
+    AI_QUOTA_BACKGROUND_DEADLINE = float(os.environ.get('AI_QUOTA_BACKGROUND_DEADLINE', 300))
+
+    # Per-process scheduler every upstream AI request goes through, with weighted fair queuing between priority classes
+    AI_SCHEDULER_ENABLED = os.environ.get('AI_SCHEDULER_ENABLED', 'True').lower() == 'true'
+    AI_SCHEDULER_CONCURRENCY = int(os.environ.get('AI_SCHEDULER_CONCURRENCY', 16))  # upstream requests in flight per worker
+    AI_SCHEDULER_WEIGHTS = os.environ.get('AI_SCHEDULER_WEIGHTS', 'interactive:10,background:1')
+    AI_SCHEDULER_SPIKE_QUEUE = int(os.environ.get('AI_SCHEDULER_SPIKE_QUEUE', 4))  # queued interactive requests that preempt queued background ones
+
+    # Question inventory (pre-generated stock served to start_test)
+    INVENTORY_ENABLED = os.environ.get('INVENTORY_ENABLED', 'True').lower() == 'true'
+    INVENTORY_LOW_WATERMARK = int(os.environ.get('INVENTORY_LOW_WATERMARK', 20))
+    INVENTORY_HIGH_WATERMARK = int(os.environ.get('INVENTORY_HIGH_WATERMARK', 60))
+    INVENTORY_REFILL_BATCH = int(os.environ.get('INVENTORY_REFILL_BATCH', 10))
+
+    # Scheduled pre-warming of inventory stock ahead of the exam sessions listed in the calendar file
+    PREWARM_ENABLED = os.environ.get('PREWARM_ENABLED', 'True').lower() == 'true'
+    PREWARM_CALENDAR_PATH = os.environ.get('PREWARM_CALENDAR_PATH', os.path.join(BASE_DIR, 'prewarm_calendar.json'))
+    PREWARM_LEAD_MINUTES = float(os.environ.get('PREWARM_LEAD_MINUTES', 120))  # start warming at least this long before a session
+    PREWARM_MARGIN = float(os.environ.get('PREWARM_MARGIN', 0.1))  # extra share of questions on top of the headcount
+    PREWARM_INTERVAL_SECONDS = float(os.environ.get('PREWARM_INTERVAL_SECONDS', 60))
+    PREWARM_STEP_QUESTIONS = int(os.environ.get('PREWARM_STEP_QUESTIONS', 50))  # questions generated between lease renewals
+    PREWARM_LEASE_SECONDS = float(os.environ.get('PREWARM_LEASE_SECONDS', 600))  # one worker per host warms; others take over after this
+
+    # Pooled HTTP client used for AI API calls
+    AI_HTTP_POOL_SIZE = int(os.environ.get('AI_HTTP_POOL_SIZE', 20))
+    AI_HTTP_CONNECT_TIMEOUT = float(os.environ.get('AI_HTTP_CONNECT_TIMEOUT', 5))
+    AI_HTTP_READ_TIMEOUT = float(os.environ.get('AI_HTTP_READ_TIMEOUT', 60))
+    AI_HTTP_MAX_RETRIES = int(os.environ.get('AI_HTTP_MAX_RETRIES', 3))
+    AI_HTTP_BACKOFF_FACTOR = float(os.environ.get('AI_HTTP_BACKOFF_FACTOR', 0.5))
+
+    # AI client implementation: 'threaded' (blocking requests) or 'async' (aiohttp on a shared event loop)
+    AI_CLIENT = os.environ.get('AI_CLIENT', 'threaded').lower()
+    AI_ASYNC_MAX_CONCURRENCY = int(os.environ.get('AI_ASYNC_MAX_CONCURRENCY', 64))  # upstream calls in flight per process
+
+    # Gemini endpoint; point GEMINI_API_BASE_URL at utils/mock_gemini_server.py for offline load tests
+    GEMINI_API_BASE_URL = os.environ.get('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com').rstrip('/')
+    GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+    GEMINI_SDK_MODEL = os.environ.get('GEMINI_SDK_MODEL', GEMINI_MODEL)  # model of the google-generativeai backend
+
+    # generateContent backends in order of preference; a request slower than the first one's p95 is hedged to the next
+    AI_PROVIDERS = os.environ.get('AI_PROVIDERS', 'gemini-rest').split(',')  # add gemini-sdk to hedge with the SDK (Google endpoint only)
+    AI_HEDGE_ENABLED = os.environ.get('AI_HEDGE_ENABLED', 'True').lower() == 'true'
+    AI_HEDGE_PERCENTILE = float(os.environ.get('AI_HEDGE_PERCENTILE', 0.95))
+    AI_HEDGE_MIN_SAMPLES = int(os.environ.get('AI_HEDGE_MIN_SAMPLES', 20))  # latencies observed before hedging starts
+    AI_HEDGE_MIN_DELAY = float(os.environ.get('AI_HEDGE_MIN_DELAY', 1.0))  # seconds
+    AI_HEDGE_MAX_RATIO = float(os.environ.get('AI_HEDGE_MAX_RATIO', 0.1))  # share of requests that may be hedged
+    AI_HEDGE_POOL_SIZE = int(os.environ.get('AI_HEDGE_POOL_SIZE', 64))  # threads running hedgeable requests
+
+    # Gemini generation budget; larger requests are split into parallel chunks
+    GEMINI_MAX_OUTPUT_TOKENS = int(os.environ.get('GEMINI_MAX_OUTPUT_TOKENS', 2048))  # ceiling for one request
+    GEMINI_TOKENS_PER_QUESTION = int(os.environ.get('GEMINI_TOKENS_PER_QUESTION', 350))  # until enough responses were observed
+    GEMINI_MAX_PARALLEL_CHUNKS = int(os.environ.get('GEMINI_MAX_PARALLEL_CHUNKS', 20))
+    GEMINI_SALVAGE_FOLLOWUPS = int(os.environ.get('GEMINI_SALVAGE_FOLLOWUPS', 2))  # re-requests for questions cut off by truncation
+
+    # Two-phase generation: tests start from stem, options and key; explanations are generated later and stored on the question
+    GEMINI_DEFER_EXPLANATIONS = os.environ.get('GEMINI_DEFER_EXPLANATIONS', 'True').lower() == 'true'
+    EXPLANATION_BATCH_SIZE = int(os.environ.get('EXPLANATION_BATCH_SIZE', 10))  # questions explained per request
+    EXPLANATION_TOKENS = int(os.environ.get('EXPLANATION_TOKENS', 400))  # output tokens allowed per explanation
+    EXPLANATION_VIEW_TIMEOUT = float(os.environ.get('EXPLANATION_VIEW_TIMEOUT', 20))  # seconds get_test_results waits for missing explanations
+    EXPLANATION_VIEW_WORKERS = int(os.environ.get('EXPLANATION_VIEW_WORKERS', 4))  # threads writing explanations for results views
+
+    # Per-request maxOutputTokens learned from observed tokens per question (by subject and difficulty)
+    GEMINI_TOKEN_BUDGET_MARGIN = float(os.environ.get('GEMINI_TOKEN_BUDGET_MARGIN', 2.0))  # standard deviations of headroom
+    GEMINI_TOKEN_BUDGET_ALPHA = float(os.environ.get('GEMINI_TOKEN_BUDGET_ALPHA', 0.1))  # weight of the newest response
+    GEMINI_TOKEN_BUDGET_MIN_SAMPLES = int(os.environ.get('GEMINI_TOKEN_BUDGET_MIN_SAMPLES', 5))
+
+    # Prompt-keyed cache of generated question batches
+    GENERATION_CACHE_ENABLED = os.environ.get('GENERATION_CACHE_ENABLED', 'True').lower() == 'true'
+    GENERATION_CACHE_TTL = int(os.environ.get('GENERATION_CACHE_TTL', 3600))  # seconds
+    GENERATION_CACHE_MAX_ENTRIES = int(os.environ.get('GENERATION_CACHE_MAX_ENTRIES', 256))
+
+    # Identical concurrent generation requests share one upstream call (across workers via AI_RUNTIME_DB_PATH)
+    SINGLE_FLIGHT_ENABLED = os.environ.get('SINGLE_FLIGHT_ENABLED', 'True').lower() == 'true'
+    SINGLE_FLIGHT_LEASE_SECONDS = float(os.environ.get('SINGLE_FLIGHT_LEASE_SECONDS', 90))  # longest a follower waits for the leader
+
+    # Job mode of POST /tests/start: tests are created by a background pool and polled for
+    TEST_JOB_WORKERS = int(os.environ.get('TEST_JOB_WORKERS', 8))
+    TEST_JOB_MAX_PENDING = int(os.environ.get('TEST_JOB_MAX_PENDING', 200))  # queued + running jobs per process before 503
+    TEST_JOB_STALE_SECONDS = float(os.environ.get('TEST_JOB_STALE_SECONDS', 300))  # unfinished jobs without a heartbeat for this long are failed
+    TEST_JOB_RETENTION_HOURS = float(os.environ.get('TEST_JOB_RETENTION_HOURS', 24))
+
+    # Questions of a started test are written to the bank in the background; submit waits for them
+    QUESTION_WRITER_ENABLED = os.environ.get('QUESTION_WRITER_ENABLED', 'True').lower() == 'true'
+    QUESTION_WRITER_WORKERS = int(os.environ.get('QUESTION_WRITER_WORKERS', 2))
+    QUESTION_WRITER_RECOVER_GRACE_SECONDS = float(os.environ.get('QUESTION_WRITER_RECOVER_GRACE_SECONDS', 120))  # startup leaves younger pending saves to their process
+
+    # Per-call token, latency and outcome accounting (stored in AI_RUNTIME_DB_PATH)
+    AI_USAGE_ENABLED = os.environ.get('AI_USAGE_ENABLED', 'True').lower() == 'true'
+    AI_USAGE_RETENTION_DAYS = float(os.environ.get('AI_USAGE_RETENTION_DAYS', 30))
+    AI_USAGE_RECENT_CALLS = int(os.environ.get('AI_USAGE_RECENT_CALLS', 500))  # in-memory ring buffer size
+
+    # MinHash/LSH index used to keep paraphrased copies of stored questions out of the bank
+    NEAR_DUP_ENABLED = os.environ.get('NEAR_DUP_ENABLED', 'True').lower() == 'true'
+    NEAR_DUP_THRESHOLD = float(os.environ.get('NEAR_DUP_THRESHOLD', 0.85))  # estimated Jaccard similarity
+    NEAR_DUP_NUM_PERM = int(os.environ.get('NEAR_DUP_NUM_PERM', 64))
+    NEAR_DUP_BANDS = int(os.environ.get('NEAR_DUP_BANDS', 16))
+    NEAR_DUP_SYNC_SECONDS = float(os.environ.get('NEAR_DUP_SYNC_SECONDS', 5))  # how often rows inserted elsewhere are picked up
+
+    # Circuit breaker around the AI backend; while open, tests are served from the question bank
+    AI_BREAKER_WINDOW = int(os.environ.get('AI_BREAKER_WINDOW', 20))  # recent calls considered
+    AI_BREAKER_MIN_CALLS = int(os.environ.get('AI_BREAKER_MIN_CALLS', 5))
+    AI_BREAKER_FAILURE_RATE = float(os.environ.get('AI_BREAKER_FAILURE_RATE', 0.5))
+    AI_BREAKER_SLOW_CALL_SECONDS = float(os.environ.get('AI_BREAKER_SLOW_CALL_SECONDS', 20))
+    AI_BREAKER_SLOW_CALL_RATE = float(os.environ.get('AI_BREAKER_SLOW_CALL_RATE', 0.8))
+    AI_BREAKER_OPEN_SECONDS = float(os.environ.get('AI_BREAKER_OPEN_SECONDS', 30))
 
 class DevelopmentConfig(Config):
     """Development configuration"""
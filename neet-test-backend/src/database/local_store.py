@@ -0,0 +1,25 @@
+"""
+Small SQLite files for runtime state shared by all worker processes on a host
+(response caches, leases, quotas). Kept apart from the main application
+database so hot-path bookkeeping never contends with test data writes.
+"""
+import sqlite3
+import threading
+
+class LocalStore:
+    def __init__(self, path: str, schema: str = ''):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """Per-thread autocommit connection; use BEGIN IMMEDIATE for atomic read-modify-write"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if self.schema:
+                connection.executescript(self.schema)
+            self._local.connection = connection
+        return connection
@@ -1 +1,14 @@
-# This file is intentionally left blank.
\ No newline at end of file
+# Lightweight in-place schema migrations, run at startup after db.create_all()
+
+def run_migrations():
+    """Apply schema changes that create_all() cannot make to existing tables"""
+    from database.migrations import (
+        question_content_hash, question_sampling_index, test_job_heartbeat, test_question_content,
+        test_result_timer
+    )
+
+    question_content_hash.upgrade()
+    question_sampling_index.upgrade()
+    test_job_heartbeat.upgrade()
+    test_question_content.upgrade()
+    test_result_timer.upgrade()
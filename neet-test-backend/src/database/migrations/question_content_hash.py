@@ -0,0 +1,68 @@
+"""
+Add questions.content_hash with a unique (subject_id, content_hash) index and
+backfill it for existing rows.
+
+Rows whose normalized text repeats an earlier row of the same subject get a
+'duplicate:<id>' marker instead of the hash. The marker never equals a real
+hash, so the earliest copy is the one future duplicate checks resolve to.
+Because no row is left NULL, later startups select nothing and skip the
+backfill.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from database.connection import db
+from models.question import Question
+
+INDEX_NAME = 'ux_questions_subject_content_hash'
+DUPLICATE_MARKER = 'duplicate:'
+
+def upgrade():
+    inspector = inspect(db.engine)
+    if 'questions' not in inspector.get_table_names():
+        return
+
+    columns = {column['name'] for column in inspector.get_columns('questions')}
+    if 'content_hash' not in columns:
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text('ALTER TABLE questions ADD COLUMN content_hash VARCHAR(64)'))
+            print("✓ Added questions.content_hash column")
+        except OperationalError as e:
+            # Another worker starting at the same time added it first
+            if 'duplicate column' not in str(e).lower():
+                raise
+
+    backfilled = duplicates = 0
+    try:
+        with db.engine.begin() as connection:
+            # Existing hashes are unique already, so the index can come first and serve the probes below
+            connection.execute(text(
+                f'CREATE UNIQUE INDEX IF NOT EXISTS {INDEX_NAME} ON questions (subject_id, content_hash)'
+            ))
+            rows = connection.execute(text(
+                'SELECT id, subject_id, question_text FROM questions WHERE content_hash IS NULL ORDER BY id'
+            )).fetchall()
+
+            for row in rows:
+                content_hash = Question.compute_content_hash(row.question_text)
+                taken = connection.execute(
+                    text('SELECT 1 FROM questions WHERE subject_id = :subject_id AND content_hash = :content_hash'),
+                    {'subject_id': row.subject_id, 'content_hash': content_hash}
+                ).first()
+                if taken:
+                    content_hash = f'{DUPLICATE_MARKER}{row.id}'
+                    duplicates += 1
+                else:
+                    backfilled += 1
+                connection.execute(
+                    text('UPDATE questions SET content_hash = :content_hash WHERE id = :id'),
+                    {'content_hash': content_hash, 'id': row.id}
+                )
+    except OperationalError as e:
+        # SQLite lets one writer through; the worker that lost the race finds nothing left to do next start
+        print(f"⚠️ content_hash backfill skipped, another worker holds the database: {e}")
+        return
+
+    if backfilled or duplicates:
+        print(f"✓ Backfilled content_hash for {backfilled} questions ({duplicates} duplicates marked)")
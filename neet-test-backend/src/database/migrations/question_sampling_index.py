@@ -0,0 +1,17 @@
+"""
+Add the (subject_id, topic_id, difficulty_level) index used when sampling
+stored questions from the bank to existing databases.
+"""
+from sqlalchemy import inspect, text
+
+from database.connection import db
+
+def upgrade():
+    if 'questions' not in inspect(db.engine).get_table_names():
+        return
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_questions_subject_topic_difficulty '
+            'ON questions (subject_id, topic_id, difficulty_level)'
+        ))
@@ -0,0 +1,24 @@
+"""
+Add test_jobs.heartbeat_at to existing databases. Jobs created before it
+existed have no heartbeat and are judged by their start or creation time.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from database.connection import db
+
+def upgrade():
+    inspector = inspect(db.engine)
+    if 'test_jobs' not in inspector.get_table_names():
+        return
+    if 'heartbeat_at' in {column['name'] for column in inspector.get_columns('test_jobs')}:
+        return
+
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE test_jobs ADD COLUMN heartbeat_at DATETIME'))
+        print("✓ Added test_jobs.heartbeat_at column")
+    except OperationalError as e:
+        # Another worker starting at the same time added it first
+        if 'duplicate column' not in str(e).lower():
+            raise
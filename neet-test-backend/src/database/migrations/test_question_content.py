@@ -0,0 +1,33 @@
+"""
+Add the served question text, options and explanation to test_questions in
+existing databases. Manifests written before then keep NULLs and are shown
+from the bank row their question resolved to.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from database.connection import db
+
+COLUMNS = (
+    ('question_text', 'TEXT'),
+    ('options', 'JSON'),
+    ('explanation', 'TEXT')
+)
+
+def upgrade():
+    inspector = inspect(db.engine)
+    if 'test_questions' not in inspector.get_table_names():
+        return
+    existing = {column['name'] for column in inspector.get_columns('test_questions')}
+
+    for name, column_type in COLUMNS:
+        if name in existing:
+            continue
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE test_questions ADD COLUMN {name} {column_type}'))
+            print(f"✓ Added test_questions.{name} column")
+        except OperationalError as e:
+            # Another worker starting at the same time added it first
+            if 'duplicate column' not in str(e).lower():
+                raise
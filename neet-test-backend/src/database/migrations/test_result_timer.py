@@ -0,0 +1,24 @@
+"""
+Add test_results.timer_minutes to existing databases. Tests created before
+it existed have no stored timer and keep 1 minute per question.
+"""
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+
+from database.connection import db
+
+def upgrade():
+    inspector = inspect(db.engine)
+    if 'test_results' not in inspector.get_table_names():
+        return
+    if 'timer_minutes' in {column['name'] for column in inspector.get_columns('test_results')}:
+        return
+
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE test_results ADD COLUMN timer_minutes INTEGER'))
+        print("✓ Added test_results.timer_minutes column")
+    except OperationalError as e:
+        # Another worker starting at the same time added it first
+        if 'duplicate column' not in str(e).lower():
+            raise
@@ -9,7 +9,17 @@ import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from database.connection import db, init_db
+from database.migrations import run_migrations
 from config.settings import DevelopmentConfig
+from models.question_stock import QuestionStock
+from models.test_job import TestJob
+from models.pending_question_save import PendingQuestionSave
+from services.question_inventory import question_inventory
+from services.test_job_service import test_job_service
+from services.near_duplicates import near_duplicates
+from services.prewarm_scheduler import prewarm_scheduler
+from services.explanation_service import explanation_service
+from services.question_writer import question_writer
 
 # Import route blueprints
 from api.routes.auth import auth_bp
@@ -17,6 +27,7 @@ from api.routes.subjects import subjects_bp
 from api.routes.topics import topics_bp
 from api.routes.questions import questions_bp
 from api.routes.tests import tests_bp
+from api.routes.ai import ai_bp
 
 def create_app():
     """Application factory function"""
@@ -44,12 +55,21 @@ def create_app():
     # Initialize database
     init_db(app)
     
+    # Let the question inventory refiller run in an app context
+    question_inventory.init_app(app)
+    test_job_service.init_app(app)
+    near_duplicates.init_app(app)
+    prewarm_scheduler.init_app(app)
+    explanation_service.init_app(app)
+    question_writer.init_app(app)
+    
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api/v1')
     app.register_blueprint(subjects_bp, url_prefix='/api/v1')
     app.register_blueprint(topics_bp, url_prefix='/api/v1')
     app.register_blueprint(questions_bp, url_prefix='/api/v1')
     app.register_blueprint(tests_bp, url_prefix='/api/v1')
+    app.register_blueprint(ai_bp, url_prefix='/api/v1')
     
     # Health check endpoint
     @app.route('/health', methods=['GET'])
@@ -70,7 +90,8 @@ def create_app():
                 'subjects': '/api/v1/subjects',
                 'topics': '/api/v1/subjects/{id}/topics',
                 'questions': '/api/v1/questions/*',
-                'tests': '/api/v1/tests/*'
+                'tests': '/api/v1/tests/*',
+                'ai': '/api/v1/ai/*'
             },
             'features': [
                 'User registration and authentication',
@@ -132,7 +153,9 @@ def create_app():
     # Create database tables and initial data
     with app.app_context():
         db.create_all()
+        run_migrations()
         create_initial_data()
+        question_writer.recover()
     
     return app
 
@@ -0,0 +1,31 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, Text, ForeignKey, DateTime, JSON
+from database.connection import db
+
+class PendingQuestionSave(db.Model):
+    """Questions of a started test not yet written to the question bank
+
+    Committed together with the TestResult, and deleted in the same
+    transaction that stores the questions, so a started test always has
+    either this row or its questions in the database.
+    """
+    __tablename__ = 'pending_question_saves'
+
+    test_result_id = Column(Integer, ForeignKey('test_results.id'), primary_key=True)
+    subject_id = Column(Integer, ForeignKey('subjects.id'), nullable=False)
+    topic_id = Column(Integer, ForeignKey('topics.id'), nullable=True)
+    questions = Column(JSON, nullable=False)  # Question dicts as generated, including answer key and explanation
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __init__(self, test_result_id, subject_id, questions, topic_id=None):
+        self.test_result_id = test_result_id
+        self.subject_id = subject_id
+        self.topic_id = topic_id
+        self.questions = questions
+        self.attempts = 0
+        self.created_at = datetime.utcnow()
+
+    def __repr__(self):
+        return f"<PendingQuestionSave(test_result_id={self.test_result_id}, questions={len(self.questions or [])}, attempts={self.attempts})>"
@@ -1,6 +1,8 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Index
 from database.connection import db
+from utils.helpers import normalize_question_text
+import hashlib
 import enum
 
 class DifficultyLevel(enum.Enum):
@@ -10,6 +12,12 @@ class DifficultyLevel(enum.Enum):
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        # Duplicate detection probes this instead of comparing question_text
+        Index('ux_questions_subject_content_hash', 'subject_id', 'content_hash', unique=True),
+        # Random sampling from the bank filters on these
+        Index('ix_questions_subject_topic_difficulty', 'subject_id', 'topic_id', 'difficulty_level'),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     topic_id = Column(Integer, ForeignKey('topics.id'), nullable=False)
@@ -25,6 +33,7 @@ class Question(db.Model):
     created_at = Column(DateTime, default=datetime.utcnow)
     subject_id = Column(Integer, ForeignKey('subjects.id'), nullable=False)
     source = Column(String(50), default='manual', nullable=True)  # Track question source
+    content_hash = Column(String(64), nullable=True)  # sha256 of the normalized question text
 
     def __init__(self, question_text, option_a, option_b, option_c, option_d, 
                  correct_answer, explanation, subject_id, topic_id, difficulty_level='medium', is_active=True, difficulty=None, source='manual'):
@@ -39,6 +48,7 @@ class Question(db.Model):
         self.topic_id = topic_id
         self.is_active = is_active
         self.source = source
+        self.content_hash = self.compute_content_hash(question_text)
         
         # Handle both old enum style and new string style
         if difficulty:
@@ -49,6 +59,23 @@ class Question(db.Model):
         else:
             self.difficulty_level = difficulty_level
 
+    @staticmethod
+    def compute_content_hash(question_text):
+        """Hash of the normalized question text; equal for trivially different copies"""
+        return hashlib.sha256(normalize_question_text(question_text).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def find_ids_by_content_hashes(cls, subject_id, content_hashes):
+        """Look up many questions of one subject in a single indexed query; returns {hash: id}"""
+        hashes = {h for h in content_hashes if h}
+        if not hashes:
+            return {}
+        rows = db.session.query(cls.content_hash, cls.id).filter(
+            cls.subject_id == subject_id,
+            cls.content_hash.in_(hashes)
+        ).all()
+        return {content_hash: question_id for content_hash, question_id in rows}
+
     def get_options(self):
         return {
             'A': self.option_a,
@@ -99,5 +126,20 @@ class Question(db.Model):
         
         return data
 
+    def to_generation_dict(self):
+        """Question in the same shape the AI service returns, for serving stored questions in tests"""
+        return {
+            'question_text': self.question_text,
+            'option_a': self.option_a,
+            'option_b': self.option_b,
+            'option_c': self.option_c,
+            'option_d': self.option_d,
+            'correct_answer': self.correct_answer,
+            'explanation': self.explanation,
+            'difficulty': self.difficulty_level,
+            'topic_id': self.topic_id,
+            'source': 'question_bank'
+        }
+
     def __repr__(self):
         return f"<Question(id={self.id}, subject_id={self.subject_id}, topic_id={self.topic_id})>"
\ No newline at end of file
@@ -0,0 +1,27 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, Index
+from database.connection import db
+
+class QuestionStock(db.Model):
+    """Pre-generated question waiting in the inventory to be served to a test"""
+    __tablename__ = 'question_stock'
+    __table_args__ = (
+        Index('ix_question_stock_key', 'subject_id', 'topic_id', 'difficulty'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    subject_id = Column(Integer, ForeignKey('subjects.id'), nullable=False)
+    topic_id = Column(Integer, ForeignKey('topics.id'), nullable=True)  # Null for mixed-topic stock
+    difficulty = Column(String(20), nullable=False, default='medium')
+    payload = Column(JSON, nullable=False)  # Question dict exactly as returned by the AI service
+    claimed_by = Column(String(32), nullable=True)  # Set while a taker is removing the row
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __init__(self, subject_id, payload, topic_id=None, difficulty='medium'):
+        self.subject_id = subject_id
+        self.topic_id = topic_id
+        self.difficulty = difficulty
+        self.payload = payload
+
+    def __repr__(self):
+        return f"<QuestionStock(id={self.id}, subject_id={self.subject_id}, topic_id={self.topic_id}, difficulty='{self.difficulty}')>"
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Float, JSON
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, Float, JSON, Index
 from database.connection import db
 import enum
 
@@ -23,13 +23,14 @@ class TestResult(db.Model):
     max_score = Column(Integer, nullable=False, default=0)   # Maximum possible score
     score_percentage = Column(Float, nullable=False, default=0.0)
     time_taken = Column(Integer, nullable=True)  # in seconds
+    timer_minutes = Column(Integer, nullable=True)  # Time limit announced to the client, when not 1 minute per question
     status = Column(String(20), default=TestStatus.IN_PROGRESS.value)
     started_at = Column(DateTime, default=datetime.utcnow)
     completed_at = Column(DateTime, nullable=True)
 
     def __init__(self, user_id, subject_id, total_questions, topic_id=None, correct_answers=0, 
                  wrong_answers=0, not_attempted=0, neet_score=0, max_score=0, score_percentage=0.0, 
-                 time_taken=0, status=None, started_at=None):
+                 time_taken=0, status=None, started_at=None, timer_minutes=None):
         self.user_id = user_id
         self.subject_id = subject_id
         self.topic_id = topic_id
@@ -41,9 +42,14 @@ class TestResult(db.Model):
         self.max_score = max_score
         self.score_percentage = score_percentage
         self.time_taken = time_taken
+        self.timer_minutes = timer_minutes
         self.status = status or TestStatus.IN_PROGRESS.value
         self.started_at = started_at or datetime.utcnow()
 
+    def time_limit_minutes(self):
+        """Minutes the student was given: the announced timer, else 1 minute per question"""
+        return self.timer_minutes or self.total_questions
+
     def calculate_score(self):
         if self.total_questions == 0:
             return 0.0
@@ -110,4 +116,53 @@ class TestAnswer(db.Model):
             'is_correct': self.is_correct,
             'time_taken': self.time_taken,
             'answered_at': self.answered_at.isoformat() if self.answered_at else None
-        }
\ No newline at end of file
+        }
+class TestQuestion(db.Model):
+    """Manifest entry: a question of a test as it was served, with its answer key, written when the test starts
+
+    The bank row a question resolves to is found by content hash, and may
+    have been stored with other options or explanation, so results are
+    shown from the text and options kept here.
+    """
+    __tablename__ = 'test_questions'
+    __table_args__ = (
+        Index('ix_test_questions_test_position', 'test_result_id', 'position', unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    test_result_id = Column(Integer, ForeignKey('test_results.id'), nullable=False)
+    position = Column(Integer, nullable=False)  # Order the questions were served in
+    question_id = Column(Integer, ForeignKey('questions.id'), nullable=True)  # Set once the question is stored in the bank
+    client_id = Column(String(64), nullable=True)  # The id the client was given for the question
+    correct_answer = Column(String(1), nullable=False)
+    question_text = Column(Text, nullable=True)  # As served; NULL for tests started before it was kept
+    options = Column(JSON, nullable=True)  # {'A': ..., 'B': ..., 'C': ..., 'D': ...} as served
+    explanation = Column(Text, nullable=True)
+
+    def __init__(self, test_result_id, position, correct_answer, client_id=None, question_id=None,
+                 question_text=None, options=None, explanation=None):
+        self.test_result_id = test_result_id
+        self.position = position
+        self.correct_answer = correct_answer
+        self.client_id = client_id
+        self.question_id = question_id
+        self.question_text = question_text
+        self.options = options
+        self.explanation = explanation
+
+    @classmethod
+    def from_served(cls, test_result_id, position, question):
+        """Manifest entry for a generated or client-formatted question dict"""
+        options = question.get('options') or {key: question.get(f'option_{key.lower()}') for key in 'ABCD'}
+        return cls(
+            test_result_id,
+            position,
+            (question.get('correct_answer') or '').strip().upper()[:1],
+            client_id=str(question['id']) if question.get('id') is not None else None,
+            question_text=question.get('question_text'),
+            options={key: options.get(key) for key in 'ABCD'},
+            explanation=question.get('explanation') or None
+        )
+
+    def __repr__(self):
+        return f"<TestQuestion(test_result_id={self.test_result_id}, position={self.position}, question_id={self.question_id})>"
@@ -0,0 +1,71 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, Boolean, JSON, Index
+from database.connection import db
+
+class TestJob(db.Model):
+    """Background creation of a test, polled by the client until it finishes"""
+    __tablename__ = 'test_jobs'
+    __table_args__ = (
+        Index('ix_test_jobs_status_created', 'status', 'created_at'),
+    )
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    subject_id = Column(Integer, ForeignKey('subjects.id'), nullable=False)
+    topic_id = Column(Integer, ForeignKey('topics.id'), nullable=True)
+    question_count = Column(Integer, nullable=False)
+    fresh = Column(Boolean, nullable=False, default=True)
+    status = Column(String(20), nullable=False, default=QUEUED)
+    questions_ready = Column(Integer, nullable=False, default=0)  # Progress while running
+    test_id = Column(Integer, ForeignKey('test_results.id'), nullable=True)
+    result = Column(JSON, nullable=True)  # start_test response once completed
+    status_code = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Refreshed while the owning process holds the job
+
+    def __init__(self, id, user_id, subject_id, question_count, topic_id=None, fresh=True):
+        self.id = id
+        self.user_id = user_id
+        self.subject_id = subject_id
+        self.topic_id = topic_id
+        self.question_count = question_count
+        self.fresh = fresh
+        self.status = self.QUEUED
+        self.questions_ready = 0
+        self.created_at = datetime.utcnow()
+        self.heartbeat_at = self.created_at
+
+    @property
+    def finished(self):
+        return self.status in (self.COMPLETED, self.FAILED)
+
+    def to_dict(self):
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': {
+                'questions_ready': self.questions_ready,
+                'total_questions': self.question_count
+            },
+            'test_id': self.test_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.status == self.COMPLETED:
+            data['test'] = self.result
+        elif self.status == self.FAILED:
+            data['message'] = self.error
+            data['status_code'] = self.status_code
+        return data
+
+    def __repr__(self):
+        return f"<TestJob(id='{self.id}', status='{self.status}', test_id={self.test_id})>"
@@ -0,0 +1,377 @@
+"""
+Registry of the AI generation backends, with hedged requests across them.
+
+Every backend speaks Gemini's generateContent format: it takes a request
+body and returns a response body, so callers parse one shape whichever
+backend answered. Backends are registered by name with a factory and created
+on first use; one whose dependencies are missing (the SDK backend needs
+google-generativeai) is reported unavailable instead of breaking imports.
+The SDK backend is opt-in through AI_PROVIDERS: it always calls Google, so
+it also refuses to start when GEMINI_API_BASE_URL points elsewhere (a mock
+server or a proxy), where it would send hedges to the real API.
+
+A request goes to the first configured backend. If that backend has not
+answered by its observed p95 latency, the same request is sent to the next
+available backend; the first answer wins and the other request is cancelled.
+Hedged requests are streamed so that cancelling one closes its connection
+and stops the upstream generation. Hedging waits for enough latency samples
+and is capped to a fraction of requests, so a slow upstream never gets
+twice the load. A hedge takes its own scheduler slot and reserves its own
+quota, and is skipped when either is not free at once; the quota is settled
+against its reported usage (or refunded when the backend rejected it).
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, Callable, List, Tuple
+from urllib.parse import urlparse
+
+from config.settings import current_config
+from services.ai_scheduler import AIScheduler, ai_scheduler
+from services.quota_governor import quota_governor, current_priority
+
+class ProviderError(Exception):
+    """A backend answered with an error status"""
+
+    def __init__(self, provider: str, status: int, retries: int = 0):
+        super().__init__(f'{provider} returned HTTP {status}')
+        self.provider = provider
+        self.status = status
+        self.retries = retries
+
+class GenerationCancelled(Exception):
+    """The request was cancelled because another backend answered first"""
+
+class LatencyTracker:
+    """Latencies of a backend's recent successful calls"""
+
+    def __init__(self, window_size: int = 200):
+        self._latencies = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, fraction: float, min_samples: int = 1) -> Optional[float]:
+        """Latency below which `fraction` of the recent calls finished; None with too few samples"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies or len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def __len__(self):
+        return len(self._latencies)
+
+def parse_stream_event(line: str) -> Optional[Dict[str, Any]]:
+    """Decoded event of one server-sent-events line, or None for other lines"""
+    if not line or not line.startswith('data:'):
+        return None
+    return json.loads(line[len('data:'):].strip())
+
+class RestGeminiProvider:
+    """Gemini REST API through the pooled HTTP client"""
+
+    def __init__(self, name: str, base_url: str, model: str, api_key: str, http):
+        model_url = f"{base_url}/v1beta/models/{model}"
+        self.name = name
+        self.url = f"{model_url}:generateContent?key={api_key}"
+        self.stream_url = f"{model_url}:streamGenerateContent?alt=sse&key={api_key}"
+        self.headers = {
+            "Content-Type": "application/json"
+        }
+        self.http = http
+
+    def generate_content(self, body: Dict[str, Any], cancelled: Optional[threading.Event] = None) -> Tuple[Dict[str, Any], int]:
+        """(generateContent response, retries); streamed when the call may be cancelled"""
+        if cancelled is None:
+            response = self.http.post(self.url, headers=self.headers, json=body)
+            if not response.ok:
+                raise ProviderError(self.name, response.status_code, response.retries)
+            return response.json(), response.retries
+
+        response = self.http.post(self.stream_url, headers=self.headers, json=body, stream=True)
+        if not response.ok:
+            response.close()
+            raise ProviderError(self.name, response.status_code, response.retries)
+
+        text, finish_reason, usage = [], None, None
+        response.encoding = 'utf-8'
+        with response:
+            for line in response.iter_lines(chunk_size=256, decode_unicode=True):
+                if cancelled.is_set():
+                    raise GenerationCancelled(self.name)
+                event = parse_stream_event(line)
+                if event is None:
+                    continue
+                candidate = (event.get('candidates') or [{}])[0]
+                text.extend(part.get('text', '') for part in candidate.get('content', {}).get('parts', []))
+                finish_reason = candidate.get('finishReason', finish_reason)
+                usage = event.get('usageMetadata', usage)
+
+        result = {
+            'candidates': [{
+                'content': {'parts': [{'text': ''.join(text)}], 'role': 'model'},
+                'finishReason': finish_reason
+            }]
+        }
+        if usage:
+            result['usageMetadata'] = usage
+        return result, response.retries
+
+def _create_rest_provider():
+    from services.http_client import get_http_client
+    api_key = os.getenv('GEMINI_API_KEY')
+    if not api_key:
+        raise ValueError("Missing Gemini API key. Check your .env file.")
+    return RestGeminiProvider('gemini-rest', current_config.GEMINI_API_BASE_URL, current_config.GEMINI_MODEL, api_key, get_http_client())
+
+GOOGLE_API_HOST = 'generativelanguage.googleapis.com'
+
+def _create_sdk_provider():
+    base_url = current_config.GEMINI_API_BASE_URL
+    if urlparse(base_url).hostname != GOOGLE_API_HOST:
+        raise ValueError(f"the SDK always calls {GOOGLE_API_HOST}, but GEMINI_API_BASE_URL is {base_url}")
+    # google-generativeai is only imported when this backend is configured
+    from services.gemini_service import GeminiService
+    return GeminiService(model_name=current_config.GEMINI_SDK_MODEL)
+
+class ProviderRegistry:
+    def __init__(self, order: List[str], hedge_enabled: bool = True, hedge_percentile: float = 0.95,
+                 hedge_min_samples: int = 20, hedge_min_delay: float = 1.0, hedge_max_ratio: float = 0.1,
+                 pool_size: int = 64, quota=None, scheduler=None):
+        self.order = order
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_ratio = hedge_max_ratio
+        self.quota = quota
+        # Hedges take a slot here like every other upstream request
+        self.scheduler = scheduler or AIScheduler(enabled=False)
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._providers: Dict[str, Any] = {}
+        self._unavailable: Dict[str, str] = {}
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='ai-provider')
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'hedged': 0,
+            'hedge_wins': 0,
+            'cancelled': 0,
+            'hedges_without_slot': 0
+        }
+        self._provider_stats: Dict[str, Dict[str, int]] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        """Register a backend; `factory` builds an object with generate_content(body, cancelled)"""
+        with self._lock:
+            self._factories[name] = factory
+            self._latency.setdefault(name, LatencyTracker())
+            self._provider_stats.setdefault(name, {'calls': 0, 'wins': 0, 'errors': 0})
+
+    def get(self, name: str):
+        """The backend registered as `name`, created on first use; None if it cannot be created"""
+        with self._lock:
+            if name in self._providers:
+                return self._providers[name]
+            if name in self._unavailable or name not in self._factories:
+                return None
+            factory = self._factories[name]
+        try:
+            provider = factory()
+        except Exception as e:
+            print(f"⚠️ AI provider {name} unavailable: {e}")
+            with self._lock:
+                self._unavailable[name] = str(e)
+            return None
+        with self._lock:
+            return self._providers.setdefault(name, provider)
+
+    def available(self) -> List[str]:
+        """Configured backends that could be created, in order of preference"""
+        return [name for name in self.order if self.get(name) is not None]
+
+    def generate_content(self, body: Dict[str, Any], estimated_tokens: int = 0) -> Tuple[Dict[str, Any], int, str]:
+        """Run a generateContent request, hedged across backends; returns (response, retries, backend name)
+
+        Raises ProviderError when the answering backends returned error statuses.
+        """
+        names = self.available()
+        if not names:
+            raise RuntimeError('No AI provider is available')
+        primary = names[0]
+        # A lone backend is hedged against itself: the duplicate usually reaches another replica
+        hedge = names[1] if len(names) > 1 else primary
+        self._count('requests')
+
+        delay = self._hedge_delay(primary)
+        if delay is None:
+            return self._call(primary, body, None) + (primary,)
+
+        calls = {}
+        first = self._start(calls, primary, body, primary=True)
+        done, _ = wait([first], timeout=delay)
+        slot = self._hedge_slot(estimated_tokens) if not done else None
+        if slot is not None:
+            print(f"🏇 {primary} slower than {delay:.1f}s - hedging with {hedge}")
+            self._count('hedged')
+            self._start(calls, hedge, body, hedge_tokens=estimated_tokens, slot=slot)
+
+        pending = set(calls)
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = calls[future][0]
+                    try:
+                        result, retries = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if future is not first:
+                        self._count('hedge_wins')
+                    return result, retries, name
+            raise error
+        finally:
+            # Cancel whichever request lost (or never started)
+            for future in pending:
+                calls[future][1].set()
+                future.cancel()
+                self._count('cancelled')
+
+    def _start(self, calls: Dict, name: str, body: Dict[str, Any], primary: bool = False,
+               hedge_tokens: Optional[int] = None, slot=None):
+        cancelled = threading.Event()
+        future = self._executor.submit(self._call, name, body, cancelled, primary, hedge_tokens, slot)
+        if slot is not None:
+            # A hedge cancelled before it started never runs _call to hand these back
+            future.add_done_callback(lambda done: done.cancelled() and self._drop_hedge(slot, hedge_tokens))
+        calls[future] = (name, cancelled)
+        return future
+
+    def _call(self, name: str, body: Dict[str, Any], cancelled: Optional[threading.Event], primary: bool = True,
+              hedge_tokens: Optional[int] = None, slot=None) -> Tuple[Dict[str, Any], int]:
+        """Run one request on `name`; a hedge's scheduler `slot` and reserved `hedge_tokens` are settled here
+
+        The caller settles the primary's reservation. A cancelled hedge keeps
+        its reservation, since the tokens it generated before closing are unknown.
+        """
+        try:
+            return self._call_provider(name, body, cancelled, primary, hedge_tokens)
+        finally:
+            if slot is not None:
+                self.scheduler.release(slot)
+
+    def _call_provider(self, name: str, body: Dict[str, Any], cancelled: Optional[threading.Event], primary: bool,
+                       hedge_tokens: Optional[int]) -> Tuple[Dict[str, Any], int]:
+        provider = self.get(name)
+        started = time.monotonic()
+        self._count_provider(name, 'calls')
+        try:
+            result = provider.generate_content(body, cancelled)
+        except GenerationCancelled:
+            # A primary that lost took at least this long; leaving it out would drag its p95 down
+            if primary:
+                self._latency[name].record(time.monotonic() - started)
+            raise
+        except Exception as e:
+            self._count_provider(name, 'errors')
+            if hedge_tokens is not None and isinstance(e, ProviderError):
+                self._settle_hedge(hedge_tokens, 0)
+            raise
+        self._latency[name].record(time.monotonic() - started)
+        if hedge_tokens is not None:
+            self._settle_hedge(hedge_tokens, (result[0].get('usageMetadata') or {}).get('totalTokenCount'))
+        if cancelled is None or not cancelled.is_set():
+            self._count_provider(name, 'wins')
+        return result
+
+    def expected_latency(self, fraction: float = 0.95) -> Optional[float]:
+        """Recent latency percentile of the preferred available backend; None before any call"""
+        names = self.available()
+        return self._latency[names[0]].percentile(fraction) if names else None
+
+    def _hedge_delay(self, name: str) -> Optional[float]:
+        """Seconds to wait for `name` before hedging; None when requests are not hedged"""
+        if not self.hedge_enabled:
+            return None
+        p95 = self._latency[name].percentile(self.hedge_percentile, self.hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(p95, self.hedge_min_delay)
+
+    def _hedge_slot(self, estimated_tokens: int):
+        """Scheduler slot and quota for another hedge, if it fits the ratio cap and both are free now
+
+        Returns the scheduler job to release when the hedge ends; None means no hedge.
+        """
+        with self._lock:
+            if self._stats['hedged'] >= self.hedge_max_ratio * self._stats['requests']:
+                return None
+        # A hedge never waits for a slot or quota: it is only useful if it can start now
+        slot = self.scheduler.try_acquire(estimated_tokens)
+        if slot is None:
+            self._count('hedges_without_slot')
+            return None
+        if self.quota is None or not self.quota.enabled or self.quota.try_acquire(estimated_tokens, current_priority()) == 0:
+            return slot
+        self.scheduler.release(slot)
+        return None
+
+    def _drop_hedge(self, slot, estimated_tokens: int):
+        self.scheduler.release(slot)
+        self._settle_hedge(estimated_tokens, 0)
+
+    def _settle_hedge(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        if self.quota is not None:
+            self.quota.settle(estimated_tokens, actual_tokens)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _count_provider(self, provider: str, name: str):
+        with self._lock:
+            self._provider_stats[provider][name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        providers = {}
+        for name in self._factories:
+            p95 = self._latency[name].percentile(self.hedge_percentile)
+            with self._lock:
+                if name in self._providers:
+                    state = 'ready'
+                elif name in self._unavailable:
+                    state = f'unavailable: {self._unavailable[name]}'
+                else:
+                    state = 'not_loaded'
+                providers[name] = dict(
+                    self._provider_stats[name],
+                    configured=name in self.order,
+                    state=state,
+                    p95_ms=round(p95 * 1000) if p95 is not None else None,
+                    samples=len(self._latency[name])
+                )
+        with self._lock:
+            return dict(self._stats, order=self.order, hedge_enabled=self.hedge_enabled, providers=providers)
+
+ai_providers = ProviderRegistry(
+    order=current_config.AI_PROVIDERS,
+    hedge_enabled=current_config.AI_HEDGE_ENABLED,
+    hedge_percentile=current_config.AI_HEDGE_PERCENTILE,
+    hedge_min_samples=current_config.AI_HEDGE_MIN_SAMPLES,
+    hedge_min_delay=current_config.AI_HEDGE_MIN_DELAY,
+    hedge_max_ratio=current_config.AI_HEDGE_MAX_RATIO,
+    pool_size=current_config.AI_HEDGE_POOL_SIZE,
+    quota=quota_governor,
+    scheduler=ai_scheduler
+)
+ai_providers.register('gemini-rest', _create_rest_provider)
+ai_providers.register('gemini-sdk', _create_sdk_provider)
@@ -0,0 +1,252 @@
+"""
+Central scheduler for upstream AI requests in this process.
+
+Every generateContent request (threaded or async, plain or streamed) takes a
+slot here before it asks the host-wide quota governor for capacity, so at
+most AI_SCHEDULER_CONCURRENCY requests are in flight per worker. Requests
+queue per priority class: the class comes from the same context variable as
+the quota priority (see quota_priority), so interactive work (tests being
+started) and background work (inventory refills, prewarming) need no extra
+plumbing.
+
+Free slots are handed out by weighted fair queuing: each job is tagged with
+a virtual finish time (its estimated tokens divided by its class weight), and
+the queued job with the earliest tag runs next. Background work therefore
+keeps a small steady share instead of starving, but cannot crowd out
+students. When interactive jobs pile up (AI_SCHEDULER_SPIKE_QUEUE queued),
+queued background jobs are preempted: they are dropped from the queue and
+their callers get no slot, so they give up and retry later, and new
+background jobs are refused until the interactive queue drains. Running
+jobs are never interrupted.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+from config.settings import current_config
+from services.quota_governor import current_priority, INTERACTIVE, BACKGROUND
+
+# A job that never got a slot keeps its state, which callers record as the call's outcome
+QUEUED, RUNNING, PREEMPTED, TIMED_OUT, DONE = 'queued', 'running', 'preempted', 'queue_timeout', 'done'
+
+class AIJob:
+    """One upstream request waiting for, or holding, a slot"""
+
+    def __init__(self, priority: str, cost: float, start: float, finish: float):
+        self.priority = priority
+        self.cost = cost
+        self.start = start
+        self.finish = finish
+        self.state = QUEUED
+        self.queued_at = time.monotonic()
+        self._event = threading.Event()
+        self._loop = None
+        self._future = None
+
+    @property
+    def granted(self) -> bool:
+        return self.state in (RUNNING, DONE)
+
+    def _wake(self):
+        self._event.set()
+        if self._future is not None:
+            self._loop.call_soon_threadsafe(lambda: self._future.done() or self._future.set_result(None))
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Class weights from 'interactive:10,background:1'"""
+    weights = {}
+    for item in spec.split(','):
+        if ':' in item:
+            name, weight = item.split(':', 1)
+            weights[name.strip()] = max(float(weight), 0.001)
+    return weights
+
+class AIScheduler:
+    def __init__(self, concurrency: int = 16, weights: Optional[Dict[str, float]] = None, spike_queue: int = 4,
+                 deadlines: Optional[Dict[str, float]] = None, enabled: bool = True):
+        self.concurrency = concurrency
+        self.weights = {INTERACTIVE: 10.0, BACKGROUND: 1.0, **(weights or {})}
+        self.spike_queue = spike_queue                # Queued interactive jobs that preempt background work
+        self.deadlines = deadlines or {INTERACTIVE: 10.0, BACKGROUND: 300.0}
+        self.enabled = enabled
+        self._queues: Dict[str, deque] = {name: deque() for name in self.weights}
+        self._last_finish: Dict[str, float] = {name: 0.0 for name in self.weights}
+        self._virtual_time = 0.0
+        self._running = 0
+        self._lock = threading.Lock()
+        self._stats = {name: {'granted': 0, 'queued': 0, 'preempted': 0, 'timed_out': 0, 'wait_seconds': 0.0}
+                       for name in self.weights}
+
+    def _class(self, priority: Optional[str]) -> str:
+        priority = priority or current_priority()
+        return priority if priority in self.weights else BACKGROUND
+
+    def _spiking(self) -> bool:
+        return len(self._queues.get(INTERACTIVE, ())) >= self.spike_queue
+
+    def _deadline(self, name: str) -> float:
+        return self.deadlines.get(name, self.deadlines[BACKGROUND])
+
+    def _submit(self, cost: float, priority: Optional[str], loop=None, future=None) -> AIJob:
+        """Queue a job (or start it at once when a slot is free)"""
+        name = self._class(priority)
+        with self._lock:
+            start = max(self._virtual_time, self._last_finish[name])
+            job = AIJob(name, cost, start, start + max(cost, 1.0) / self.weights[name])
+            job._loop, job._future = loop, future
+            self._last_finish[name] = job.finish
+
+            if name != INTERACTIVE and self._spiking():
+                job.state = PREEMPTED
+                self._stats[name]['preempted'] += 1
+                return job
+
+            self._queues[name].append(job)
+            if self._running >= self.concurrency:
+                self._stats[name]['queued'] += 1
+            if name == INTERACTIVE and self._spiking():
+                self._preempt_background()
+            self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """Start queued jobs in virtual finish order while slots are free; lock held"""
+        while self._running < self.concurrency:
+            heads = [queue[0] for queue in self._queues.values() if queue]
+            if not heads:
+                return
+            job = min(heads, key=lambda head: head.finish)
+            self._queues[job.priority].popleft()
+            self._virtual_time = max(self._virtual_time, job.start)
+            job.state = RUNNING
+            self._running += 1
+            self._stats[job.priority]['granted'] += 1
+            self._stats[job.priority]['wait_seconds'] += time.monotonic() - job.queued_at
+            job._wake()
+
+    def _preempt_background(self):
+        """Drop every queued non-interactive job; lock held"""
+        for name, queue in self._queues.items():
+            if name == INTERACTIVE:
+                continue
+            while queue:
+                job = queue.popleft()
+                job.state = PREEMPTED
+                self._stats[name]['preempted'] += 1
+                job._wake()
+            # Later background jobs start from now rather than from the dropped jobs' tags
+            self._last_finish[name] = self._virtual_time
+
+    def _give_up(self, job: AIJob) -> bool:
+        """Withdraw a job whose deadline passed; False if it was granted in the meantime"""
+        with self._lock:
+            if job.state != QUEUED:
+                return False
+            self._queues[job.priority].remove(job)
+            job.state = TIMED_OUT
+            self._stats[job.priority]['timed_out'] += 1
+        print(f"⏳ AI scheduler: {job.priority} request gave up after waiting {self._deadline(job.priority)}s")
+        return True
+
+    def _outcome(self, job: AIJob) -> AIJob:
+        if job.state == PREEMPTED:
+            print(f"⏏️ AI scheduler: {job.priority} request preempted by interactive demand")
+        return job
+
+    def acquire(self, cost: float = 1.0, priority: Optional[str] = None) -> AIJob:
+        """Wait for a slot; returns the job, to release afterwards if `granted`
+
+        A job that was preempted or gave up waiting is returned ungranted.
+
+        `cost` is the request's estimated tokens. Priority defaults to the
+        caller's quota priority context.
+        """
+        if not self.enabled:
+            return self._unscheduled(cost)
+        job = self._submit(cost, priority)
+        if job.state == QUEUED and not job._event.wait(self._deadline(job.priority)):
+            self._give_up(job)
+        return self._outcome(job)
+
+    async def acquire_async(self, cost: float = 1.0, priority: Optional[str] = None) -> AIJob:
+        """acquire() for the event loop: awaits the slot instead of blocking"""
+        if not self.enabled:
+            return self._unscheduled(cost)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job = self._submit(cost, priority, loop, future)
+        if job.state != QUEUED:
+            return self._outcome(job)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self._deadline(job.priority))
+        except asyncio.TimeoutError:
+            self._give_up(job)
+        except asyncio.CancelledError:
+            # The caller went away: withdraw the job, or hand back a slot it was just given
+            if not self._give_up(job):
+                self.release(job)
+            raise
+        return self._outcome(job)
+
+    def try_acquire(self, cost: float = 1.0, priority: Optional[str] = None) -> Optional[AIJob]:
+        """Take a slot only if one is free now and nothing is queued for it; None otherwise
+
+        For optional work such as hedged duplicates, which are only useful if
+        they start at once. A granted job is released like any other.
+        """
+        if not self.enabled:
+            return self._unscheduled(cost)
+        name = self._class(priority)
+        with self._lock:
+            if self._running >= self.concurrency or any(self._queues.values()):
+                return None
+            if name != INTERACTIVE and self._spiking():
+                return None
+            start = max(self._virtual_time, self._last_finish[name])
+            job = AIJob(name, cost, start, start + max(cost, 1.0) / self.weights[name])
+            self._last_finish[name] = job.finish
+            self._virtual_time = start
+            job.state = RUNNING
+            self._running += 1
+            self._stats[name]['granted'] += 1
+        return job
+
+    def _unscheduled(self, cost: float) -> AIJob:
+        """Granted job that holds no slot, used while the scheduler is disabled"""
+        job = AIJob(INTERACTIVE, cost, 0.0, 0.0)
+        job.state = DONE
+        return job
+
+    def release(self, job: AIJob):
+        """Return a granted job's slot and start the next queued job"""
+        with self._lock:
+            if job.state != RUNNING:
+                return
+            job.state = DONE
+            self._running -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            classes = {
+                name: dict(counters, wait_seconds=round(counters['wait_seconds'], 3), weight=self.weights[name],
+                           waiting=len(self._queues[name]))
+                for name, counters in self._stats.items()
+            }
+            return {
+                'enabled': self.enabled,
+                'concurrency': self.concurrency,
+                'running': self._running,
+                'spike_queue': self.spike_queue,
+                'classes': classes
+            }
+
+ai_scheduler = AIScheduler(
+    concurrency=current_config.AI_SCHEDULER_CONCURRENCY,
+    weights=parse_weights(current_config.AI_SCHEDULER_WEIGHTS),
+    spike_queue=current_config.AI_SCHEDULER_SPIKE_QUEUE,
+    deadlines={INTERACTIVE: current_config.AI_QUOTA_INTERACTIVE_DEADLINE, BACKGROUND: current_config.AI_QUOTA_BACKGROUND_DEADLINE},
+    enabled=current_config.AI_SCHEDULER_ENABLED
+)
@@ -0,0 +1,177 @@
+"""
+Per-call cost and latency accounting for the AI backends.
+
+Every upstream request records its token usage, latency, retries, outcome
+and how many questions it yielded; cache hits and fallbacks are recorded
+too, so the share of tests served without an upstream call is visible.
+Rows go to a table in the shared runtime SQLite file (so all workers
+aggregate together) and the most recent ones are also kept in a ring
+buffer for quick inspection.
+"""
+import threading
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+
+from config.settings import current_config
+from database.local_store import LocalStore
+
+USAGE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ai_calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    kind TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    subject TEXT,
+    topic TEXT,
+    difficulty TEXT,
+    requested INTEGER NOT NULL DEFAULT 0,
+    yielded INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms INTEGER NOT NULL DEFAULT 0,
+    retries INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_ai_calls_created_at ON ai_calls (created_at);
+'''
+
+# Kinds that reached the upstream API (the rest were served locally)
+UPSTREAM_KINDS = ('generate', 'followup', 'stream', 'explain')
+GROUP_COLUMNS = ('subject', 'topic', 'difficulty', 'kind')
+
+class AIUsageLedger:
+    def __init__(self, disk_path: Optional[str], retention_days: float = 30, recent_size: int = 500,
+                 enabled: bool = True, clock=time.time):
+        self.retention_seconds = retention_days * 86400
+        self.enabled = enabled
+        self.clock = clock
+        self.store = LocalStore(disk_path, USAGE_SCHEMA) if disk_path else None
+        self._recent = deque(maxlen=recent_size)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def record(self, kind: str, outcome: str, subject: Optional[str] = None, topic: Optional[str] = None,
+               difficulty: Optional[str] = None, requested: int = 0, yielded: int = 0,
+               usage: Optional[Dict[str, Any]] = None, latency: float = 0.0, retries: int = 0):
+        """Record one call; `usage` is the response's usageMetadata and `latency` is in seconds"""
+        if not self.enabled:
+            return
+        usage = usage or {}
+        row = {
+            'created_at': self.clock(),
+            'kind': kind,
+            'outcome': outcome,
+            'subject': subject,
+            'topic': topic,
+            'difficulty': difficulty,
+            'requested': requested,
+            'yielded': yielded,
+            'prompt_tokens': int(usage.get('promptTokenCount') or 0),
+            'output_tokens': int(usage.get('candidatesTokenCount') or 0),
+            'latency_ms': int(latency * 1000),
+            'retries': retries
+        }
+        with self._lock:
+            self._recent.append(row)
+            self._writes += 1
+            prune = self._writes % 1000 == 0
+
+        if self.store is None:
+            return
+        try:
+            connection = self.store.connection()
+            connection.execute(
+                f"INSERT INTO ai_calls ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                tuple(row.values())
+            )
+            if prune:
+                connection.execute('DELETE FROM ai_calls WHERE created_at < ?', (row['created_at'] - self.retention_seconds,))
+        except Exception as e:
+            print(f"⚠️ AI usage record failed: {e}")
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._recent)[-limit:]
+
+    def tokens_per_question(self, subject: str, difficulty: str, since_seconds: float = 7 * 86400,
+                            overhead_tokens: int = 0) -> Tuple[Optional[float], int]:
+        """Mean output tokens per question of complete upstream answers, and the number of calls it covers
+
+        `overhead_tokens` is taken off every call first, for the wrapper around its questions.
+        """
+        if self.store is None:
+            return None, 0
+        upstream = ', '.join(repr(kind) for kind in UPSTREAM_KINDS)
+        calls, output_tokens, yielded = self.store.connection().execute(f'''
+            SELECT COUNT(*), SUM(output_tokens), SUM(yielded) FROM ai_calls
+            WHERE subject = ? AND LOWER(difficulty) = ? AND outcome = 'success' AND kind IN ({upstream})
+              AND output_tokens > 0 AND created_at >= ?
+        ''', (subject, difficulty, self.clock() - since_seconds)).fetchone()
+        if not yielded:
+            return None, calls
+        return max(output_tokens - calls * overhead_tokens, 0) / yielded, calls
+
+    def summary(self, since_seconds: Optional[float] = 86400, group_by: Sequence[str] = ('subject', 'topic', 'difficulty')) -> List[Dict[str, Any]]:
+        """Totals per group over the last `since_seconds` (all retained rows when None)"""
+        group_by = [column for column in group_by if column in GROUP_COLUMNS]
+        if self.store is None:
+            return []
+
+        where, params = '', ()
+        if since_seconds:
+            where, params = 'WHERE created_at >= ?', (self.clock() - since_seconds,)
+        upstream = f"kind IN ({', '.join(repr(kind) for kind in UPSTREAM_KINDS)})"
+        select_groups = ''.join(f'{column}, ' for column in group_by)
+        group_clause = f"GROUP BY {', '.join(group_by)}" if group_by else ''
+
+        connection = self.store.connection()
+        rows = connection.execute(f'''
+            SELECT {select_groups}
+                   COUNT(*), SUM({upstream}),
+                   SUM(requested), SUM(yielded),
+                   SUM(prompt_tokens), SUM(output_tokens),
+                   AVG(CASE WHEN {upstream} THEN latency_ms END),
+                   MAX(CASE WHEN {upstream} THEN latency_ms END),
+                   SUM(retries)
+            FROM ai_calls {where} {group_clause}
+        ''', params).fetchall()
+        outcome_rows = connection.execute(f'''
+            SELECT {select_groups} outcome, COUNT(*)
+            FROM ai_calls {where}
+            GROUP BY {select_groups} outcome
+        ''', params).fetchall()
+
+        outcomes = {}
+        for row in outcome_rows:
+            outcomes.setdefault(tuple(row[:len(group_by)]), {})[row[-2]] = row[-1]
+
+        groups = []
+        for row in rows:
+            key = tuple(row[:len(group_by)])
+            calls, upstream_calls, requested, yielded, prompt_tokens, output_tokens, avg_latency, max_latency, retries = row[len(group_by):]
+            if not calls:
+                continue
+            groups.append(dict(
+                zip(group_by, key),
+                calls=calls,
+                upstream_calls=upstream_calls or 0,
+                questions_requested=requested or 0,
+                questions_yielded=yielded or 0,
+                yield_rate=round((yielded or 0) / requested, 3) if requested else None,
+                prompt_tokens=prompt_tokens or 0,
+                output_tokens=output_tokens or 0,
+                output_tokens_per_question=round(output_tokens / yielded, 1) if yielded else None,
+                avg_latency_ms=round(avg_latency) if avg_latency is not None else None,
+                max_latency_ms=max_latency,
+                retries=retries or 0,
+                outcomes=outcomes.get(key, {})
+            ))
+        groups.sort(key=lambda group: group['calls'], reverse=True)
+        return groups
+
+ai_usage = AIUsageLedger(
+    disk_path=current_config.AI_RUNTIME_DB_PATH,
+    retention_days=current_config.AI_USAGE_RETENTION_DAYS,
+    recent_size=current_config.AI_USAGE_RECENT_CALLS,
+    enabled=current_config.AI_USAGE_ENABLED
+)
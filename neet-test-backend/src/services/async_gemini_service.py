@@ -0,0 +1,421 @@
+"""
+Asyncio implementation of the Gemini generation client.
+
+The threaded GeminiService holds a Flask worker thread for the whole upstream
+call. This variant runs every call on one background event loop with aiohttp,
+so a process can keep dozens of generations in flight without a thread per
+call; a semaphore bounds how many run at once. Flask code keeps using the same
+synchronous interface through a small adapter: each call is submitted to the
+loop and the caller waits for it, and abandoning a call (timeout, closed
+stream after a client disconnect) cancels it on the loop.
+"""
+import asyncio
+import functools
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from queue import Queue, Empty
+from typing import List, Dict, Any, Optional, Tuple, Iterator, AsyncIterator
+
+import aiohttp
+
+from config.settings import current_config
+from services.gemini_service_new import GeminiService
+from services.http_client import RETRY_STATUS_CODES
+from services.question_parser import IncrementalQuestionParser
+from utils.helpers import normalize_question_text
+
+class EventLoopThread:
+    """A daemon thread running one asyncio loop that synchronous code submits work to"""
+
+    def __init__(self, name: str = 'ai-event-loop'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """Run a coroutine on the loop and wait for its result
+
+        If the wait ends early (timeout, KeyboardInterrupt, ...) the coroutine
+        is cancelled instead of being left running on the loop.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen: AsyncIterator, stall_timeout: Optional[float] = None) -> Iterator:
+        """Consume an async generator from synchronous code
+
+        Closing the returned generator cancels the async one on the loop.
+        """
+        items = Queue()
+        finished = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            finally:
+                items.put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=stall_timeout)
+                except Empty:
+                    print("⚠️ Async generation stalled - abandoning it")
+                    return
+                if item is finished:
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+class AsyncTransport:
+    """aiohttp session and concurrency limit shared by every AsyncGeminiService in the process"""
+
+    def __init__(self, max_concurrency: int, pool_size: int, connect_timeout: float, read_timeout: float,
+                 max_retries: int, backoff_factor: float, backoff_max: float = 8.0):
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+
+        self.runner = EventLoopThread()
+        # Created on the loop the first time they are needed
+        self._session = None
+        self._semaphore = None
+
+        self._counters = {
+            'calls': 0,
+            'retries': 0,
+            'errors': 0,
+            'cancelled': 0,
+            'in_flight': 0,
+            'waiting': 0,
+            'peak_in_flight': 0
+        }
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+            )
+        return self._session
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one of the max_concurrency upstream call slots"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        counters = self._counters
+        counters['waiting'] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            counters['waiting'] -= 1
+
+        counters['calls'] += 1
+        counters['in_flight'] += 1
+        counters['peak_in_flight'] = max(counters['peak_in_flight'], counters['in_flight'])
+        try:
+            yield
+        except asyncio.CancelledError:
+            counters['cancelled'] += 1
+            raise
+        finally:
+            counters['in_flight'] -= 1
+            self._semaphore.release()
+
+    async def post_json(self, url: str, headers: Dict[str, str], body: Dict[str, Any]) -> Tuple[int, Optional[Dict[str, Any]], int]:
+        """POST and decode the JSON reply, retrying connection errors, 429 and 5xx with backoff
+
+        Returns (status, decoded body or None on an error status, retries).
+        """
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                async with self.slot():
+                    async with self.session().post(url, headers=headers, json=body) as response:
+                        if response.status not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                            if response.status >= 400:
+                                self._counters['errors'] += 1
+                                return response.status, None, attempt
+                            return response.status, await response.json(content_type=None), attempt
+                        print(f"⚠️ HTTP {response.status} from upstream, retrying ({attempt + 1}/{self.max_retries})")
+                        retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    self._counters['errors'] += 1
+                    raise
+                print(f"⚠️ HTTP request failed ({e.__class__.__name__}), retrying ({attempt + 1}/{self.max_retries})")
+
+            attempt += 1
+            self._counters['retries'] += 1
+            # The slot is released while backing off
+            await asyncio.sleep(self._backoff_delay(attempt - 1, retry_after))
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self._counters, max_concurrency=self.max_concurrency)
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_async_transport(create: bool = True) -> Optional[AsyncTransport]:
+    """Process-wide async transport; with create=False returns None until something has used it"""
+    global _transport
+    if _transport is None and create:
+        with _transport_lock:
+            if _transport is None:
+                _transport = AsyncTransport(
+                    max_concurrency=current_config.AI_ASYNC_MAX_CONCURRENCY,
+                    pool_size=current_config.AI_HTTP_POOL_SIZE,
+                    connect_timeout=current_config.AI_HTTP_CONNECT_TIMEOUT,
+                    read_timeout=current_config.AI_HTTP_READ_TIMEOUT,
+                    max_retries=current_config.AI_HTTP_MAX_RETRIES,
+                    backoff_factor=current_config.AI_HTTP_BACKOFF_FACTOR
+                )
+    return _transport
+
+class AsyncGeminiService(GeminiService):
+    """GeminiService whose upstream calls run concurrently on the shared event loop
+
+    The synchronous methods are the adapter QuestionService talks to; the
+    coroutine versions (agenerate_neet_questions, astream_neet_questions) can
+    be awaited directly from async code. Cache, breaker, chunk planning and
+    salvage steps are GeminiService's own; only the transport differs. Their
+    SQLite bookkeeping (cache, quota, usage ledger) runs off the loop.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.transport = get_async_transport()
+
+    def generate_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium", fallback: bool = True, use_cache: bool = True, topic_mix: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        return self.transport.runner.run(
+            self.agenerate_neet_questions(subject, topic, count, difficulty, fallback, use_cache, topic_mix)
+        )
+
+    def stream_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium", use_cache: bool = True, topic_mix: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+        return self.transport.runner.iterate(
+            self.astream_neet_questions(subject, topic, count, difficulty, use_cache, topic_mix),
+            stall_timeout=self.transport.read_timeout
+        )
+
+    def _record(self, *args, **kwargs):
+        """Usage ledger writes go to SQLite; off the loop, without waiting for them"""
+        self._off_loop(self.usage.record, *args, **kwargs)
+
+    def _settle(self, estimated_tokens: int, usage: Optional[Dict[str, Any]]):
+        self._off_loop(super()._settle, estimated_tokens, usage)
+
+    def _off_loop(self, function, *args, **kwargs):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:  # Called from a worker thread, which may block
+            function(*args, **kwargs)
+            return
+        loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+    async def agenerate_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium", fallback: bool = True, use_cache: bool = True, topic_mix: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Coroutine version of generate_neet_questions; chunks run concurrently on the loop"""
+        cache_key = self.cache.make_key(self._create_neet_prompt(subject, topic, count, difficulty, topic_mix=topic_mix))
+        # The disk tier of the cache is SQLite, so lookups and stores run in a worker thread
+        cached = await asyncio.to_thread(self._cached, cache_key, subject, topic, difficulty, count) if use_cache else None
+        if cached:
+            return cached
+
+        if self._circuit_open(subject, topic, difficulty, count):
+            return self._fallback(subject, topic, count, difficulty) if fallback else []
+
+        chunks = self._chunk_plan(count, subject, difficulty, topic_mix)
+        if len(chunks) == 1:
+            questions = await self._agenerate_chunk(subject, topic, count, difficulty, topic_mix=topic_mix)
+        else:
+            print(f"🔀 Splitting {count} questions into {len(chunks)} concurrent chunks: {[size for size, _, _ in chunks]}")
+            results = await asyncio.gather(*[
+                self._agenerate_chunk(subject, topic, size, difficulty, batch, mix)
+                for size, batch, mix in chunks
+            ])
+            questions = self._merge_unique(results)
+
+        return await asyncio.to_thread(self._finish, questions, cache_key, subject, topic, count, difficulty, fallback)
+
+    async def _agenerate_chunk(self, subject: str, topic: Optional[str], count: int, difficulty: str, batch: Optional[Tuple[int, int]] = None, topic_mix: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Generate one chunk, re-requesting only the questions a short answer left out"""
+        questions = await self._arequest_chunk(subject, topic, count, difficulty, batch, topic_mix)
+
+        for _ in range(self.salvage_followups):
+            followup = self._followup(questions, count, topic_mix)
+            if followup is None:
+                break
+            missing, missing_mix = followup
+            extra = await self._arequest_chunk(subject, topic, missing, difficulty, batch, missing_mix, kind='followup')
+            questions = self._merge_unique([questions, extra])
+
+        return questions
+
+    async def _arequest_chunk(self, subject: str, topic: Optional[str], count: int, difficulty: str, batch: Optional[Tuple[int, int]] = None, topic_mix: Optional[Dict[str, int]] = None, kind: str = 'generate') -> List[Dict[str, Any]]:
+        """Run a single generateContent request; returns [] on any failure"""
+        prompt = self._create_neet_prompt(subject, topic, count, difficulty, batch, topic_mix)
+        budget = self.token_budget.budget(subject, difficulty, count)
+        estimated_tokens = self._estimate_tokens(prompt, count, subject, difficulty)
+        job = await self.scheduler.acquire_async(estimated_tokens)
+        if not job.granted:
+            self._not_sent(kind, job.state, subject, topic, difficulty, count)
+            return []
+        if not await self.quota.acquire_async(estimated_tokens):
+            self.scheduler.release(job)
+            self._not_sent(kind, 'quota_timeout', subject, topic, difficulty, count)
+            return []
+        started = time.monotonic()
+        outcome, questions, usage, retries = 'error', [], None, 0
+
+        try:
+            status, result, retries = await self.transport.post_json(self.url, self.headers, self._build_request_body(prompt, budget))
+            if result is None:
+                print(f"Gemini API returned HTTP {status}")
+                outcome = 'http_error'
+                self.breaker.record_failure(time.monotonic() - started)
+                return []
+            usage = result.get('usageMetadata')
+            self._settle(estimated_tokens, usage)
+
+            outcome = 'parse_error'
+            questions = self._extract_questions(result)
+            self.token_budget.observe(subject, difficulty, len(questions), (usage or {}).get('candidatesTokenCount'), budget)
+            outcome = self._judge(len(questions), count, started)
+            return questions
+
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            self.breaker.release_trial()
+            raise
+        except Exception as e:
+            print(f"Gemini API error: {e}")
+            self.breaker.record_failure(time.monotonic() - started)
+            return []
+        finally:
+            self.scheduler.release(job)
+            self._record(kind, outcome, subject, topic, difficulty, count, len(questions), usage, time.monotonic() - started, retries)
+
+    async def astream_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium", use_cache: bool = True, topic_mix: Optional[Dict[str, int]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Coroutine version of stream_neet_questions"""
+        cache_key = self.cache.make_key(self._create_neet_prompt(subject, topic, count, difficulty, topic_mix=topic_mix))
+        cached = await asyncio.to_thread(self._cached, cache_key, subject, topic, difficulty, count) if use_cache else None
+        if cached:
+            for question in cached:
+                yield question
+            return
+
+        if self._circuit_open(subject, topic, difficulty, count):
+            return
+
+        events = asyncio.Queue()
+        tasks = [
+            asyncio.ensure_future(self._astream_chunk(subject, topic, size, difficulty, batch, events, mix))
+            for size, batch, mix in self._chunk_plan(count, subject, difficulty, topic_mix)
+        ]
+
+        seen = set()
+        streamed = []
+        running = len(tasks)
+        try:
+            while running and len(streamed) < count:
+                try:
+                    question = await asyncio.wait_for(events.get(), timeout=self.transport.read_timeout)
+                except asyncio.TimeoutError:
+                    print("⚠️ Gemini stream stalled - giving up on remaining chunks")
+                    break
+
+                if question is None:  # A chunk finished
+                    running -= 1
+                    continue
+
+                fingerprint = normalize_question_text(question.get('question_text'))
+                if not fingerprint or fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                streamed.append(question)
+                yield question
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if len(streamed) == count:
+            await asyncio.to_thread(self.cache.set, cache_key, streamed)
+
+    async def _astream_chunk(self, subject: str, topic: Optional[str], count: int, difficulty: str, batch: Optional[Tuple[int, int]], events: asyncio.Queue, topic_mix: Optional[Dict[str, int]] = None):
+        """Stream one chunk, putting each completed question on `events` and None when done"""
+        prompt = self._create_neet_prompt(subject, topic, count, difficulty, batch, topic_mix)
+        parser = IncrementalQuestionParser()
+        produced = 0
+
+        budget = self.token_budget.budget(subject, difficulty, count)
+        estimated_tokens = self._estimate_tokens(prompt, count, subject, difficulty)
+        job = await self.scheduler.acquire_async(estimated_tokens)
+        if not job.granted:
+            self._not_sent('stream', job.state, subject, topic, difficulty, count)
+            events.put_nowait(None)
+            return
+        if not await self.quota.acquire_async(estimated_tokens):
+            self.scheduler.release(job)
+            self._not_sent('stream', 'quota_timeout', subject, topic, difficulty, count)
+            events.put_nowait(None)
+            return
+        started = time.monotonic()
+        outcome, usage = 'error', None
+
+        try:
+            async with self.transport.slot():
+                async with self.transport.session().post(self.stream_url, headers=self.headers, json=self._build_request_body(prompt, budget)) as response:
+                    if response.status >= 400:
+                        print(f"Gemini streaming API returned HTTP {response.status}")
+                        outcome = 'http_error'
+                        self.breaker.record_failure(time.monotonic() - started)
+                        return
+
+                    async for raw_line in response.content:
+                        text, usage = self._stream_event(raw_line.decode('utf-8').strip(), usage)
+                        for question in parser.feed(text):
+                            produced += 1
+                            events.put_nowait(question)
+
+            self.token_budget.observe(subject, difficulty, produced, (usage or {}).get('candidatesTokenCount'), budget)
+            outcome = self._judge(produced, count, started, "No questions in streamed response")
+
+        except asyncio.CancelledError:
+            outcome = 'cancelled'
+            # Questions that arrived before the client left still show the backend is up
+            if produced:
+                self.breaker.record_success(time.monotonic() - started)
+            else:
+                self.breaker.release_trial()
+            raise
+        except Exception as e:
+            print(f"Gemini streaming API error: {e}")
+            self.breaker.record_failure(time.monotonic() - started)
+        finally:
+            self.scheduler.release(job)
+            self._settle(estimated_tokens, usage)
+            self._record('stream', outcome, subject, topic, difficulty, count, produced, usage, time.monotonic() - started)
+            events.put_nowait(None)
@@ -0,0 +1,139 @@
+"""
+Circuit breaker for the AI backends.
+
+Tracks the outcome and latency of the most recent upstream calls. When too
+many of them fail or are too slow the breaker opens and callers fail fast
+(serving stored questions) instead of waiting out every failing request.
+After a cool-down a single trial call is let through; its outcome decides
+whether the breaker closes again or stays open. A trial that reports no
+outcome within open_seconds is presumed lost and another one is allowed.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, Any
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker is open"""
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, window_size: int = 20, min_calls: int = 5, failure_rate_threshold: float = 0.5,
+                 slow_call_seconds: float = 20.0, slow_call_rate_threshold: float = 0.8, open_seconds: float = 30.0,
+                 clock=time.monotonic):
+        self.name = name
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._calls = deque(maxlen=window_size)  # (succeeded, latency_seconds)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started_at = 0.0
+        self._times_opened = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected; does not start a trial call"""
+        with self._lock:
+            if self._state == self.OPEN:
+                return self.clock() - self._opened_at < self.open_seconds
+            return self._state == self.HALF_OPEN and self._trial_in_flight and not self._trial_expired()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go upstream now; moves OPEN to HALF_OPEN after the cool-down"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.OPEN and self.clock() - self._opened_at >= self.open_seconds:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+
+            if self._state == self.HALF_OPEN and (not self._trial_in_flight or self._trial_expired()):
+                self._trial_in_flight = True
+                self._trial_started_at = self.clock()
+                return True
+
+            self._rejected += 1
+            return False
+
+    def release_trial(self):
+        """Hand back a half-open trial whose call never reached upstream (no slot, no quota, cancelled)
+
+        The next call becomes the trial instead of waiting for the trial timeout.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self, latency: float):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if latency >= self.slow_call_seconds:
+                    self._open()
+                    return
+                self._state = self.CLOSED
+                self._trial_in_flight = False
+                self._calls.clear()
+            self._calls.append((True, latency))
+            self._evaluate()
+
+    def record_failure(self, latency: float):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            self._calls.append((False, latency))
+            self._evaluate()
+
+    def _trial_expired(self) -> bool:
+        return self.clock() - self._trial_started_at >= self.open_seconds
+
+    def _evaluate(self):
+        if self._state != self.CLOSED or len(self._calls) < self.min_calls:
+            return
+
+        total = len(self._calls)
+        failures = sum(1 for succeeded, _ in self._calls if not succeeded)
+        slow = sum(1 for _, latency in self._calls if latency >= self.slow_call_seconds)
+
+        if failures / total >= self.failure_rate_threshold or slow / total >= self.slow_call_rate_threshold:
+            self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._opened_at = self.clock()
+        self._trial_in_flight = False
+        self._times_opened += 1
+        print(f"🚨 Circuit breaker '{self.name}' opened - failing over to stored questions for {self.open_seconds}s")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = len(self._calls)
+            failures = sum(1 for succeeded, _ in self._calls if not succeeded)
+            latencies = sorted(latency for _, latency in self._calls)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'window_calls': total,
+                'failure_rate': round(failures / total, 3) if total else 0.0,
+                'p50_latency_seconds': round(latencies[len(latencies) // 2], 3) if latencies else None,
+                'max_latency_seconds': round(latencies[-1], 3) if latencies else None,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected
+            }
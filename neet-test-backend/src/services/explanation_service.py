@@ -0,0 +1,235 @@
+"""
+Deferred generation of question explanations.
+
+With GEMINI_DEFER_EXPLANATIONS tests are generated without explanations,
+which are most of the output tokens, so a test starts sooner. Explanations
+are written later and stored on the Question row: in the background at
+background priority for the questions a student got wrong or skipped (the
+ones they are likely to review), and on the first view of the results for
+whatever is still missing. Questions are explained in batches per subject,
+and a question being explained by one caller is waited for, not requested
+again, by others in the same process.
+
+A results view waits at most view_timeout for its explanations. They are
+written by a small pool of view workers, so the view can return on time
+with the rest marked pending while the worker stores the batch it is on;
+batches the worker has not started by the deadline go to the background
+writer instead.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from queue import Queue, Empty
+from typing import List, Dict, Any, Iterable, Optional
+
+from sqlalchemy import or_, func
+
+from config.settings import current_config
+from database.connection import db
+from models.question import Question
+from models.subject import Subject
+from services.quota_governor import quota_priority, BACKGROUND
+
+class ExplanationService:
+    def __init__(self, batch_size: int = 10, view_timeout: float = 20.0, view_workers: int = 4):
+        self.batch_size = batch_size
+        self.view_timeout = view_timeout              # Longest a results view waits for explanations
+        self.view_workers = view_workers
+        self.app = None
+        self.ai_service = None
+        self._executor = None
+        self._queue = Queue()
+        self._in_flight: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stats = {
+            'queued': 0,
+            'generated': 0,
+            'generated_on_view': 0,
+            'view_timeouts': 0,
+            'failed': 0
+        }
+
+    def init_app(self, app):
+        """Remember the Flask app so the background thread can open an app context"""
+        self.app = app
+
+    def bind_ai_service(self, ai_service):
+        """Use the given AI service to write explanations (first binding wins)"""
+        if self.ai_service is None:
+            self.ai_service = ai_service
+
+    @staticmethod
+    def is_missing(question: Question) -> bool:
+        return not (question.explanation or '').strip()
+
+    def request(self, question_ids: Iterable[int]):
+        """Explain these questions in the background if they have no explanation yet; never blocks"""
+        question_ids = [question_id for question_id in question_ids if question_id]
+        if not question_ids or self.app is None or self.ai_service is None:
+            return
+        with self._lock:
+            self._queue.put(question_ids)
+            self._stats['queued'] += len(question_ids)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='explanation-writer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                question_ids = self._queue.get(timeout=60)
+            except Empty:
+                continue
+            try:
+                with self.app.app_context(), quota_priority(BACKGROUND):
+                    self.explain(Question.query.filter(Question.id.in_(question_ids)).all())
+            except Exception as e:
+                print(f"⚠️ Background explanations failed: {e}")
+
+    def ensure(self, questions: List[Question]) -> int:
+        """Fill in missing explanations of questions a student is viewing; returns how many are still missing
+
+        Returns by the view timeout whether or not they are all written.
+        Without an app (so no worker thread can open a session) the batches
+        run in the caller's thread and the deadline is checked between them.
+        """
+        missing = [question for question in questions if self.is_missing(question)]
+        if not missing or self.ai_service is None:
+            return len(missing)
+        deadline = time.monotonic() + self.view_timeout
+        if self.app is None:
+            self._explain_on_view(missing, deadline)
+        else:
+            future = self._get_executor().submit(self._run_on_view, [question.id for question in missing], deadline)
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                with self._lock:
+                    self._stats['view_timeouts'] += 1
+                print(f"⏳ Explanations not ready after {self.view_timeout}s - returning them as pending")
+            for question in missing:
+                db.session.refresh(question)
+        return sum(1 for question in questions if self.is_missing(question))
+
+    def _run_on_view(self, question_ids: List[int], deadline: float):
+        with self.app.app_context():
+            try:
+                self._explain_on_view(Question.query.filter(Question.id.in_(question_ids)).all(), deadline)
+            finally:
+                db.session.remove()
+
+    def _explain_on_view(self, questions: List[Question], deadline: float):
+        written = self.explain(questions, deadline)
+        with self._lock:
+            self._stats['generated_on_view'] += written
+
+    def explain(self, questions: List[Question], deadline: Optional[float] = None) -> int:
+        """Generate and store explanations for questions without one; returns how many were written
+
+        With a `deadline` (time.monotonic()), batches not started by then are
+        handed to the background writer. Questions another caller is already
+        explaining are waited for (until the deadline, or up to the view
+        timeout) and picked up from the database afterwards.
+        """
+        claimed, waiting = self._claim([question for question in questions if self.is_missing(question)])
+        written = 0
+        late = []
+        try:
+            by_subject: Dict[int, List[Question]] = {}
+            for question in claimed:
+                by_subject.setdefault(question.subject_id, []).append(question)
+            for subject_id, subject_questions in by_subject.items():
+                subject = Subject.query.get(subject_id)
+                for start in range(0, len(subject_questions), self.batch_size):
+                    batch = subject_questions[start:start + self.batch_size]
+                    if deadline is not None and time.monotonic() >= deadline:
+                        late.extend(batch)
+                        continue
+                    written += self._explain_batch(subject.name if subject else 'General', batch)
+        finally:
+            self._release(claimed)
+        self.request(question.id for question in late)
+
+        if waiting:
+            deadline = deadline if deadline is not None else time.monotonic() + self.view_timeout
+            for question, event in waiting:
+                event.wait(max(0.0, deadline - time.monotonic()))
+                db.session.refresh(question)
+        return written
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.view_workers, thread_name_prefix='explanation-view')
+        return self._executor
+
+    def _claim(self, questions: List[Question]):
+        """Split questions into those this caller explains and (question, event) pairs being explained elsewhere"""
+        claimed, waiting = [], []
+        with self._lock:
+            for question in questions:
+                event = self._in_flight.get(question.id)
+                if event is None:
+                    self._in_flight[question.id] = threading.Event()
+                    claimed.append(question)
+                else:
+                    waiting.append((question, event))
+        return claimed, waiting
+
+    def _release(self, questions: List[Question]):
+        with self._lock:
+            for question in questions:
+                event = self._in_flight.pop(question.id, None)
+                if event is not None:
+                    event.set()
+
+    def _explain_batch(self, subject: str, questions: List[Question]) -> int:
+        explanations = self.ai_service.generate_explanations(subject, [
+            {
+                'id': question.id,
+                'question_text': question.question_text,
+                'option_a': question.option_a,
+                'option_b': question.option_b,
+                'option_c': question.option_c,
+                'option_d': question.option_d,
+                'correct_answer': question.correct_answer
+            }
+            for question in questions
+        ])
+
+        written = 0
+        try:
+            for question in questions:
+                text = explanations.get(question.id)
+                if not text:
+                    continue
+                # Another worker process may have written one meanwhile; keep the first
+                written += Question.query.filter(
+                    Question.id == question.id,
+                    or_(Question.explanation.is_(None), func.trim(Question.explanation) == '')
+                ).update({Question.explanation: text}, synchronize_session=False)
+            db.session.commit()
+            for question in questions:
+                db.session.refresh(question)
+        except Exception as e:
+            print(f"⚠️ Storing explanations failed: {e}")
+            db.session.rollback()
+            written = 0
+
+        with self._lock:
+            self._stats['generated'] += written
+            self._stats['failed'] += len(questions) - written
+        print(f"💡 Explained {written}/{len(questions)} {subject} questions")
+        return written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight), queue=self._queue.qsize())
+
+explanation_service = ExplanationService(
+    batch_size=current_config.EXPLANATION_BATCH_SIZE,
+    view_timeout=current_config.EXPLANATION_VIEW_TIMEOUT,
+    view_workers=current_config.EXPLANATION_VIEW_WORKERS
+)
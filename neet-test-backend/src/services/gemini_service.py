@@ -3,26 +3,30 @@ Google Gemini service for generating NEET questions
 """
 import os
 import json
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
-import google.generativeai as genai
 
 # Load environment variables
 load_dotenv()
 
 class GeminiService:
-    def __init__(self):
+    def __init__(self, model_name: str = 'gemini-pro'):
+        # Imported here so the SDK is only needed when this client is used
+        import google.generativeai as genai
+        
         self.api_key = os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("Missing Gemini API key. Check your .env file.")
         
+        self.name = 'gemini-sdk'
         # Configure Gemini with API Version
         genai.configure(
             api_key=self.api_key,
             client_options={"api_endpoint": "generativelanguage.googleapis.com"}
         )
         # Use the correct model
-        self.model = genai.GenerativeModel('gemini-pro')
+        self.model = genai.GenerativeModel(model_name)
     
     def generate_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium") -> List[Dict[str, Any]]:
         """Generate NEET questions using Google Gemini"""
@@ -89,6 +93,52 @@ class GeminiService:
             print(f"Gemini API error: {e}")
             return self._get_fallback_questions(subject, count, difficulty)
     
+    def generate_content(self, body: Dict[str, Any], cancelled: Optional[threading.Event] = None) -> Tuple[Dict[str, Any], int]:
+        """Answer a REST generateContent request body with the SDK, in the REST response shape
+        
+        Lets this client serve as a backend of the provider registry. The
+        answer is streamed and abandoned as soon as `cancelled` is set.
+        """
+        from services.ai_providers import GenerationCancelled
+        
+        prompt = ''.join(part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', []))
+        config = body.get('generationConfig', {})
+        response = self.model.generate_content(
+            prompt,
+            generation_config={
+                "temperature": config.get('temperature', 0.7),
+                "top_p": config.get('topP', 1),
+                "top_k": config.get('topK', 40),
+                "max_output_tokens": config.get('maxOutputTokens', 2048),
+            },
+            stream=True
+        )
+        
+        text, finish_reason, usage = [], None, None
+        for chunk in response:
+            if cancelled is not None and cancelled.is_set():
+                raise GenerationCancelled(self.name)
+            text.append(chunk.text)
+            if chunk.candidates and chunk.candidates[0].finish_reason:
+                finish_reason = chunk.candidates[0].finish_reason.name
+            metadata = getattr(chunk, 'usage_metadata', None)
+            if metadata:
+                usage = {
+                    'promptTokenCount': metadata.prompt_token_count,
+                    'candidatesTokenCount': metadata.candidates_token_count,
+                    'totalTokenCount': metadata.total_token_count
+                }
+        
+        result = {
+            'candidates': [{
+                'content': {'parts': [{'text': ''.join(text)}], 'role': 'model'},
+                'finishReason': finish_reason
+            }]
+        }
+        if usage:
+            result['usageMetadata'] = usage
+        return result, 0
+    
     def _create_neet_prompt(self, subject: str, topic: str, count: int, difficulty: str) -> str:
         """Create a detailed prompt for NEET question generation"""
         
@@ -3,87 +3,514 @@ Google Gemini service for generating NEET questions
 """
 import os
 import json
-import requests
-from typing import List, Dict, Any
+import math
+import contextvars
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from dotenv import load_dotenv
+from config.settings import current_config
+from services.http_client import get_http_client
+from services.generation_cache import generation_cache
+from services.circuit_breaker import CircuitBreaker
+from services.question_parser import IncrementalQuestionParser
+from services.topic_mix import split_counts, remaining_counts
+from services.quota_governor import quota_governor
+from services.ai_scheduler import ai_scheduler
+from services.ai_usage import ai_usage
+from services.ai_providers import ai_providers, ProviderError
+from services.token_budget import token_budget
+from utils.helpers import normalize_question_text
 
 # Load environment variables
 load_dotenv()
 
+# One breaker per process for the REST backend, shared by every service instance
+gemini_breaker = CircuitBreaker(
+    'gemini-rest',
+    window_size=current_config.AI_BREAKER_WINDOW,
+    min_calls=current_config.AI_BREAKER_MIN_CALLS,
+    failure_rate_threshold=current_config.AI_BREAKER_FAILURE_RATE,
+    slow_call_seconds=current_config.AI_BREAKER_SLOW_CALL_SECONDS,
+    slow_call_rate_threshold=current_config.AI_BREAKER_SLOW_CALL_RATE,
+    open_seconds=current_config.AI_BREAKER_OPEN_SECONDS
+)
+
+# Shared pool for fanning out chunk requests of large generations
+_chunk_executor = ThreadPoolExecutor(
+    max_workers=current_config.GEMINI_MAX_PARALLEL_CHUNKS,
+    thread_name_prefix='gemini-chunk'
+)
+
 class GeminiService:
     def __init__(self):
         self.api_key = os.getenv('GEMINI_API_KEY')
         if not self.api_key:
             raise ValueError("Missing Gemini API key. Check your .env file.")
         
-        # Set up Gemini API endpoint
-        self.url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
+        # Set up Gemini API endpoints (regular and server-sent-events streaming)
+        model_url = f"{current_config.GEMINI_API_BASE_URL}/v1beta/models/{current_config.GEMINI_MODEL}"
+        self.url = f"{model_url}:generateContent?key={self.api_key}"
+        self.stream_url = f"{model_url}:streamGenerateContent?alt=sse&key={self.api_key}"
         self.headers = {
             "Content-Type": "application/json"
         }
+        # Shared keep-alive connection pool with timeouts and retries
+        self.http = get_http_client()
+        self.cache = generation_cache
+        self.breaker = gemini_breaker
+        self.quota = quota_governor
+        # Per-process queue that orders upstream requests by priority class
+        self.scheduler = ai_scheduler
+        self.usage = ai_usage
+        # generateContent backends; slow requests are hedged across them
+        self.providers = ai_providers
+        
+        # Output-token budget per request and how many questions fit into it, learned per subject and difficulty
+        self.token_budget = token_budget
+        # Follow-up requests for questions missing from a truncated answer
+        self.salvage_followups = current_config.GEMINI_SALVAGE_FOLLOWUPS
+        # Two-phase mode: questions come without explanations, which generate_explanations writes later
+        self.defer_explanations = current_config.GEMINI_DEFER_EXPLANATIONS
+        self.explanation_tokens = current_config.EXPLANATION_TOKENS
+    
+    def generate_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium", fallback: bool = True, use_cache: bool = True, topic_mix: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Generate NEET questions using Google Gemini
+
+        Identical requests are answered from the prompt-keyed generation cache
+        unless use_cache=False (fresh tests, inventory refills).
+
+        Requests larger than one output-token budget are split into chunks that
+        run in parallel and are merged with duplicates removed.
+
+        With fallback=False an empty list is returned on failure instead of the
+        canned fallback questions, so callers that store questions never keep them.
+
+        topic_mix ({topic name: count}, summing to count) asks for a mixed test
+        in one request; each question's "topic" names one of the mix topics.
+        """
+        cache_key = self.cache.make_key(self._create_neet_prompt(subject, topic, count, difficulty, topic_mix=topic_mix))
+        cached = self._cached(cache_key, subject, topic, difficulty, count) if use_cache else None
+        if cached:
+            return cached
+        
+        if self._circuit_open(subject, topic, difficulty, count):
+            return self._fallback(subject, topic, count, difficulty) if fallback else []
+        
+        chunks = self._chunk_plan(count, subject, difficulty, topic_mix)
+        if len(chunks) == 1:
+            questions = self._generate_chunk(subject, topic, count, difficulty, topic_mix=topic_mix)
+        else:
+            print(f"🔀 Splitting {count} questions into {len(chunks)} parallel chunks: {[size for size, _, _ in chunks]}")
+            futures = [
+                # copy_context carries the caller's quota priority into the pool thread
+                _chunk_executor.submit(contextvars.copy_context().run, self._generate_chunk, subject, topic, size, difficulty, batch, mix)
+                for size, batch, mix in chunks
+            ]
+            questions = self._merge_unique([future.result() for future in futures])
+        
+        return self._finish(questions, cache_key, subject, topic, count, difficulty, fallback)
+    
+    # Steps shared with AsyncGeminiService, which runs the same orchestration on its event loop
+    
+    def _record(self, *args, **kwargs):
+        """Write one usage ledger row (AsyncGeminiService moves the write off the loop)"""
+        self.usage.record(*args, **kwargs)
+    
+    def _settle(self, estimated_tokens: int, usage: Optional[Dict[str, Any]]):
+        """Correct the quota reservation with the token count the response reported"""
+        self.quota.settle(estimated_tokens, (usage or {}).get('totalTokenCount'))
+    
+    def _not_sent(self, kind: str, outcome: str, subject: str, topic: Optional[str], difficulty: Optional[str], count: int):
+        """Record a call that never went upstream and hand back the breaker's trial if it held it"""
+        self.breaker.release_trial()
+        self._record(kind, outcome, subject, topic, difficulty, count)
+    
+    def _cached(self, cache_key: str, subject: str, topic: Optional[str], difficulty: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """The cached batch for this prompt, or None on a miss"""
+        cached = self.cache.get(cache_key)
+        if cached:
+            print(f"⚡ Generation cache hit for {subject}/{topic or 'General'} ({len(cached)} questions)")
+            self._record('cache', 'cache_hit', subject, topic, difficulty, count, len(cached))
+        return cached
+    
+    def _circuit_open(self, subject: str, topic: Optional[str], difficulty: Optional[str], count: int, what: str = 'API call') -> bool:
+        """Fail fast while the backend is known to be failing; True when the call must be skipped"""
+        if self.breaker.allow_request():
+            return False
+        print(f"🚨 Gemini circuit open - skipping {what}")
+        self._record('skipped', 'circuit_open', subject, topic, difficulty, count)
+        return True
+    
+    def _chunk_plan(self, count: int, subject: str, difficulty: str, topic_mix: Optional[Dict[str, int]]) -> List[Tuple[int, Optional[Tuple[int, int]], Optional[Dict[str, int]]]]:
+        """(size, batch, topic mix) of each chunk; batch is None when one chunk covers the request"""
+        sizes = self._plan_chunks(count, subject, difficulty)
+        mixes = split_counts(topic_mix, sizes) if topic_mix else [None] * len(sizes)
+        return [(size, (index, len(sizes)) if len(sizes) > 1 else None, mixes[index]) for index, size in enumerate(sizes)]
+    
+    def _finish(self, questions: List[Dict[str, Any]], cache_key: str, subject: str, topic: Optional[str], count: int, difficulty: str, fallback: bool) -> List[Dict[str, Any]]:
+        """Trim merged chunk results to `count` and cache them, or fall back when there are none"""
+        if not questions:
+            return self._fallback(subject, topic, count, difficulty) if fallback else []
+        
+        questions = questions[:count]
+        # A short batch would make every later identical request short too
+        if len(questions) == count:
+            self.cache.set(cache_key, questions)
+        return questions
+    
+    def _followup(self, questions: List[Dict[str, Any]], count: int, topic_mix: Optional[Dict[str, int]]) -> Optional[Tuple[int, Optional[Dict[str, int]]]]:
+        """How many questions a short chunk re-requests, and their topic mix; None unless it came back short"""
+        if not 0 < len(questions) < count:
+            return None
+        missing = count - len(questions)
+        print(f"🩹 Salvaged {len(questions)}/{count} questions - re-requesting the {missing} missing")
+        return missing, remaining_counts(topic_mix, questions, missing) if topic_mix else None
+    
+    def _judge(self, produced: int, count: int, started: float, empty_message: str = "No questions in response") -> str:
+        """Report a parsed answer to the breaker and return its usage outcome"""
+        if not produced:
+            print(empty_message)
+            self.breaker.record_failure(time.monotonic() - started)
+            return 'parse_error'
+        self.breaker.record_success(time.monotonic() - started)
+        return 'success' if produced >= count else 'partial'
     
-    def generate_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium") -> List[Dict[str, Any]]:
-        """Generate NEET questions using Google Gemini"""
+    def _fallback(self, subject: str, topic: Optional[str], count: int, difficulty: str) -> List[Dict[str, Any]]:
+        questions = self._get_fallback_questions(subject, count, difficulty)
+        self._record('fallback', 'fallback', subject, topic, difficulty, count, len(questions))
+        return questions
+    
+    def _plan_chunks(self, count: int, subject: Optional[str] = None, difficulty: Optional[str] = None) -> List[int]:
+        """Split `count` into near-equal chunks that each fit the output token budget"""
+        per_chunk = self.token_budget.chunk_capacity(subject, difficulty)
+        chunks = max(1, math.ceil(count / per_chunk))
+        base, extra = divmod(count, chunks)
+        return [base + 1 if i < extra else base for i in range(chunks)]
+    
+    def _merge_unique(self, chunk_results: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Merge chunk results, dropping questions whose normalized text repeats"""
+        seen = set()
+        merged = []
+        for questions in chunk_results:
+            for question in questions:
+                fingerprint = normalize_question_text(question.get('question_text'))
+                if not fingerprint or fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                merged.append(question)
+        return merged
+    
+    def _generate_chunk(self, subject: str, topic: Optional[str], count: int, difficulty: str, batch: Optional[Tuple[int, int]] = None, topic_mix: Optional[Dict[str, int]] = None) -> List[Dict[str, Any]]:
+        """Generate one chunk, re-requesting only the questions a short answer left out"""
+        questions = self._request_chunk(subject, topic, count, difficulty, batch, topic_mix)
+        
+        for _ in range(self.salvage_followups):
+            followup = self._followup(questions, count, topic_mix)
+            if followup is None:
+                break
+            missing, missing_mix = followup
+            extra = self._request_chunk(subject, topic, missing, difficulty, batch, missing_mix, kind='followup')
+            questions = self._merge_unique([questions, extra])
+        
+        return questions
+    
+    def _request_chunk(self, subject: str, topic: Optional[str], count: int, difficulty: str, batch: Optional[Tuple[int, int]] = None, topic_mix: Optional[Dict[str, int]] = None, kind: str = 'generate') -> List[Dict[str, Any]]:
+        """Run a single generateContent request; returns [] on any failure
+        
+        Every request is recorded in the usage ledger under `kind`
+        ('generate', or 'followup' for salvage re-requests).
+        """
         
         # Create the prompt based on subject and parameters
-        prompt = self._create_neet_prompt(subject, topic, count, difficulty)
+        prompt = self._create_neet_prompt(subject, topic, count, difficulty, batch, topic_mix)
+        
+        # Wait for a scheduler slot, then room in the host-wide API quota; callers serve stored questions if either never comes
+        budget = self.token_budget.budget(subject, difficulty, count)
+        estimated_tokens = self._estimate_tokens(prompt, count, subject, difficulty)
+        job = self.scheduler.acquire(estimated_tokens)
+        if not job.granted:
+            self._not_sent(kind, job.state, subject, topic, difficulty, count)
+            return []
+        if not self.quota.acquire(estimated_tokens):
+            self.scheduler.release(job)
+            self._not_sent(kind, 'quota_timeout', subject, topic, difficulty, count)
+            return []
+        started = time.monotonic()
+        outcome, questions, usage, retries = 'error', [], None, 0
         
         try:
-            data = {
-                "contents": [
-                    {
-                        "parts": [
-                            {
-                                "text": prompt
-                            }
-                        ]
-                    }
-                ],
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "maxOutputTokens": 2048,
-                    "topP": 1,
-                    "topK": 40
-                }
-            }
+            data = self._build_request_body(prompt, budget)
 
-            response = requests.post(self.url, headers=self.headers, json=data)
-            result = response.json()
-            print("Raw Gemini API Response:", result)
+            try:
+                result, retries, _ = self.providers.generate_content(data, estimated_tokens)
+            except ProviderError as e:
+                print(f"Gemini API ({e.provider}) returned HTTP {e.status} after {e.retries} retries")
+                outcome, retries = 'http_error', e.retries
+                self.breaker.record_failure(time.monotonic() - started)
+                return []
+            usage = result.get('usageMetadata')
+            self._settle(estimated_tokens, usage)
 
+            outcome = 'parse_error'
+            questions = self._extract_questions(result)
+            self.token_budget.observe(subject, difficulty, len(questions), (usage or {}).get('candidatesTokenCount'), budget)
+            outcome = self._judge(len(questions), count, started)
+            return questions
+            
+        except Exception as e:
+            print(f"Gemini API error: {e}")
+            self.breaker.record_failure(time.monotonic() - started)
+            return []
+        finally:
+            self.scheduler.release(job)
+            self._record(kind, outcome, subject, topic, difficulty, count, len(questions), usage, time.monotonic() - started, retries)
+    
+    def generate_explanations(self, subject: str, questions: List[Dict[str, Any]]) -> Dict[int, str]:
+        """Explanations for questions that were generated without one, keyed by question id
+
+        Each question has 'id', 'question_text', the four options and
+        'correct_answer'. Questions the answer left out are missing from the
+        result, which is empty when the backend is unavailable or fails.
+        """
+        if not questions:
+            return {}
+        if self._circuit_open(subject, None, None, len(questions), 'explanation request'):
+            return {}
+
+        prompt = self._create_explanation_prompt(subject, questions)
+        budget = min(self.token_budget.max_output_tokens, self.token_budget.overhead_tokens + len(questions) * self.explanation_tokens)
+        estimated_tokens = len(prompt) // 4 + budget // 2
+        job = self.scheduler.acquire(estimated_tokens)
+        if not job.granted:
+            self._not_sent('explain', job.state, subject, None, None, len(questions))
+            return {}
+        if not self.quota.acquire(estimated_tokens):
+            self.scheduler.release(job)
+            self._not_sent('explain', 'quota_timeout', subject, None, None, len(questions))
+            return {}
+        started = time.monotonic()
+        outcome, explanations, usage, retries = 'error', {}, None, 0
+
+        try:
             try:
-                # Extract text from response
-                content = result['candidates'][0]['content']['parts'][0]['text']
-                
-                # Extract JSON from markdown code block
-                if '```json' in content:
-                    json_str = content.split('```json')[1].split('```')[0].strip()
-                else:
-                    json_str = content.strip()
-                
-                print("Extracted JSON string:", json_str)
+                result, retries, _ = self.providers.generate_content(self._build_request_body(prompt, budget), estimated_tokens)
+            except ProviderError as e:
+                print(f"Gemini API ({e.provider}) returned HTTP {e.status} after {e.retries} retries")
+                outcome, retries = 'http_error', e.retries
+                self.breaker.record_failure(time.monotonic() - started)
+                return {}
+            usage = result.get('usageMetadata')
+            self._settle(estimated_tokens, usage)
+
+            ids = {str(question['id']): question['id'] for question in questions}
+            parser = IncrementalQuestionParser(array_key='explanations')
+            for item in parser.feed(result['candidates'][0]['content']['parts'][0]['text']):
+                question_id = ids.get(str(item.get('id')))
+                text = item.get('explanation')
+                if question_id is not None and isinstance(text, str) and text.strip():
+                    explanations[question_id] = text.strip()
+
+            if explanations:
+                outcome = 'success' if len(explanations) == len(questions) else 'partial'
+                self.breaker.record_success(time.monotonic() - started)
+            else:
+                print("No explanations in response")
+                outcome = 'parse_error'
+                self.breaker.record_failure(time.monotonic() - started)
+            return explanations
+
+        except Exception as e:
+            print(f"Gemini explanation error: {e}")
+            self.breaker.record_failure(time.monotonic() - started)
+            return {}
+        finally:
+            self.scheduler.release(job)
+            self._record('explain', outcome, subject, None, None, len(questions), len(explanations), usage, time.monotonic() - started, retries)
+
+    def _extract_questions(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Pull every complete question out of a generateContent response body
+        
+        Tolerates markdown fences and text around the JSON, and keeps the
+        complete questions of output cut off by maxOutputTokens.
+        """
+        # Extract text from response
+        content = result['candidates'][0]['content']['parts'][0]['text']
+        
+        parser = IncrementalQuestionParser()
+        questions = parser.feed(content)
+        if not parser.done:
+            finish_reason = result['candidates'][0].get('finishReason', 'unknown')
+            print(f"✂️ Incomplete Gemini output (finishReason={finish_reason}) - kept {len(questions)} complete questions")
+        return questions
+    
+    def stream_neet_questions(self, subject: str, topic: str = None, count: int = 5, difficulty: str = "medium", use_cache: bool = True, topic_mix: Optional[Dict[str, int]] = None) -> Iterator[Dict[str, Any]]:
+        """Yield NEET questions one at a time as Gemini streams them
+        
+        Chunks of a large request stream in parallel and every question is
+        yielded as soon as its JSON object is complete. Closing the generator
+        (e.g. the client disconnected) stops the upstream streams. Yields
+        nothing when the backend is unavailable.
+        """
+        cache_key = self.cache.make_key(self._create_neet_prompt(subject, topic, count, difficulty, topic_mix=topic_mix))
+        cached = self._cached(cache_key, subject, topic, difficulty, count) if use_cache else None
+        if cached:
+            yield from cached
+            return
+        
+        if self._circuit_open(subject, topic, difficulty, count):
+            return
+        
+        chunks = self._chunk_plan(count, subject, difficulty, topic_mix)
+        events = Queue()
+        cancelled = threading.Event()
+        for size, batch, mix in chunks:
+            _chunk_executor.submit(contextvars.copy_context().run, self._stream_chunk, subject, topic, size, difficulty, batch, events, cancelled, mix)
+        
+        seen = set()
+        streamed = []
+        running = len(chunks)
+        try:
+            while running and len(streamed) < count:
+                try:
+                    question = events.get(timeout=self.http.read_timeout)
+                except Empty:
+                    print("⚠️ Gemini stream stalled - giving up on remaining chunks")
+                    break
                 
-                # Parse JSON
-                questions_data = json.loads(json_str)
-                questions = questions_data.get('questions', [])
+                if question is None:  # A chunk finished
+                    running -= 1
+                    continue
                 
-                if not questions:
-                    print("No questions in response")
-                    return self._get_fallback_questions(subject, count, difficulty)
+                fingerprint = normalize_question_text(question.get('question_text'))
+                if not fingerprint or fingerprint in seen:
+                    continue
+                seen.add(fingerprint)
+                streamed.append(question)
+                yield question
+        finally:
+            cancelled.set()
+        
+        if len(streamed) == count:
+            self.cache.set(cache_key, streamed)
+    
+    def _stream_chunk(self, subject: str, topic: Optional[str], count: int, difficulty: str, batch: Optional[Tuple[int, int]], events: Queue, cancelled: threading.Event, topic_mix: Optional[Dict[str, int]] = None):
+        """Stream one chunk, putting each completed question on `events` and None when done"""
+        prompt = self._create_neet_prompt(subject, topic, count, difficulty, batch, topic_mix)
+        parser = IncrementalQuestionParser()
+        produced = 0
+        
+        budget = self.token_budget.budget(subject, difficulty, count)
+        estimated_tokens = self._estimate_tokens(prompt, count, subject, difficulty)
+        job = self.scheduler.acquire(estimated_tokens)
+        if not job.granted:
+            self._not_sent('stream', job.state, subject, topic, difficulty, count)
+            events.put(None)
+            return
+        if not self.quota.acquire(estimated_tokens):
+            self.scheduler.release(job)
+            self._not_sent('stream', 'quota_timeout', subject, topic, difficulty, count)
+            events.put(None)
+            return
+        started = time.monotonic()
+        outcome, usage, retries = 'error', None, 0
+        
+        try:
+            response = self.http.post(self.stream_url, headers=self.headers, json=self._build_request_body(prompt, budget), stream=True)
+            retries = response.retries
+            if not response.ok:
+                print(f"Gemini streaming API returned HTTP {response.status_code} after {response.retries} retries")
+                outcome = 'http_error'
+                self.breaker.record_failure(time.monotonic() - started)
+                return
+            
+            response.encoding = 'utf-8'
+            with response:
+                for line in response.iter_lines(chunk_size=256, decode_unicode=True):
+                    if cancelled.is_set():
+                        break
+                    text, usage = self._stream_event(line, usage)
+                    if not text:
+                        continue
                     
-                return questions
-            except Exception as e:
-                print(f"Error parsing response: {e}")
-                return self._get_fallback_questions(subject, count, difficulty)
+                    for question in parser.feed(text):
+                        produced += 1
+                        events.put(question)
             
+            if cancelled.is_set():
+                outcome = 'cancelled'
+                # Questions that arrived before the client left still show the backend is up
+                if produced:
+                    self.breaker.record_success(time.monotonic() - started)
+                else:
+                    self.breaker.release_trial()
+            else:
+                self.token_budget.observe(subject, difficulty, produced, (usage or {}).get('candidatesTokenCount'), budget)
+                outcome = self._judge(produced, count, started, "No questions in streamed response")
+        
         except Exception as e:
-            print(f"Gemini API error: {e}")
-            return self._get_fallback_questions(subject, count, difficulty)
+            print(f"Gemini streaming API error: {e}")
+            self.breaker.record_failure(time.monotonic() - started)
+        finally:
+            self.scheduler.release(job)
+            self._settle(estimated_tokens, usage)
+            self._record('stream', outcome, subject, topic, difficulty, count, produced, usage, time.monotonic() - started, retries)
+            events.put(None)
+    
+    def _stream_event(self, line: str, usage: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Model text carried by one server-sent-events line ('' for other lines), and the latest usageMetadata"""
+        if not line or not line.startswith('data:'):
+            return '', usage
+        event = json.loads(line[len('data:'):].strip())
+        parts = event.get('candidates', [{}])[0].get('content', {}).get('parts', [])
+        return ''.join(part.get('text', '') for part in parts), event.get('usageMetadata', usage)
+    
+    def _estimate_tokens(self, prompt: str, count: int, subject: Optional[str] = None, difficulty: Optional[str] = None) -> int:
+        """Rough prompt + output token count used to reserve quota before a call"""
+        return len(prompt) // 4 + self.token_budget.expected_tokens(subject, difficulty, count)
     
-    def _create_neet_prompt(self, subject: str, topic: str, count: int, difficulty: str) -> str:
+    def _build_request_body(self, prompt: str, max_output_tokens: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            "contents": [
+                {
+                    "parts": [
+                        {
+                            "text": prompt
+                        }
+                    ]
+                }
+            ],
+            "generationConfig": {
+                "temperature": 0.7,
+                "maxOutputTokens": max_output_tokens or self.token_budget.max_output_tokens,
+                "topP": 1,
+                "topK": 40
+            }
+        }
+    
+    def _create_neet_prompt(self, subject: str, topic: str, count: int, difficulty: str, batch: Optional[Tuple[int, int]] = None, topic_mix: Optional[Dict[str, int]] = None) -> str:
         """Create a detailed prompt for NEET question generation"""
         
         topic_filter = f" focusing specifically on {topic}" if topic else ""
+        topic_field = topic if topic else 'General'
+        
+        # Mixed tests: one request covering several topics with an exact allocation
+        mix_note = ""
+        if topic_mix:
+            topic_field = "[Exactly one topic name from the Topic Distribution]"
+            allocation = "\n".join(f"- {name}: {n}" for name, n in topic_mix.items())
+            mix_note = f"""
+Topic Distribution (generate exactly this many questions per topic and copy the topic name
+exactly into each question's "topic" field):
+{allocation}
+"""
+        
+        # Parallel chunks of one request get a batch hint so they spread over different concepts
+        batch_note = ""
+        if batch:
+            batch_note = f"\nThis is batch {batch[0] + 1} of {batch[1]} generated in parallel; choose concepts other batches are unlikely to pick.\n"
         
         # Define NEET-specific guidelines for each subject
         subject_guidelines = {
@@ -106,6 +533,14 @@ class GeminiService:
         
         guidelines = subject_guidelines.get(subject, subject_guidelines['Biology'])
         
+        # Explanations are most of the output; in two-phase mode they are written later, on demand
+        if self.defer_explanations:
+            explanation_rule = "No explanations - they are written separately"
+            explanation_field = ""
+        else:
+            explanation_rule = "Detailed explanations with reasoning"
+            explanation_field = '      "explanation": "[Detailed explanation with scientific reasoning, formulas if applicable, and why other options are incorrect]",\n'
+        
         prompt = f"""
 Generate {count} high-quality NEET {subject} multiple choice questions{topic_filter}.
 
@@ -130,7 +565,7 @@ Question Quality Requirements:
 1. Clear, unambiguous question stem
 2. Four distinct, plausible options
 3. Only one clearly correct answer
-4. Detailed explanations with reasoning
+4. {explanation_rule}
 5. Use standard scientific terminology
 6. Include units where applicable
 7. Avoid trivial or overly complex calculations
@@ -145,18 +580,45 @@ Response format (STRICT JSON - no additional text):
       "option_c": "[Third option - plausible distractor]",
       "option_d": "[Fourth option - plausible distractor]",
       "correct_answer": "[A/B/C/D]",
-      "explanation": "[Detailed explanation with scientific reasoning, formulas if applicable, and why other options are incorrect]",
-      "difficulty": "{difficulty}",
-      "topic": "{topic if topic else 'General'}"
+{explanation_field}      "difficulty": "{difficulty}",
+      "topic": "{topic_field}"
     }}
   ]
 }}
 
 Generate exactly {count} questions for {subject}{topic_filter}.
 Ensure variety in question types and concepts covered.
-"""
+{mix_note}{batch_note}"""
         return prompt
     
+    def _create_explanation_prompt(self, subject: str, questions: List[Dict[str, Any]]) -> str:
+        """Prompt asking for the explanations of questions whose answer key is known"""
+        blocks = "\n\n".join(
+            f"[id: {question['id']}] {question['question_text']}\n"
+            f"A) {question['option_a']}\nB) {question['option_b']}\nC) {question['option_c']}\nD) {question['option_d']}\n"
+            f"Correct answer: {question['correct_answer']}"
+            for question in questions
+        )
+        return f"""
+Explain the correct answer of each of these {len(questions)} NEET {subject} multiple choice questions
+for a student reviewing their test.
+
+For every question give a detailed explanation with scientific reasoning, formulas if applicable,
+and why the other options are incorrect. Do not change the correct answer.
+
+{blocks}
+
+Response format (STRICT JSON - no additional text):
+{{
+  "explanations": [
+    {{
+      "id": [the number in brackets before the question],
+      "explanation": "[Detailed explanation]"
+    }}
+  ]
+}}
+"""
+    
     def _get_fallback_questions(self, subject: str, count: int, difficulty: str) -> List[Dict[str, Any]]:
         """High-quality fallback questions if API fails"""
         fallback_questions = {
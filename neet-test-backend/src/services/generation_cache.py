@@ -0,0 +1,165 @@
+"""
+Prompt-keyed cache for generated question batches.
+
+Entries are keyed by a hash of the rendered prompt and live in two tiers: an
+in-process LRU for the hottest prompts and an on-disk SQLite tier shared by
+all workers on the host. Both tiers expire entries after a TTL.
+"""
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from config.settings import current_config
+from database.local_store import LocalStore
+
+CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS generation_cache (
+    cache_key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_generation_cache_expires_at ON generation_cache (expires_at);
+'''
+
+class GenerationCache:
+    def __init__(self, disk_path: Optional[str] = None, max_entries: int = 256, max_disk_entries: int = 5000,
+                 ttl_seconds: float = 3600, enabled: bool = True, clock=time.time):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.clock = clock
+        self.store = LocalStore(disk_path, CACHE_SCHEMA) if disk_path else None
+
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'writes': 0,
+            'evictions': 0,
+            'expired': 0
+        }
+
+    @staticmethod
+    def make_key(prompt: str) -> str:
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Return a private copy of the cached questions, or None on a miss"""
+        if not self.enabled:
+            return None
+
+        now = self.clock()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return copy.deepcopy(value)
+                del self._memory[key]
+                self._stats['expired'] += 1
+
+        value = self._disk_get(key, now)
+        if value is None:
+            self._count('misses')
+            return None
+
+        self._count('disk_hits')
+        self._memory_set(key, value[0], value[1])
+        return copy.deepcopy(value[1])
+
+    def set(self, key: str, questions: List[Dict[str, Any]]):
+        if not self.enabled or not questions:
+            return
+
+        expires_at = self.clock() + self.ttl_seconds
+        value = copy.deepcopy(questions)
+        self._memory_set(key, expires_at, value)
+        self._disk_set(key, expires_at, value)
+        self._count('writes')
+
+    def _memory_set(self, key: str, expires_at: float, value: List[Dict[str, Any]]):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def _disk_get(self, key: str, now: float):
+        if self.store is None:
+            return None
+        try:
+            row = self.store.connection().execute(
+                'SELECT value, expires_at FROM generation_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self.store.connection().execute('DELETE FROM generation_cache WHERE cache_key = ?', (key,))
+                self._count('expired')
+                return None
+            return row[1], json.loads(row[0])
+        except Exception as e:
+            print(f"⚠️ Generation cache disk read failed: {e}")
+            return None
+
+    def _disk_set(self, key: str, expires_at: float, value: List[Dict[str, Any]]):
+        if self.store is None:
+            return
+        try:
+            connection = self.store.connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO generation_cache (cache_key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            with self._lock:
+                self._writes += 1
+                purge = self._writes % 100 == 0
+            if purge:
+                self.purge_expired()
+        except Exception as e:
+            print(f"⚠️ Generation cache disk write failed: {e}")
+
+    def purge_expired(self):
+        """Drop expired disk entries and trim the disk tier to its size cap"""
+        if self.store is None:
+            return
+        connection = self.store.connection()
+        connection.execute('DELETE FROM generation_cache WHERE expires_at <= ?', (self.clock(),))
+        connection.execute(
+            'DELETE FROM generation_cache WHERE cache_key NOT IN '
+            '(SELECT cache_key FROM generation_cache ORDER BY expires_at DESC LIMIT ?)',
+            (self.max_disk_entries,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['memory_entries'] = len(self._memory)
+
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 3) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        stats['ttl_seconds'] = self.ttl_seconds
+        return stats
+
+generation_cache = GenerationCache(
+    disk_path=current_config.AI_RUNTIME_DB_PATH,
+    max_entries=current_config.GENERATION_CACHE_MAX_ENTRIES,
+    ttl_seconds=current_config.GENERATION_CACHE_TTL,
+    enabled=current_config.GENERATION_CACHE_ENABLED
+)
@@ -0,0 +1,155 @@
+"""
+Shared pooled HTTP client for the AI backends.
+
+One requests.Session per process keeps TCP+TLS connections alive between
+generation calls. Every request gets connect/read timeouts and is retried with
+exponential backoff on connection errors, 429 and 5xx responses.
+"""
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from config.settings import current_config
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new connection they open"""
+
+    def __init__(self, on_new_connection, **kwargs):
+        # Must be set before HTTPAdapter.__init__, which builds the pool manager
+        self._on_new_connection = on_new_connection
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        on_new_connection = self._on_new_connection
+
+        def counting(pool_class):
+            class CountingPool(pool_class):
+                def _new_conn(self):
+                    on_new_connection()
+                    return super()._new_conn()
+            return CountingPool
+
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': counting(HTTPConnectionPool),
+            'https': counting(HTTPSConnectionPool)
+        }
+
+class PooledHttpClient:
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 max_retries: int = 3, backoff_factor: float = 0.5, backoff_max: float = 8.0):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0,
+            'new_connections': 0,
+            'retries': 0,
+            'errors': 0
+        }
+
+        adapter = _CountingAdapter(
+            on_new_connection=lambda: self._count('new_connections'),
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=0  # Retries are handled here so they can be counted and backed off
+        )
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _backoff_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after:
+                try:
+                    return min(float(retry_after), self.backoff_max)
+                except ValueError:
+                    pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * (2 ** attempt)))
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST through the pool, retrying connection errors, 429 and 5xx responses
+
+        The returned response carries the number of retries it took in
+        `response.retries`.
+        """
+        kwargs.setdefault('timeout', (self.connect_timeout, self.read_timeout))
+
+        attempt = 0
+        while True:
+            self._count('requests')
+            try:
+                response = self.session.post(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._count('errors')
+                    raise
+                print(f"⚠️ HTTP request failed ({e.__class__.__name__}), retrying ({attempt + 1}/{self.max_retries})")
+                delay = self._backoff_delay(attempt)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    if response.status_code >= 400:
+                        self._count('errors')
+                    response.retries = attempt
+                    return response
+                print(f"⚠️ HTTP {response.status_code} from upstream, retrying ({attempt + 1}/{self.max_retries})")
+                delay = self._backoff_delay(attempt, response)
+                response.close()
+
+            attempt += 1
+            self._count('retries')
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool hit/miss counters: a hit is a request that reused a kept-alive connection"""
+        with self._lock:
+            counters = dict(self._counters)
+
+        misses = counters['new_connections']
+        hits = max(0, counters['requests'] - misses)
+        total = hits + misses
+        return {
+            'pool_size': self.pool_size,
+            'requests': counters['requests'],
+            'pool_hits': hits,
+            'pool_misses': misses,
+            'pool_hit_rate': round(hits / total, 3) if total else 0.0,
+            'retries': counters['retries'],
+            'errors': counters['errors']
+        }
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+def get_http_client() -> PooledHttpClient:
+    """Process-wide pooled client shared by every AI service instance"""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = PooledHttpClient(
+                    pool_size=current_config.AI_HTTP_POOL_SIZE,
+                    connect_timeout=current_config.AI_HTTP_CONNECT_TIMEOUT,
+                    read_timeout=current_config.AI_HTTP_READ_TIMEOUT,
+                    max_retries=current_config.AI_HTTP_MAX_RETRIES,
+                    backoff_factor=current_config.AI_HTTP_BACKOFF_FACTOR
+                )
+    return _http_client
@@ -0,0 +1,249 @@
+"""
+Near-duplicate detection for stored questions with MinHash and LSH.
+
+The content hash only catches copies whose normalized text is identical;
+the model's paraphrases of a question slip past it. Each question is reduced
+to a MinHash signature over the word unigrams and bigrams of its stem, and
+the signatures are banded into LSH buckets so a lookup only
+compares against the few questions sharing a band, independent of the size
+of the bank. Matches are confirmed by the estimated Jaccard similarity.
+
+Options are left out: distinct questions often share an option set (the
+same four units, elements or organelles), which made them look alike. The
+threshold is high because short stems that differ in one word (the SI unit
+of force and of power) still share most of their shingles, and a negated
+stem ("is not an alkali metal") adds heavily weighted features so it never
+matches its positive form.
+
+The bank-wide index lives in memory in each worker. It is built in the
+background from the questions table, picks up rows inserted elsewhere by
+their id, and is fed directly by the code that inserts questions.
+"""
+import hashlib
+import re
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, Any, Optional, List, Tuple
+
+from config.settings import current_config
+from utils.helpers import normalize_question_text
+
+# Matched against normalized text, where "isn't" has become "isn t"
+NEGATION = re.compile(r'\b(?:not|no|never|none|except|incorrect|false|cannot|\w+n t)\b')
+NEGATION_WEIGHT = 8
+
+class MinHasher:
+    """MinHash with one independent 32-bit hash function per permutation
+
+    One SHAKE-128 digest per shingle supplies all num_perm hash values at
+    once, which is far cheaper in Python than num_perm modular permutations.
+    The digest is unkeyed, so signatures agree between workers and restarts.
+    """
+
+    def __init__(self, num_perm: int = 64):
+        self.num_perm = num_perm
+        self._layout = struct.Struct(f'<{num_perm}I')
+
+    def shingles(self, question_text: str) -> set:
+        text = normalize_question_text(question_text)
+        words = text.split()
+        features = set(words)
+        features.update(f'{first} {second}' for first, second in zip(words, words[1:]))
+        if words and NEGATION.search(text):
+            features.update(f'negated:{copy}' for copy in range(NEGATION_WEIGHT))
+        return features
+
+    def signature(self, question_text: str) -> Optional[array]:
+        """MinHash signature of a question stem; None when it has no text"""
+        features = self.shingles(question_text)
+        if not features:
+            return None
+        digest_size = 4 * self.num_perm
+        rows = [self._layout.unpack(hashlib.shake_128(feature.encode('utf-8')).digest(digest_size)) for feature in features]
+        return array('I', map(min, zip(*rows)))
+
+def similarity(first: array, second: array) -> float:
+    """Estimated Jaccard similarity of the two questions"""
+    return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+class LSHIndex:
+    """Banded MinHash buckets; keys are grouped (e.g. by subject) so groups never match each other"""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.85):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.rows = num_perm // bands
+        self.bands = bands
+        self.threshold = threshold
+        self.signatures: Dict[Any, bytes] = {}
+        self.buckets: List[Dict[int, Any]] = [{} for _ in range(bands)]
+
+    def _band_keys(self, signature: array, group: Any) -> List[int]:
+        rows = self.rows
+        return [hash((group, tuple(signature[band * rows:(band + 1) * rows]))) for band in range(self.bands)]
+
+    def add(self, key: Any, signature: array, group: Any = None):
+        if key in self.signatures:
+            return
+        self.signatures[key] = signature.tobytes()
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature, group)):
+            entry = bucket.get(band_key)
+            if entry is None:
+                bucket[band_key] = key
+            elif isinstance(entry, list):
+                entry.append(key)
+            else:
+                bucket[band_key] = [entry, key]
+
+    def query(self, signature: array, group: Any = None) -> Optional[Tuple[Any, float]]:
+        """Most similar indexed key at or above the threshold, with its similarity"""
+        candidates = set()
+        for bucket, band_key in zip(self.buckets, self._band_keys(signature, group)):
+            entry = bucket.get(band_key)
+            if entry is None:
+                continue
+            if isinstance(entry, list):
+                candidates.update(entry)
+            else:
+                candidates.add(entry)
+
+        best = None
+        for key in candidates:
+            stored = array('I')
+            stored.frombytes(self.signatures[key])
+            score = similarity(signature, stored)
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (key, score)
+        return best
+
+    def __len__(self):
+        return len(self.signatures)
+
+class QuestionNearDuplicateIndex:
+    """Bank-wide near-duplicate index over the questions table, per subject"""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, threshold: float = 0.85, sync_seconds: float = 5.0,
+                 enabled: bool = True):
+        self.hasher = MinHasher(num_perm)
+        self.index = LSHIndex(num_perm, bands, threshold)
+        self.sync_seconds = sync_seconds
+        self.enabled = enabled
+        self.app = None
+        self.last_id = 0        # Highest question id loaded from the table
+        self.ready = False      # Initial bulk build finished
+        self._last_sync = 0.0
+        self._builder = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'checks': 0,
+            'near_duplicates': 0,
+            'check_seconds': 0.0
+        }
+
+    def init_app(self, app):
+        """Remember the Flask app so the index can be built in the background"""
+        self.app = app
+
+    def signature(self, question_text: str) -> Optional[array]:
+        """MinHash signature (None when the index is disabled)"""
+        return self.hasher.signature(question_text) if self.enabled else None
+
+    def batch_index(self) -> LSHIndex:
+        """Empty index with the same settings, for finding near-duplicates within one batch"""
+        return LSHIndex(self.hasher.num_perm, self.index.bands, self.index.threshold)
+
+    def find(self, subject_id: int, question_text: str, signature: Optional[array] = None) -> Optional[Tuple[int, float]]:
+        """(question id, similarity) of a stored near-duplicate in the same subject, or None
+
+        Returns None while the index is still being built.
+        """
+        if not self.enabled:
+            return None
+        self._refresh()
+        started = time.perf_counter()
+        signature = signature or self.signature(question_text)
+        match = None
+        if signature is not None:
+            with self._lock:
+                match = self.index.query(signature, group=subject_id)
+        with self._lock:
+            self._stats['checks'] += 1
+            self._stats['check_seconds'] += time.perf_counter() - started
+            if match:
+                self._stats['near_duplicates'] += 1
+        return match
+
+    def add(self, question_id: int, subject_id: int, question_text: str, signature: Optional[array] = None):
+        """Index a question that was just stored"""
+        if not self.enabled:
+            return
+        signature = signature or self.signature(question_text)
+        if signature is not None:
+            with self._lock:
+                self.index.add(question_id, signature, group=subject_id)
+
+    def _refresh(self):
+        """Start the bulk build on first use; later, pick up rows other workers inserted"""
+        if self.app is None:
+            return
+        with self._lock:
+            due = time.monotonic() - self._last_sync >= self.sync_seconds
+            building = self._builder is not None and self._builder.is_alive()
+            if building or (self.ready and not due):
+                return
+            self._last_sync = time.monotonic()
+            self._builder = threading.Thread(target=self._run_sync, name='near-duplicate-index', daemon=True)
+            self._builder.start()
+
+    def _run_sync(self):
+        try:
+            with self.app.app_context():
+                started = time.monotonic()
+                loaded = self.load_new_rows()
+                if not self.ready:
+                    print(f"🧬 Near-duplicate index built with {len(self.index)} questions in {time.monotonic() - started:.1f}s")
+                elif loaded:
+                    print(f"🧬 Near-duplicate index picked up {loaded} new questions")
+                self.ready = True
+        except Exception as e:
+            print(f"⚠️ Near-duplicate index sync failed: {e}")
+
+    def load_new_rows(self, batch_size: int = 2000) -> int:
+        """Index every question with an id above the last one loaded (needs an app context)"""
+        from models.question import Question
+        from database.connection import db
+
+        loaded = 0
+        while True:
+            rows = db.session.query(
+                Question.id, Question.subject_id, Question.question_text
+            ).filter(Question.id > self.last_id).order_by(Question.id).limit(batch_size).all()
+            db.session.remove()
+            if not rows:
+                return loaded
+            for question_id, subject_id, question_text in rows:
+                self.add(question_id, subject_id, question_text)
+            self.last_id = rows[-1][0]
+            loaded += len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            checks = self._stats['checks']
+            return dict(
+                self._stats,
+                check_seconds=round(self._stats['check_seconds'], 4),
+                avg_check_ms=round(self._stats['check_seconds'] * 1000 / checks, 3) if checks else None,
+                indexed=len(self.index),
+                ready=self.ready,
+                enabled=self.enabled
+            )
+
+near_duplicates = QuestionNearDuplicateIndex(
+    num_perm=current_config.NEAR_DUP_NUM_PERM,
+    bands=current_config.NEAR_DUP_BANDS,
+    threshold=current_config.NEAR_DUP_THRESHOLD,
+    sync_seconds=current_config.NEAR_DUP_SYNC_SECONDS,
+    enabled=current_config.NEAR_DUP_ENABLED
+)
@@ -0,0 +1,356 @@
+"""
+Scheduled pre-warming of question stock ahead of known exam sessions.
+
+Coaching batches start their tests at fixed times, so every start_test of a
+session arrives within a minute. The calendar at PREWARM_CALENDAR_PATH lists
+the expected sessions:
+
+    {"sessions": [
+        {"name": "Batch A", "subject": "Physics", "topics": ["Kinematics", "Optics"],
+         "headcount": 120, "questions_per_test": 10, "time": "18:00", "days": ["mon", "wed", "fri"]},
+        {"name": "Mock 3", "subject": "Biology", "headcount": 300, "questions_per_test": 45,
+         "starts_at": "2026-11-02T10:00"}
+    ]}
+
+`subject` and `topics` are names or ids; topics may also map each topic to
+its own headcount, otherwise the headcount is split evenly. Without topics
+the session takes mixed tests. Recurring sessions give a `time` and
+optionally `days` (every day when omitted); one-off sessions give
+`starts_at`. Times are local.
+
+Each session needs headcount x questions_per_test questions (plus a margin)
+in the inventory key its tests take from. From PREWARM_LEAD_MINUTES before
+the start (earlier when the estimated fill time at the background share of
+the quota needs it) the scheduler refills those keys through the inventory,
+earliest session first and at background quota priority, so live traffic
+keeps its reserve. One worker per host does the warming, chosen through a
+lease in the shared runtime SQLite file; any worker can report readiness.
+"""
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+
+from config.settings import current_config
+from database.local_store import LocalStore
+from models.subject import Subject
+from models.topic import Topic
+from services.question_inventory import question_inventory, StockKey
+
+LEASE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS prewarm_leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+'''
+
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+
+def next_start(entry: Dict[str, Any], now: datetime) -> Optional[datetime]:
+    """Start of the entry's upcoming session; a one-off session keeps its start once it has passed"""
+    if entry.get('starts_at'):
+        starts_at = datetime.fromisoformat(entry['starts_at'])
+        if starts_at.tzinfo is not None:
+            starts_at = starts_at.astimezone().replace(tzinfo=None)
+        return starts_at
+
+    hour, minute = (int(part) for part in entry['time'].split(':'))
+    days = [WEEKDAYS.index(day.strip().lower()[:3]) for day in entry.get('days') or WEEKDAYS]
+    for offset in range(8):
+        candidate = (now + timedelta(days=offset)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate.weekday() in days and candidate >= now:
+            return candidate
+    return None
+
+def topic_headcounts(entry: Dict[str, Any]) -> List[Tuple[Any, int]]:
+    """(topic reference, students) pairs of a session; a None topic is a mixed test"""
+    headcount = int(entry.get('headcount', 0))
+    topics = entry.get('topics') or []
+    if isinstance(topics, dict):
+        return [(topic, int(count)) for topic, count in topics.items()]
+    if not topics:
+        return [(None, headcount)]
+    share = math.ceil(headcount / len(topics))
+    return [(topic, share) for topic in topics]
+
+class PrewarmScheduler:
+    def __init__(self, calendar_path: Optional[str], lead_minutes: float = 120, margin: float = 0.1,
+                 interval_seconds: float = 60, step_questions: int = 50, lease_seconds: float = 600,
+                 requests_per_minute: int = 60, background_reserve: float = 0.2,
+                 disk_path: Optional[str] = None, enabled: bool = True, inventory=None,
+                 clock=time.time, now=datetime.now):
+        self.calendar_path = calendar_path
+        self.lead_minutes = lead_minutes
+        self.margin = margin                          # Extra share of questions on top of the headcount
+        self.interval_seconds = interval_seconds
+        self.step_questions = step_questions          # Questions generated between lease renewals
+        self.lease_seconds = lease_seconds
+        # Requests per minute background work may use
+        self.background_rpm = max(1.0, requests_per_minute * (1 - background_reserve))
+        self.enabled = enabled
+        self.inventory = inventory or question_inventory
+        self.clock = clock
+        self.now = now
+        self.store = LocalStore(disk_path, LEASE_SCHEMA) if disk_path else None
+        self.owner = uuid.uuid4().hex
+        self.app = None
+
+        self._calendar: List[Dict[str, Any]] = []
+        self._calendar_mtime = None
+        self._lock = threading.Lock()
+        self._worker = None
+        self._stats = {
+            'ticks': 0,
+            'questions_added': 0,
+            'errors': 0,
+            'leader': False,
+            'last_tick': None
+        }
+
+    def init_app(self, app):
+        """Remember the Flask app and start the scheduler thread"""
+        self.app = app
+        if self.enabled and self.calendar_path:
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name='prewarm-scheduler', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.tick()
+            except Exception as e:
+                print(f"⚠️ Prewarm tick failed: {e}")
+                with self._lock:
+                    self._stats['errors'] += 1
+            time.sleep(self.interval_seconds)
+
+    def calendar(self) -> List[Dict[str, Any]]:
+        """Session entries of the calendar file, reloaded when the file changes"""
+        if not self.calendar_path or not os.path.exists(self.calendar_path):
+            return []
+        mtime = os.path.getmtime(self.calendar_path)
+        with self._lock:
+            if mtime == self._calendar_mtime:
+                return self._calendar
+        try:
+            with open(self.calendar_path, encoding='utf-8') as f:
+                data = json.load(f)
+            entries = data.get('sessions', []) if isinstance(data, dict) else data
+        except Exception as e:
+            print(f"⚠️ Prewarm calendar unreadable: {e}")
+            entries = []
+        with self._lock:
+            self._calendar, self._calendar_mtime = entries, mtime
+        return entries
+
+    def _resolve_subject(self, reference) -> Optional[Subject]:
+        if isinstance(reference, int) or str(reference).isdigit():
+            return Subject.query.get(int(reference))
+        return Subject.query.filter(Subject.name.ilike(str(reference))).first()
+
+    def _resolve_topic(self, subject: Subject, reference) -> Optional[Topic]:
+        if isinstance(reference, int) or str(reference).isdigit():
+            topic = Topic.query.get(int(reference))
+            return topic if topic and topic.subject_id == subject.id else None
+        return Topic.query.filter(Topic.subject_id == subject.id, Topic.name.ilike(str(reference))).first()
+
+    def _session(self, entry: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        """Upcoming session of an entry with the questions it needs per inventory key"""
+        session = {'name': entry.get('name') or entry.get('subject'), 'starts_at': None, 'keys': []}
+        starts_at = next_start(entry, now)
+        if starts_at is None:
+            raise ValueError('no upcoming session')
+        session['starts_at'] = starts_at
+
+        subject = self._resolve_subject(entry.get('subject'))
+        if not subject:
+            raise ValueError(f"unknown subject {entry.get('subject')!r}")
+        questions_per_test = int(entry.get('questions_per_test', 10))
+        for reference, students in topic_headcounts(entry):
+            topic = None
+            if reference is not None:
+                topic = self._resolve_topic(subject, reference)
+                if not topic:
+                    raise ValueError(f'unknown topic {reference!r} in {subject.name}')
+            session['keys'].append({
+                'key': self.inventory.make_key(subject.id, topic.id if topic else None, entry.get('difficulty', 'medium')),
+                'subject': subject.name,
+                'topic': topic.name if topic else None,
+                'demand': math.ceil(students * questions_per_test * (1 + self.margin))
+            })
+        return session
+
+    def _minutes_to_generate(self, questions: int) -> float:
+        """Rough time to generate `questions` at the background share of the request quota"""
+        requests = math.ceil(questions / max(1, self.inventory.refill_batch))
+        return requests / self.background_rpm
+
+    def plan(self) -> List[Dict[str, Any]]:
+        """Upcoming sessions in start order with stock, readiness and warming status
+
+        Stock of a key shared by several sessions counts towards the earliest
+        one first. A key's `target` is the stock it needs to cover this
+        session and every earlier one.
+        """
+        now = self.now()
+        sessions, levels, claimed = [], {}, {}
+        for entry in self.calendar():
+            try:
+                sessions.append(self._session(entry, now))
+            except Exception as e:
+                sessions.append({'name': entry.get('name') or entry.get('subject'), 'starts_at': None, 'keys': [], 'error': str(e)})
+        sessions.sort(key=lambda session: (session['starts_at'] is None, session['starts_at'] or now))
+
+        for session in sessions:
+            demand = covered = 0
+            for item in session['keys']:
+                key = item['key']
+                if key not in levels:
+                    levels[key] = self.inventory.stock_level(*key)
+                if session['starts_at'] <= now:
+                    # Already running: its tests have been taking from this stock
+                    item['stock'] = item['covered'] = levels[key]
+                    item['target'] = 0
+                else:
+                    item['stock'] = levels[key]
+                    item['covered'] = max(0, min(item['demand'], levels[key] - claimed.get(key, 0)))
+                    claimed[key] = claimed.get(key, 0) + item['demand']
+                    item['target'] = claimed[key]
+                demand += item['demand']
+                covered += min(item['covered'], item['demand'])
+
+            if session.get('error'):
+                session['status'] = 'invalid'
+                continue
+            missing = demand - covered
+            minutes = self._minutes_to_generate(missing)
+            warm_from = session['starts_at'] - timedelta(minutes=max(self.lead_minutes, 2 * minutes))
+            if session['starts_at'] <= now:
+                status = 'started'
+            elif missing == 0:
+                status = 'ready'
+            elif now < warm_from:
+                status = 'scheduled'
+            elif now + timedelta(minutes=minutes) > session['starts_at']:
+                status = 'at_risk'
+            else:
+                status = 'warming'
+            session.update(
+                status=status,
+                demand=demand,
+                covered=covered,
+                ready_ratio=round(covered / demand, 3) if demand else 1.0,
+                estimated_minutes_to_ready=round(minutes, 1),
+                warm_from=warm_from
+            )
+        return sessions
+
+    def report(self) -> List[Dict[str, Any]]:
+        """JSON-friendly readiness of every scheduled session"""
+        sessions = []
+        for session in self.plan():
+            session = dict(session)
+            for field in ('starts_at', 'warm_from'):
+                if session.get(field) is not None:
+                    session[field] = session[field].isoformat(timespec='minutes')
+            session['keys'] = [
+                {
+                    'subject_id': item['key'][0],
+                    'topic_id': item['key'][1],
+                    'difficulty': item['key'][2],
+                    **{name: value for name, value in item.items() if name != 'key'}
+                }
+                for item in session['keys']
+            ]
+            sessions.append(session)
+        return sessions
+
+    def tick(self) -> int:
+        """Warm the keys of sessions inside their warming window; returns the questions added"""
+        if not self.inventory.enabled or self.inventory.ai_service is None:
+            return 0
+        leader = self._hold_lease()
+        with self._lock:
+            self._stats['ticks'] += 1
+            self._stats['leader'] = leader
+            self._stats['last_tick'] = self.clock()
+        if not leader:
+            return 0
+
+        added = 0
+        for session in self.plan():
+            if session['status'] not in ('warming', 'at_risk'):
+                continue
+            print(f"🔥 Prewarming {session['name']} ({session['status']}, {session['covered']}/{session['demand']} ready, "
+                  f"starts {session['starts_at']:%H:%M})")
+            for item in session['keys']:
+                added += self._warm(item['key'], item['target'])
+        with self._lock:
+            self._stats['questions_added'] += added
+        return added
+
+    def _warm(self, key: StockKey, target: int) -> int:
+        """Refill a key up to `target` in steps, stopping if the lease is lost or generation stalls"""
+        added = 0
+        while self._hold_lease():
+            level = self.inventory.stock_level(*key)
+            if level >= target:
+                break
+            step = self.inventory.refill(key, target=min(target, level + self.step_questions))
+            if not step:
+                break
+            added += step
+        return added
+
+    def _hold_lease(self) -> bool:
+        """Take or renew the host-wide prewarm lease; True when this scheduler holds it"""
+        if self.store is None:
+            return True
+        try:
+            connection = self.store.connection()
+            now = self.clock()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = connection.execute('SELECT owner, expires_at FROM prewarm_leases WHERE name = ?', ('prewarm',)).fetchone()
+                if row and row[0] != self.owner and row[1] > now:
+                    connection.execute('COMMIT')
+                    return False
+                connection.execute(
+                    'INSERT OR REPLACE INTO prewarm_leases (name, owner, expires_at) VALUES (?, ?, ?)',
+                    ('prewarm', self.owner, now + self.lease_seconds)
+                )
+                connection.execute('COMMIT')
+                return True
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+        except Exception as e:
+            print(f"⚠️ Prewarm lease unavailable: {e}")
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, enabled=self.enabled, calendar_path=self.calendar_path, sessions=len(self._calendar))
+
+prewarm_scheduler = PrewarmScheduler(
+    calendar_path=current_config.PREWARM_CALENDAR_PATH,
+    lead_minutes=current_config.PREWARM_LEAD_MINUTES,
+    margin=current_config.PREWARM_MARGIN,
+    interval_seconds=current_config.PREWARM_INTERVAL_SECONDS,
+    step_questions=current_config.PREWARM_STEP_QUESTIONS,
+    lease_seconds=current_config.PREWARM_LEASE_SECONDS,
+    requests_per_minute=current_config.AI_QUOTA_RPM,
+    background_reserve=current_config.AI_QUOTA_BACKGROUND_RESERVE,
+    disk_path=current_config.AI_RUNTIME_DB_PATH,
+    enabled=current_config.PREWARM_ENABLED
+)
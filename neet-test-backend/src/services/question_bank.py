@@ -0,0 +1,83 @@
+"""
+Random sampling from the stored question bank.
+
+Used when live generation is unavailable (circuit breaker open, upstream
+failure) so tests still start immediately with real, previously generated
+questions instead of one canned question repeated.
+"""
+import random
+from typing import List, Dict, Any, Optional, Iterable
+
+from sqlalchemy import func
+
+from models.question import Question
+from models.topic import Topic
+
+class QuestionBankSampler:
+    def sample(self, subject_id: int, topic_id: Optional[int] = None, difficulty: Optional[str] = None,
+               count: int = 10, exclude_hashes: Iterable[str] = ()) -> List[Dict[str, Any]]:
+        """Stratified random sample of stored questions
+
+        Strata are topics: the requested topic, or every topic of the subject
+        for mixed tests, each getting an equal share. Within a stratum questions
+        of the requested difficulty are preferred, then any difficulty. Shares
+        a stratum cannot fill are redistributed across the others.
+        """
+        if count <= 0:
+            return []
+
+        if topic_id:
+            strata = [topic_id]
+        else:
+            strata = [topic.id for topic in Topic.query.filter_by(subject_id=subject_id, is_active=True).all()]
+            random.shuffle(strata)
+        if not strata:
+            return []
+
+        difficulty = (difficulty or 'medium').lower()
+        excluded = set(exclude_hashes)
+        taken_ids = set()
+        picked = []
+
+        # First pass: equal quota per topic; second pass: fill any shortfall from all strata
+        base, extra = divmod(count, len(strata))
+        quotas = [base + 1 if i < extra else base for i in range(len(strata))]
+        for stratum, quota in zip(strata, quotas):
+            if quota:
+                picked += self._pick(subject_id, [stratum], difficulty, quota, taken_ids, excluded)
+
+        if len(picked) < count:
+            picked += self._pick(subject_id, strata, difficulty, count - len(picked), taken_ids, excluded)
+
+        random.shuffle(picked)
+        print(f"🏦 Sampled {len(picked)}/{count} questions from the question bank")
+        return [question.to_generation_dict() for question in picked]
+
+    def _pick(self, subject_id: int, topic_ids: List[int], difficulty: str, quota: int, taken_ids: set, excluded: set) -> List[Question]:
+        picked = []
+        for same_difficulty in (True, False):
+            if len(picked) >= quota:
+                break
+
+            query = Question.query.filter(
+                Question.subject_id == subject_id,
+                Question.topic_id.in_(topic_ids),
+                Question.is_active.is_(True)
+            )
+            if same_difficulty:
+                query = query.filter(Question.difficulty_level == difficulty)
+            if taken_ids:
+                query = query.filter(Question.id.notin_(taken_ids))
+
+            # Over-fetch a little so excluded stems can be skipped without another query
+            candidates = query.order_by(func.random()).limit((quota - len(picked)) + min(len(excluded), 50)).all()
+            for question in candidates:
+                if len(picked) >= quota:
+                    break
+                if question.content_hash in excluded:
+                    continue
+                taken_ids.add(question.id)
+                picked.append(question)
+        return picked
+
+question_bank = QuestionBankSampler()
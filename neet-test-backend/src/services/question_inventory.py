@@ -0,0 +1,226 @@
+"""
+Persistent inventory of pre-generated NEET questions.
+
+Stock is kept per (subject_id, topic_id, difficulty) key in the question_stock
+table. start_test takes from stock and only falls back to live generation for
+whatever is missing; a background refiller tops each key back up to the high
+watermark once it drops below the low watermark.
+"""
+import threading
+import uuid
+from queue import Queue, Empty
+from typing import List, Dict, Any, Optional, Tuple
+
+from sqlalchemy import select, func
+
+from config.settings import current_config
+from database.connection import db
+from models.question_stock import QuestionStock
+from models.subject import Subject
+from models.topic import Topic
+from services.topic_mix import TopicMix
+from services.quota_governor import quota_priority, BACKGROUND
+from services.question_validator import question_validator
+
+StockKey = Tuple[int, Optional[int], str]
+
+class QuestionInventory:
+    def __init__(self, low_watermark: int = 20, high_watermark: int = 60, refill_batch: int = 10, enabled: bool = True):
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.refill_batch = refill_batch
+        self.enabled = enabled
+        self.app = None
+        self.ai_service = None
+        self._queue = Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def init_app(self, app):
+        """Remember the Flask app so the refiller thread can open an app context"""
+        self.app = app
+
+    def bind_ai_service(self, ai_service):
+        """Use the given AI service for refills (first binding wins)"""
+        if self.ai_service is None:
+            self.ai_service = ai_service
+
+    @staticmethod
+    def make_key(subject_id: int, topic_id: Optional[int], difficulty: Optional[str]) -> StockKey:
+        return (int(subject_id), int(topic_id) if topic_id else None, (difficulty or 'medium').lower())
+
+    def _key_filter(self, key: StockKey):
+        subject_id, topic_id, difficulty = key
+        topic_clause = QuestionStock.topic_id.is_(None) if topic_id is None else QuestionStock.topic_id == topic_id
+        return [QuestionStock.subject_id == subject_id, topic_clause, QuestionStock.difficulty == difficulty]
+
+    def take(self, subject_id: int, topic_id: Optional[int], difficulty: Optional[str], count: int) -> List[Dict[str, Any]]:
+        """Remove up to `count` questions from stock and return their payloads"""
+        if not self.enabled or count <= 0:
+            return []
+
+        key = self.make_key(subject_id, topic_id, difficulty)
+        token = uuid.uuid4().hex
+        try:
+            # Claim rows with a single UPDATE so concurrent takers (threads or
+            # gunicorn workers) can never be handed the same stock row
+            candidate_ids = (
+                select(QuestionStock.id)
+                .where(*self._key_filter(key), QuestionStock.claimed_by.is_(None))
+                .order_by(QuestionStock.id)
+                .limit(count)
+            )
+            QuestionStock.query.filter(
+                QuestionStock.id.in_(candidate_ids),
+                QuestionStock.claimed_by.is_(None)
+            ).update({QuestionStock.claimed_by: token}, synchronize_session=False)
+
+            rows = QuestionStock.query.filter_by(claimed_by=token).order_by(QuestionStock.id).all()
+            payloads = [dict(row.payload) for row in rows]
+            for row in rows:
+                db.session.delete(row)
+            db.session.commit()
+
+            print(f"📦 Inventory: took {len(payloads)}/{count} questions for {key}")
+            return payloads
+
+        except Exception as e:
+            print(f"⚠️ Inventory take failed for {key}: {e}")
+            db.session.rollback()
+            return []
+
+    def add(self, subject_id: int, topic_id: Optional[int], difficulty: Optional[str], questions: List[Dict[str, Any]]) -> int:
+        """Put generated questions into stock and return how many were stored"""
+        key = self.make_key(subject_id, topic_id, difficulty)
+        try:
+            for question in questions:
+                db.session.add(QuestionStock(
+                    subject_id=key[0],
+                    topic_id=key[1],
+                    difficulty=key[2],
+                    payload=question
+                ))
+            db.session.commit()
+            return len(questions)
+        except Exception as e:
+            print(f"⚠️ Inventory add failed for {key}: {e}")
+            db.session.rollback()
+            return 0
+
+    def stock_level(self, subject_id: int, topic_id: Optional[int], difficulty: Optional[str]) -> int:
+        key = self.make_key(subject_id, topic_id, difficulty)
+        return QuestionStock.query.filter(*self._key_filter(key), QuestionStock.claimed_by.is_(None)).count()
+
+    def stock_levels(self) -> List[Dict[str, Any]]:
+        """Current stock per key, for monitoring"""
+        rows = db.session.query(
+            QuestionStock.subject_id,
+            QuestionStock.topic_id,
+            QuestionStock.difficulty,
+            func.count(QuestionStock.id)
+        ).filter(
+            QuestionStock.claimed_by.is_(None)
+        ).group_by(
+            QuestionStock.subject_id, QuestionStock.topic_id, QuestionStock.difficulty
+        ).all()
+
+        return [{
+            'subject_id': subject_id,
+            'topic_id': topic_id,
+            'difficulty': difficulty,
+            'count': count,
+            'low_watermark': self.low_watermark,
+            'high_watermark': self.high_watermark
+        } for subject_id, topic_id, difficulty, count in rows]
+
+    def request_refill(self, subject_id: int, topic_id: Optional[int], difficulty: Optional[str]):
+        """Ask the background refiller to check this key; never blocks the caller"""
+        if not self.enabled or self.app is None or self.ai_service is None:
+            return
+
+        key = self.make_key(subject_id, topic_id, difficulty)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+            self._queue.put(key)
+            self._ensure_worker()
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run_refiller, name='question-inventory-refiller', daemon=True)
+            self._worker.start()
+
+    def _run_refiller(self):
+        while True:
+            try:
+                key = self._queue.get(timeout=60)
+            except Empty:
+                continue
+
+            try:
+                with self.app.app_context():
+                    self.refill(key)
+            except Exception as e:
+                print(f"⚠️ Inventory refill failed for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def refill(self, key: StockKey, target: int = None) -> int:
+        """Generate questions for a key until it reaches `target` (default: high watermark)"""
+        subject_id, topic_id, difficulty = key
+        level = self.stock_level(subject_id, topic_id, difficulty)
+        if target is None:
+            if level >= self.low_watermark:
+                return 0
+            target = self.high_watermark
+
+        subject = Subject.query.get(subject_id)
+        if not subject:
+            return 0
+        topic = Topic.query.get(topic_id) if topic_id else None
+
+        added = 0
+        with quota_priority(BACKGROUND):
+            added, level = self._refill_to(subject, topic, key, level, target)
+
+        print(f"📦 Inventory: refilled {key} with {added} questions (level {level})")
+        return added
+
+    def _refill_to(self, subject: Subject, topic: Optional[Topic], key: StockKey, level: int, target: int) -> Tuple[int, int]:
+        subject_id, topic_id, difficulty = key
+        added = 0
+        while level < target:
+            batch = min(self.refill_batch, target - level)
+            # Mixed-test stock is generated with a per-topic allocation so every question has a topic
+            topic_mix = None if topic else TopicMix.for_subject(subject_id, batch)
+            questions = self.ai_service.generate_neet_questions(
+                subject=subject.name,
+                topic=topic.name if topic else None,
+                count=batch,
+                difficulty=difficulty,
+                fallback=False,
+                use_cache=False,  # Stock must be fresh questions, not cached copies
+                topic_mix=topic_mix.counts if topic_mix else None
+            )
+            questions, _ = question_validator.validate(questions)
+            if topic_mix:
+                topic_mix.tag(questions)
+            if not questions:
+                break
+
+            stored = self.add(subject_id, topic_id, difficulty, questions)
+            if stored == 0:
+                break
+            added += stored
+            level += stored
+        return added, level
+
+question_inventory = QuestionInventory(
+    low_watermark=current_config.INVENTORY_LOW_WATERMARK,
+    high_watermark=current_config.INVENTORY_HIGH_WATERMARK,
+    refill_batch=current_config.INVENTORY_REFILL_BATCH,
+    enabled=current_config.INVENTORY_ENABLED
+)
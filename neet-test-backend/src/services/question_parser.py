@@ -0,0 +1,102 @@
+"""
+Incremental parser for the question JSON returned by the AI backends.
+
+The model answers with {"questions": [ {...}, {...}, ... ]}, sometimes wrapped
+in a markdown fence (explanation requests use an "explanations" array). The
+parser is fed text as it arrives and hands back each question object as soon
+as its closing brace has been seen, so callers can use the first questions
+while the rest are still being generated.
+"""
+import json
+from typing import List, Dict, Any
+
+class IncrementalQuestionParser:
+    def __init__(self, array_key: str = 'questions'):
+        self.array_key = array_key
+        self.buffer = ''
+        self.position = 0        # Next character of buffer to scan
+        self.array_started = False
+        self.array_closed = False
+        self.depth = 0           # Brace depth inside the questions array
+        self.object_start = None
+        self.in_string = False
+        self.escaped = False
+        self.questions_parsed = 0
+        self.invalid_objects = 0
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """Add more response text and return the questions completed by it"""
+        self.buffer += text
+        completed = []
+
+        if not self.array_started and not self._find_array_start():
+            return completed
+
+        buffer = self.buffer
+        index = self.position
+        while index < len(buffer) and not self.array_closed:
+            char = buffer[index]
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char == '{':
+                if self.depth == 0:
+                    self.object_start = index
+                self.depth += 1
+            elif char == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    question = self._decode(buffer[self.object_start:index + 1])
+                    if question is not None:
+                        completed.append(question)
+                    self.object_start = None
+            elif char == ']' and self.depth == 0:
+                self.array_closed = True
+
+            index += 1
+
+        self.position = index
+        return completed
+
+    @property
+    def done(self) -> bool:
+        """True once the closing bracket of the questions array has been seen"""
+        return self.array_closed
+
+    def _find_array_start(self) -> bool:
+        key_index = self.buffer.find(f'"{self.array_key}"')
+        if key_index != -1:
+            bracket = self.buffer.find('[', key_index)
+        else:
+            # Tolerate a bare JSON array of questions
+            stripped = self.buffer.lstrip()
+            if stripped.startswith('```'):
+                newline = stripped.find('\n')
+                stripped = stripped[newline + 1:].lstrip() if newline != -1 else ''
+            bracket = self.buffer.find('[') if stripped.startswith('[') else -1
+
+        if bracket == -1:
+            return False
+
+        self.array_started = True
+        self.position = bracket + 1
+        return True
+
+    def _decode(self, text: str):
+        try:
+            question = json.loads(text)
+        except json.JSONDecodeError:
+            self.invalid_objects += 1
+            return None
+        if not isinstance(question, dict):
+            self.invalid_objects += 1
+            return None
+        self.questions_parsed += 1
+        return question
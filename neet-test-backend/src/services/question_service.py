@@ -5,16 +5,44 @@ from models.question import Question, DifficultyLevel
 from models.subject import Subject
 from models.topic import Topic
 from database.connection import db
-from sqlalchemy import and_
+from config.settings import current_config
 from services.gemini_service_new import GeminiService
+from services.question_inventory import question_inventory
+from services.question_bank import question_bank
+from services.topic_mix import TopicMix
+from services.single_flight import single_flight
+from services.question_validator import question_validator
+from services.explanation_service import explanation_service
 
 class QuestionService:
     def __init__(self):
-        self.ai_service = GeminiService()
+        if current_config.AI_CLIENT == 'async':
+            # aiohttp is only needed when the async client is selected
+            from services.async_gemini_service import AsyncGeminiService
+            self.ai_service = AsyncGeminiService()
+        else:
+            self.ai_service = GeminiService()
+        self.inventory = question_inventory
+        self.question_bank = question_bank
+        self.single_flight = single_flight
+        self.validator = question_validator
+        self.inventory.bind_ai_service(self.ai_service)
+        explanation_service.bind_ai_service(self.ai_service)
         print("🔧 Using Google Gemini API for generating intelligent topic-specific questions.")
 
-    def generate_questions(self, subject_id, topic_id=None, num_questions=5, difficulty=None):
-        """Generate questions using Google Gemini for a specific subject"""
+    def generate_questions(self, subject_id, topic_id=None, num_questions=5, difficulty=None, use_inventory=False, fresh=False):
+        """Generate questions using Google Gemini for a specific subject
+
+        With use_inventory=True questions are taken from the pre-generated stock
+        first and Gemini is only asked for whatever the stock could not cover.
+        With fresh=True the generation cache is bypassed.
+
+        Questions that come back missing or invalid are re-requested (only the
+        shortfall) while TEST_START_DEADLINE_SECONDS leaves time for another
+        call, then filled from the question bank. Valid questions are never
+        discarded, so the result can still be short when both run dry.
+        """
+        deadline = time.monotonic() + current_config.TEST_START_DEADLINE_SECONDS
         try:
             # Verify subject exists
             subject = Subject.query.get(subject_id)
@@ -43,20 +71,44 @@ class QuestionService:
                         'message': 'Invalid difficulty level. Use: easy, medium, hard'
                     }, 400
             
-            # Validate question count
-            if num_questions < 1 or num_questions > 50:
+            # Validate question count (large counts are generated in parallel chunks)
+            max_questions = current_config.MAX_QUESTIONS_PER_TEST
+            if num_questions < 1 or num_questions > max_questions:
                 return {
                     'success': False,
-                    'message': 'Question count must be between 1 and 50'
+                    'message': f'Question count must be between 1 and {max_questions}'
                 }, 400
             
-            # Generate questions using Google Gemini - DO NOT save to database for tests
-            generated_questions = self.ai_service.generate_neet_questions(
-                subject=subject.name,
-                topic=topic_name,
-                count=num_questions,
-                difficulty=difficulty or 'medium'
-            )
+            # Serve from the pre-generated inventory first
+            generated_questions = []
+            if use_inventory:
+                generated_questions = self.inventory.take(subject_id, topic_id, difficulty, num_questions)
+                self.inventory.request_refill(subject_id, topic_id, difficulty)
+
+            # Generate the remainder using Google Gemini - DO NOT save to database for tests
+            remaining = num_questions - len(generated_questions)
+            if remaining > 0:
+                ai_questions = []
+                if self.ai_service.breaker.is_open():
+                    print("🚨 AI circuit breaker open - failing over to the question bank")
+                else:
+                    # A class starting the same test together shares one upstream call
+                    flight_key = f"{subject_id}:{topic_id}:{remaining}:{difficulty or 'medium'}:{int(fresh)}"
+                    ai_questions, shared = self.single_flight.do(
+                        flight_key,
+                        lambda: self._generate_from_ai(subject, topic_name, topic_id, remaining, difficulty, fresh)
+                    )
+                    if shared:
+                        print(f"🤝 Joined an in-flight generation for {flight_key}")
+                        random.shuffle(ai_questions)
+                
+                # Outage or failed call: serve stored questions instead of waiting or repeating one fallback
+                if not ai_questions:
+                    ai_questions = self.question_bank.sample(subject_id, topic_id, difficulty, remaining)
+                    self.ai_service.usage.record('bank', 'bank_fallback', subject.name, topic_name, difficulty or 'medium', remaining, len(ai_questions))
+                if not ai_questions and not generated_questions:
+                    ai_questions = self.ai_service._get_fallback_questions(subject.name, remaining, difficulty or 'medium')
+                generated_questions += ai_questions
             
             if not generated_questions:
                 return {
@@ -66,14 +118,12 @@ class QuestionService:
             
             print(f"🔧 DEBUG: Generated questions from Gemini API: {len(generated_questions)}")
             
-            # Validate each question has required fields
-            valid_questions = []
-            for i, q in enumerate(generated_questions):
-                if all(key in q for key in ['question_text', 'option_a', 'option_b', 'option_c', 'option_d', 'correct_answer']):
-                    print(f"  Question {i}: Text='{q.get('question_text', 'MISSING')[:50]}...'")
-                    valid_questions.append(q)
-                else:
-                    print(f"❌ Question {i} missing required fields")
+            # Validate and normalise the whole batch before anyone sees it
+            seen = set()
+            valid_questions, rejected = self.validator.validate(generated_questions, seen)
+            valid_questions = valid_questions[:num_questions]
+            if len(valid_questions) < num_questions:
+                valid_questions += self._top_up(subject, topic_name, topic_id, difficulty, num_questions - len(valid_questions), seen, deadline)
 
             if not valid_questions:
                 return {
@@ -94,7 +144,7 @@ class QuestionService:
                 print(f"🔧 DEBUG: Assigned ID to question {i}: {q_data['id']}")
                     
                 q_data['subject_id'] = subject_id
-                q_data['topic_id'] = topic_id
+                q_data['topic_id'] = q_data.get('topic_id') or topic_id
                 formatted_questions.append(q_data)
                 
             print(f"✅ Final formatted questions: {[q['id'] for q in formatted_questions]}")
@@ -108,6 +158,7 @@ class QuestionService:
                 'total_generated': len(formatted_questions),
                 'difficulty': difficulty or 'medium',
                 'timer_minutes': len(formatted_questions),  # 1 minute per question
+                'rejected_questions': rejected,
                 'message': f'Generated {len(formatted_questions)} fresh questions using AI'
             }, 200
             
@@ -117,6 +168,110 @@ class QuestionService:
                 'message': f'Error generating questions: {str(e)}'
             }, 500
 
+    def _top_up(self, subject, topic_name, topic_id, difficulty, shortfall, seen, deadline):
+        """Up to `shortfall` more valid questions: AI re-requests while time allows, then the bank"""
+        extra = []
+        for round_number in range(1, current_config.TEST_START_TOPUP_ROUNDS + 1):
+            missing = shortfall - len(extra)
+            # Only call again if a typical call still fits before the deadline
+            expected = self.ai_service.providers.expected_latency() or current_config.AI_HTTP_READ_TIMEOUT / 4
+            if missing <= 0 or self.ai_service.breaker.is_open() or time.monotonic() + expected > deadline:
+                break
+            print(f"🔁 Top-up round {round_number}: requesting the {missing} missing questions")
+            # Bypass the cache, which may hold the very batch that came back short
+            questions = self._generate_from_ai(subject, topic_name, topic_id, missing, difficulty, fresh=True)
+            extra += self.validator.validate(questions, seen)[0][:missing]
+
+        missing = shortfall - len(extra)
+        if missing > 0:
+            exclude = [Question.compute_content_hash(text) for text in seen]
+            stored = self.question_bank.sample(subject.id, topic_id, difficulty, missing, exclude_hashes=exclude)
+            extra += self.validator.validate(stored, seen)[0][:missing]
+            print(f"🏦 Filled {min(missing, len(stored))}/{missing} missing questions from the question bank")
+        return extra
+
+    def _generate_from_ai(self, subject, topic_name, topic_id, count, difficulty, fresh):
+        # Mixed tests: one request with a per-topic allocation instead of untagged "general" questions
+        topic_mix = None if topic_id else TopicMix.for_subject(subject.id, count)
+        questions = self.ai_service.generate_neet_questions(
+            subject=subject.name,
+            topic=topic_name,
+            count=count,
+            difficulty=difficulty or 'medium',
+            fallback=False,
+            use_cache=not fresh,
+            topic_mix=topic_mix.counts if topic_mix else None
+        )
+        if topic_mix:
+            topic_mix.tag(questions)
+        return questions
+
+    def stream_questions(self, subject_id, topic_id=None, num_questions=5, difficulty=None, use_inventory=False, fresh=False):
+        """Yield formatted test questions one at a time as soon as each is available
+        
+        Sources in order: inventory stock, the streaming AI backend, then the
+        question bank for anything the stream could not deliver. The caller
+        validates subject, topic and count. Closing this generator stops the
+        upstream stream.
+        """
+        subject = Subject.query.get(subject_id)
+        topic = Topic.query.get(topic_id) if topic_id else None
+        difficulty = difficulty or 'medium'
+        id_prefix = f"test_{int(time.time())}_{random.randint(1000, 9999)}"
+        delivered = 0
+        seen = set()  # Stems already delivered, for duplicate detection across sources
+        
+        def format_question(q_data):
+            nonlocal delivered
+            q_data['id'] = f"{id_prefix}_{delivered}"
+            q_data['subject_id'] = subject_id
+            q_data['topic_id'] = q_data.get('topic_id') or topic_id
+            delivered += 1
+            return q_data
+        
+        if use_inventory:
+            for q_data in self.inventory.take(subject_id, topic_id, difficulty, num_questions):
+                if not self.validator.check(q_data, seen):
+                    yield format_question(q_data)
+            self.inventory.request_refill(subject_id, topic_id, difficulty)
+        
+        remaining = num_questions - delivered
+        if remaining > 0 and not self.ai_service.breaker.is_open():
+            topic_mix = None if topic_id else TopicMix.for_subject(subject_id, remaining)
+            stream = self.ai_service.stream_neet_questions(
+                subject=subject.name,
+                topic=topic.name if topic else None,
+                count=remaining,
+                difficulty=difficulty,
+                use_cache=not fresh,
+                topic_mix=topic_mix.counts if topic_mix else None
+            )
+            streamed = []
+            try:
+                for q_data in stream:
+                    reasons = self.validator.check(q_data, seen)
+                    if reasons:
+                        print(f"🧹 Rejected streamed question: {reasons}")
+                        continue
+                    streamed.append(q_data)
+                    yield format_question(q_data)
+                    if delivered >= num_questions:
+                        break
+            finally:
+                stream.close()
+                # Tag the whole streamed part in one pass so unrecognised topic names are spread
+                # over the allocation; callers store the questions only once the stream has ended
+                if topic_mix:
+                    topic_mix.tag(streamed)
+        
+        # Whatever the stream could not deliver comes from stored questions
+        remaining = num_questions - delivered
+        if remaining > 0:
+            exclude = [Question.compute_content_hash(text) for text in seen]
+            for q_data in self.question_bank.sample(subject_id, topic_id, difficulty, remaining, exclude_hashes=exclude):
+                if not self.validator.check(q_data, seen):
+                    yield format_question(q_data)
+
     def get_question_by_id(self, question_id, include_answer=False):
         """Get a specific question by ID"""
         try:
@@ -195,16 +350,16 @@ class QuestionService:
                 print("❌ No questions generated from Gemini API")
                 return
             
+            # Check which questions already exist with one batched content-hash probe
+            existing_hashes = set(Question.find_ids_by_content_hashes(
+                subject_id,
+                [Question.compute_content_hash(q_data['question_text']) for q_data in generated_questions]
+            ))
+            
             for q_data in generated_questions:
-                # Check if question already exists
-                existing = Question.query.filter(
-                    and_(
-                        Question.question_text == q_data['question_text'],
-                        Question.subject_id == subject_id
-                    )
-                ).first()
-                
-                if not existing:
+                content_hash = Question.compute_content_hash(q_data['question_text'])
+                if content_hash not in existing_hashes:
+                    existing_hashes.add(content_hash)
                     question = Question(
                         question_text=q_data['question_text'],
                         option_a=q_data.get('option_a'),
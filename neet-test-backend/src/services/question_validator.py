@@ -0,0 +1,177 @@
+"""
+Batch validation and normalisation of generated questions.
+
+One pass over a batch repairs what can be repaired safely (answer letters
+written as "(b)" or "Option B", option labels repeated inside the option
+text, missing explanations, options returned as a list) and rejects
+questions that would break grading or confuse a student: no stem, missing
+or duplicate options, an answer that does not name one of the options, or
+a stem already seen earlier in the batch. Every reject carries its reasons.
+"""
+import re
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+from config.settings import current_config
+from utils.helpers import normalize_question_text
+
+OPTION_LETTERS = ('A', 'B', 'C', 'D')
+OPTION_FIELDS = {letter: f'option_{letter.lower()}' for letter in OPTION_LETTERS}
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# "B", "(b)", "B)", "B.", "Option B", "Answer: (B) 20 m"
+ANSWER_PATTERN = re.compile(r'^(?:(?:correct\s+)?(?:answer|option)\s*[:\-]?\s*)?\(?([A-D])\)?(?:[\s\.\):,-]|$)', re.IGNORECASE)
+# "A) 20 m", "(a) 20 m", "A. 20 m" inside option_a
+LABEL_PATTERN = re.compile(r'^\(?([A-D])[\)\.:]\s+', re.IGNORECASE)
+
+class QuestionBatchValidator:
+    def __init__(self, require_explanation: bool = True):
+        # Without it a missing explanation stays blank, to be generated when a student reviews the question
+        self.require_explanation = require_explanation
+        self._lock = threading.Lock()
+        self._stats = {
+            'checked': 0,
+            'rejected': 0,
+            'repaired': 0,
+            'reject_reasons': {},
+            'repairs': {}
+        }
+
+    def validate(self, questions: Iterable[Dict[str, Any]], seen: Optional[set] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Normalise a batch in place; returns (valid questions, rejects)
+
+        Each reject is {'index', 'question_text', 'reasons'}. Pass the same
+        `seen` set across calls to detect duplicates over several batches
+        (e.g. a streamed test).
+        """
+        seen = set() if seen is None else seen
+        valid, rejects = [], []
+        for index, question in enumerate(questions or []):
+            reasons = self.check(question, seen)
+            if reasons:
+                rejects.append({
+                    'index': index,
+                    'question_text': str((question or {}).get('question_text') or '')[:80],
+                    'reasons': reasons
+                })
+            else:
+                valid.append(question)
+
+        if rejects:
+            print(f"🧹 Rejected {len(rejects)}/{len(valid) + len(rejects)} generated questions: "
+                  f"{[reject['reasons'] for reject in rejects]}")
+        return valid, rejects
+
+    def check(self, question: Dict[str, Any], seen: set) -> List[str]:
+        """Repair one question in place and return its reject reasons (empty when valid)"""
+        if not isinstance(question, dict):
+            self._record(['not_an_object'], [])
+            return ['not_an_object']
+
+        reasons, repairs = [], []
+        self._normalise_options(question, repairs)
+
+        question_text = question.get('question_text')
+        question_text = question_text.strip() if isinstance(question_text, str) else ''
+        question['question_text'] = question_text
+        if not question_text:
+            reasons.append('missing_question_text')
+
+        options = {letter: question.get(field) for letter, field in OPTION_FIELDS.items()}
+        if not all(options.values()):
+            reasons.append('missing_option')
+        else:
+            normalised = [normalize_question_text(text) for text in options.values()]
+            if len(set(normalised)) < len(normalised):
+                reasons.append('duplicate_options')
+
+        answer = self._answer_letter(question.get('correct_answer'), options)
+        if answer is None:
+            reasons.append('invalid_answer')
+        elif answer != question.get('correct_answer'):
+            question['correct_answer'] = answer
+            repairs.append('answer_letter')
+
+        explanation = question.get('explanation')
+        if not isinstance(explanation, str) or not explanation.strip():
+            if not self.require_explanation:
+                question['explanation'] = ''
+            elif answer and options.get(answer):
+                question['explanation'] = f"The correct answer is ({answer}) {options[answer]}."
+                repairs.append('missing_explanation')
+        else:
+            question['explanation'] = explanation.strip()
+
+        difficulty = str(question.get('difficulty') or '').strip().lower()
+        if difficulty not in DIFFICULTIES:
+            difficulty = 'medium'
+        if difficulty != question.get('difficulty'):
+            question['difficulty'] = difficulty
+            repairs.append('difficulty')
+
+        if not reasons:
+            fingerprint = normalize_question_text(question_text)
+            if fingerprint in seen:
+                reasons.append('duplicate_in_batch')
+            else:
+                seen.add(fingerprint)
+
+        self._record(reasons, repairs)
+        return reasons
+
+    def _normalise_options(self, question: Dict[str, Any], repairs: List[str]):
+        # Options sometimes come back as {"options": {"A": ...}} or a list instead of option_a..option_d
+        options = question.get('options')
+        if options and not any(question.get(field) for field in OPTION_FIELDS.values()):
+            if isinstance(options, list):
+                options = dict(zip(OPTION_LETTERS, options))
+            if isinstance(options, dict):
+                for letter, field in OPTION_FIELDS.items():
+                    question[field] = options.get(letter, options.get(letter.lower()))
+                repairs.append('options_layout')
+
+        for letter, field in OPTION_FIELDS.items():
+            value = question.get(field)
+            if value is None:
+                continue
+            text = str(value).strip()
+            label = LABEL_PATTERN.match(text)
+            if label and label.group(1).upper() == letter:
+                text = text[label.end():].strip()
+                repairs.append('option_label')
+            question[field] = text
+
+    def _answer_letter(self, answer: Any, options: Dict[str, Any]) -> Optional[str]:
+        if not isinstance(answer, str) or not answer.strip():
+            return None
+        answer = answer.strip()
+        # The model sometimes answers with the option text itself; check that first
+        # so an answer like "A decrease in volume" is not read as letter A
+        normalised = normalize_question_text(answer)
+        for letter, text in options.items():
+            if text and normalize_question_text(text) == normalised:
+                return letter
+        match = ANSWER_PATTERN.match(answer)
+        return match.group(1).upper() if match else None
+
+    def _record(self, reasons: List[str], repairs: List[str]):
+        with self._lock:
+            self._stats['checked'] += 1
+            if reasons:
+                self._stats['rejected'] += 1
+            elif repairs:
+                self._stats['repaired'] += 1
+            for reason in reasons:
+                self._stats['reject_reasons'][reason] = self._stats['reject_reasons'].get(reason, 0) + 1
+            for repair in set(repairs):
+                self._stats['repairs'][repair] = self._stats['repairs'].get(repair, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(
+                self._stats,
+                reject_reasons=dict(self._stats['reject_reasons']),
+                repairs=dict(self._stats['repairs'])
+            )
+
+question_validator = QuestionBatchValidator(require_explanation=not current_config.GEMINI_DEFER_EXPLANATIONS)
@@ -0,0 +1,223 @@
+"""
+Background persistence of the questions of started tests.
+
+start_test used to store every question in the bank before answering. Now
+the questions are committed as one PendingQuestionSave row in the same
+transaction as the TestResult, and a small thread pool stores them in the
+bank afterwards, so the response goes out as soon as the questions are in
+memory. The test's manifest (TestQuestion rows: position, client id, answer
+key and the question as served) is written in that first transaction too. The writer deletes the
+pending row, and links each manifest entry to its question, in the
+transaction that stores the questions, so a started test always has one or
+the other in the database. submit_test calls flush() before grading: if the
+background save has not happened yet, failed, or its process died, the
+questions are stored right there. Rows left behind by a process that died
+are written again by recover() at startup; rows younger than the recovery
+grace period are left alone, since the process that queued them is likely
+still writing them.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Any
+
+from config.settings import current_config
+from database.connection import db
+from models.pending_question_save import PendingQuestionSave
+from models.test import TestQuestion
+
+# Everything _persist_questions reads from a generated question
+PAYLOAD_FIELDS = ('id', 'question_text', 'options', 'option_a', 'option_b', 'option_c', 'option_d',
+                  'correct_answer', 'explanation', 'difficulty', 'topic', 'topic_id')
+
+class QuestionWriter:
+    def __init__(self, workers: int = 2, enabled: bool = True, recover_grace_seconds: float = 120):
+        self.workers = workers
+        self.enabled = enabled
+        self.recover_grace_seconds = recover_grace_seconds
+        self.app = None
+        self.test_service = None
+        self._executor = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._test_locks: Dict[int, List] = {}  # test id -> [lock, holders and waiters]
+        self._stats = {
+            'queued': 0,
+            'written': 0,
+            'written_on_submit': 0,
+            'recovered': 0,
+            'failed': 0
+        }
+
+    def init_app(self, app):
+        """Remember the Flask app so writer threads can open an app context"""
+        self.app = app
+
+    def bind_test_service(self, test_service):
+        """Store questions with the given TestService (first binding wins)"""
+        if self.test_service is None:
+            self.test_service = test_service
+
+    def save(self, test_result, questions: List[Dict[str, Any]]):
+        """Commit the test with its manifest and pending questions, and store them in the bank in the background
+
+        The test result is added to the session if it is new. Without a
+        background pool (writer disabled or no app) the questions are stored
+        before returning.
+        """
+        db.session.add(test_result)
+        db.session.flush()
+        db.session.add_all([
+            TestQuestion.from_served(test_result.id, position, question)
+            for position, question in enumerate(questions)
+        ])
+        db.session.add(PendingQuestionSave(
+            test_result.id,
+            test_result.subject_id,
+            [{key: question.get(key) for key in PAYLOAD_FIELDS if key in question} for question in questions],
+            test_result.topic_id
+        ))
+        db.session.commit()
+
+        if not self.enabled or self.app is None:
+            self.flush(test_result.id)
+            return
+        self._submit(test_result.id)
+        self._count('queued')
+
+    def flush(self, test_result_id: int, on_submit: bool = False) -> bool:
+        """Store the test's pending questions now unless that already happened; True once none are pending"""
+        with self._test_lock(test_result_id):
+            pending = PendingQuestionSave.query.get(test_result_id)
+            if pending is None:
+                return True
+            try:
+                question_ids, index_entries = self.test_service._persist_questions(
+                    pending.questions, pending.subject_id, pending.topic_id
+                )
+                for entry in TestQuestion.query.filter_by(test_result_id=test_result_id).all():
+                    if entry.position < len(question_ids):
+                        entry.question_id = question_ids[entry.position]
+                # A bulk delete matches no row, instead of failing, if another process got there first
+                PendingQuestionSave.query.filter_by(test_result_id=test_result_id).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                print(f"⚠️ Saving questions of test {test_result_id} failed: {e}")
+                db.session.rollback()
+                self._record_failure(test_result_id, str(e))
+                return False
+            # Only rows that exist now: a rolled-back insert would leave paraphrases matching nothing
+            self.test_service._index_questions(index_entries)
+
+        self._count('written_on_submit' if on_submit else 'written')
+        print(f"💾 Saved {sum(1 for question_id in question_ids if question_id)}/{len(question_ids)} questions of test {test_result_id}"
+              f"{' on submit' if on_submit else ''}")
+        return True
+
+    def recover(self, created_before=None):
+        """Queue the pending saves of tests started by processes that stopped before writing them
+
+        Only rows older than the grace period are taken. When younger rows
+        exist at startup, they may belong to a process that died just before,
+        so the rows created before startup are looked at once more after the
+        grace period.
+        """
+        if self.test_service is None:
+            return
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.recover_grace_seconds)
+        if created_before is not None:
+            cutoff = min(cutoff, created_before)
+        test_result_ids = [test_result_id for test_result_id, in db.session.query(PendingQuestionSave.test_result_id).filter(
+            PendingQuestionSave.created_at < cutoff
+        ).all()]
+        if created_before is None and self.app is not None and PendingQuestionSave.query.filter(
+            PendingQuestionSave.created_at >= cutoff
+        ).first() is not None:
+            timer = threading.Timer(self.recover_grace_seconds, self._recover_later, args=(now,))
+            timer.daemon = True
+            timer.start()
+        for test_result_id in test_result_ids:
+            if self.enabled and self.app is not None:
+                self._submit(test_result_id)
+            else:
+                self.flush(test_result_id)
+        if test_result_ids:
+            self._count('recovered', len(test_result_ids))
+            print(f"💾 Recovering pending questions of {len(test_result_ids)} tests")
+
+    def _recover_later(self, created_before):
+        try:
+            with self.app.app_context():
+                try:
+                    self.recover(created_before)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            print(f"⚠️ Delayed question recovery failed: {e}")
+
+    @contextmanager
+    def _test_lock(self, test_result_id: int):
+        """Hold the test's lock; it is dropped once no thread holds or waits for it"""
+        with self._lock:
+            entry = self._test_locks.setdefault(test_result_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._test_locks[test_result_id]
+
+    def _record_failure(self, test_result_id: int, error: str):
+        self._count('failed')
+        try:
+            pending = PendingQuestionSave.query.get(test_result_id)
+            if pending is not None:
+                pending.attempts += 1
+                pending.last_error = error
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='question-writer')
+        return self._executor
+
+    def _submit(self, test_result_id: int):
+        with self._lock:
+            self._pending += 1
+        self._get_executor().submit(self._run, test_result_id)
+
+    def _run(self, test_result_id: int):
+        try:
+            with self.app.app_context():
+                try:
+                    self.flush(test_result_id)
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            print(f"⚠️ Question writer failed for test {test_result_id}: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, pending=self._pending, workers=self.workers, enabled=self.enabled)
+
+question_writer = QuestionWriter(
+    workers=current_config.QUESTION_WRITER_WORKERS,
+    enabled=current_config.QUESTION_WRITER_ENABLED,
+    recover_grace_seconds=current_config.QUESTION_WRITER_RECOVER_GRACE_SECONDS
+)
@@ -0,0 +1,267 @@
+"""
+Host-wide quota governor for the AI API.
+
+Every worker process takes request and token allowances from two token
+buckets (requests per minute, tokens per minute) kept in a shared SQLite
+file, so bursts are smoothed out before they reach Gemini instead of coming
+back as 429s. Callers that find the buckets empty wait, up to a deadline.
+Interactive traffic (tests being started) has priority: background work
+(inventory refills, prewarming) may not dip into a reserved share of either
+bucket and yields while interactive callers are waiting.
+
+The caller's priority is taken from a context variable, so background code
+only has to wrap its work in `with quota_priority(BACKGROUND):`.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+from config.settings import current_config
+from database.local_store import LocalStore
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+_priority = contextvars.ContextVar('ai_quota_priority', default=INTERACTIVE)
+
+@contextmanager
+def quota_priority(priority: str):
+    """Run the enclosed AI calls with the given quota priority"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+def current_priority() -> str:
+    return _priority.get()
+
+QUOTA_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS quota_buckets (
+    name TEXT PRIMARY KEY,
+    level REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quota_waiters (
+    waiter_id TEXT PRIMARY KEY,
+    priority TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+'''
+
+def storage_path_from_url(url: str, default_path: str) -> str:
+    """SQLite file for a RATELIMIT_STORAGE_URL; only sqlite:/// URLs are shared as given"""
+    if url.startswith('sqlite:///'):
+        return url[len('sqlite:///'):]
+    print(f"⚠️ Rate limit storage '{url}' is not supported by the AI quota governor - using {default_path}")
+    return default_path
+
+class QuotaGovernor:
+    def __init__(self, storage_path: str, requests_per_minute: int = 60, tokens_per_minute: int = 1000000,
+                 background_reserve: float = 0.2, interactive_deadline: float = 10.0, background_deadline: float = 300.0,
+                 enabled: bool = True, poll_interval: float = 0.05, clock=time.time):
+        self.capacities = {'requests': float(requests_per_minute), 'tokens': float(tokens_per_minute)}
+        self.background_reserve = background_reserve
+        self.deadlines = {INTERACTIVE: interactive_deadline, BACKGROUND: background_deadline}
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.store = LocalStore(storage_path, QUOTA_SCHEMA)
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'granted': 0,
+            'waited': 0,
+            'timed_out': 0,
+            'wait_seconds': 0.0
+        }
+
+    def try_acquire(self, tokens: int, priority: str = INTERACTIVE, waiter_id: Optional[str] = None) -> float:
+        """Take one request and `tokens` from the buckets if allowed now
+
+        Returns 0 when granted, otherwise an estimate of the seconds until
+        the caller could be granted. A denied caller with a waiter_id is
+        registered as waiting until it is granted or gives up.
+        """
+        now = self.clock()
+        needs = {'requests': 1.0, 'tokens': float(min(tokens, self.capacities['tokens']))}
+        connection = self.store.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            levels = self._refill(connection, now)
+
+            floor = 0.0
+            interactive_waiting = False
+            if priority != INTERACTIVE:
+                floor = self.background_reserve
+                interactive_waiting = connection.execute(
+                    'SELECT 1 FROM quota_waiters WHERE priority = ? AND expires_at > ? LIMIT 1', (INTERACTIVE, now)
+                ).fetchone() is not None
+
+            wait = 0.0
+            for name, need in needs.items():
+                capacity = self.capacities[name]
+                shortfall = need + floor * capacity - levels[name]
+                if shortfall > 0:
+                    wait = max(wait, shortfall * 60.0 / capacity)
+
+            if wait == 0 and not interactive_waiting:
+                for name, need in needs.items():
+                    connection.execute('UPDATE quota_buckets SET level = ? WHERE name = ?', (levels[name] - need, name))
+                if waiter_id:
+                    connection.execute('DELETE FROM quota_waiters WHERE waiter_id = ?', (waiter_id,))
+                connection.execute('COMMIT')
+                return 0.0
+
+            if waiter_id:
+                connection.execute(
+                    'INSERT OR REPLACE INTO quota_waiters (waiter_id, priority, expires_at) VALUES (?, ?, ?)',
+                    (waiter_id, priority, now + self.deadlines.get(priority, self.deadlines[BACKGROUND]) + 1)
+                )
+            connection.execute('COMMIT')
+            return max(wait, self.poll_interval)
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _refill(self, connection, now: float) -> Dict[str, float]:
+        levels = {}
+        for name, capacity in self.capacities.items():
+            row = connection.execute('SELECT level, updated_at FROM quota_buckets WHERE name = ?', (name,)).fetchone()
+            if row is None:
+                level = capacity
+            else:
+                level = min(capacity, row[0] + max(0.0, now - row[1]) * capacity / 60.0)
+            connection.execute(
+                'INSERT OR REPLACE INTO quota_buckets (name, level, updated_at) VALUES (?, ?, ?)', (name, level, now)
+            )
+            levels[name] = level
+        return levels
+
+    def acquire(self, tokens: int, priority: Optional[str] = None, deadline: Optional[float] = None) -> bool:
+        """Wait until the call fits the quota; False if it still does not by the deadline
+
+        Priority defaults to the caller's context (see quota_priority) and the
+        deadline to the configured one for that priority. Never blocks when
+        the governor is disabled or its storage fails.
+        """
+        if not self.enabled:
+            return True
+        priority = priority or current_priority()
+        deadline = self.deadlines.get(priority, self.deadlines[BACKGROUND]) if deadline is None else deadline
+        waiter_id = uuid.uuid4().hex
+        started = self.clock()
+
+        while True:
+            try:
+                wait = self.try_acquire(tokens, priority, waiter_id)
+            except Exception as e:
+                print(f"⚠️ AI quota storage unavailable ({e}) - not limiting this call")
+                return True
+            if wait == 0:
+                return self._granted(started)
+
+            remaining = started + deadline - self.clock()
+            if remaining <= 0:
+                return self._timed_out(waiter_id, priority)
+            time.sleep(min(wait, remaining, 1.0))
+
+    async def acquire_async(self, tokens: int, priority: Optional[str] = None, deadline: Optional[float] = None) -> bool:
+        """acquire() for the event loop
+
+        The SQLite bucket updates run in a worker thread (a locked database
+        would otherwise stall every call on the loop) and waits use asyncio.sleep.
+        """
+        if not self.enabled:
+            return True
+        priority = priority or current_priority()
+        deadline = self.deadlines.get(priority, self.deadlines[BACKGROUND]) if deadline is None else deadline
+        waiter_id = uuid.uuid4().hex
+        started = self.clock()
+
+        while True:
+            try:
+                wait = await asyncio.to_thread(self.try_acquire, tokens, priority, waiter_id)
+            except Exception as e:
+                print(f"⚠️ AI quota storage unavailable ({e}) - not limiting this call")
+                return True
+            if wait == 0:
+                return self._granted(started)
+
+            remaining = started + deadline - self.clock()
+            if remaining <= 0:
+                return await asyncio.to_thread(self._timed_out, waiter_id, priority)
+            await asyncio.sleep(min(wait, remaining, 1.0))
+
+    def _granted(self, started: float) -> bool:
+        waited = self.clock() - started
+        with self._lock:
+            self._stats['granted'] += 1
+            if waited > self.poll_interval:
+                self._stats['waited'] += 1
+                self._stats['wait_seconds'] += waited
+        return True
+
+    def _timed_out(self, waiter_id: str, priority: str) -> bool:
+        with self._lock:
+            self._stats['timed_out'] += 1
+        try:
+            self.store.connection().execute('DELETE FROM quota_waiters WHERE waiter_id = ?', (waiter_id,))
+        except Exception:
+            pass
+        print(f"⏳ AI quota: {priority} call gave up after waiting {self.deadlines.get(priority)}s")
+        return False
+
+    def settle(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Correct the token bucket once the response reports the real usage
+
+        An actual count of 0 refunds the whole estimate, for calls the
+        upstream rejected without generating anything.
+        """
+        if not self.enabled or actual_tokens is None:
+            return
+        difference = float(actual_tokens - estimated_tokens)
+        try:
+            self.store.connection().execute(
+                'UPDATE quota_buckets SET level = MIN(?, level - ?) WHERE name = ?',
+                (self.capacities['tokens'], difference, 'tokens')
+            )
+        except Exception as e:
+            print(f"⚠️ AI quota settle failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        levels = {}
+        waiting = {}
+        try:
+            connection = self.store.connection()
+            levels = {name: round(level, 1) for name, level in connection.execute('SELECT name, level FROM quota_buckets')}
+            waiting = dict(connection.execute(
+                'SELECT priority, COUNT(*) FROM quota_waiters WHERE expires_at > ? GROUP BY priority', (self.clock(),)
+            ).fetchall())
+        except Exception:
+            pass
+        with self._lock:
+            counters = dict(self._stats)
+        return dict(
+            counters,
+            wait_seconds=round(counters['wait_seconds'], 3),
+            enabled=self.enabled,
+            requests_per_minute=self.capacities['requests'],
+            tokens_per_minute=self.capacities['tokens'],
+            bucket_levels=levels,
+            waiting=waiting
+        )
+
+quota_governor = QuotaGovernor(
+    storage_path=storage_path_from_url(current_config.RATELIMIT_STORAGE_URL, current_config.AI_RUNTIME_DB_PATH),
+    requests_per_minute=current_config.AI_QUOTA_RPM,
+    tokens_per_minute=current_config.AI_QUOTA_TPM,
+    background_reserve=current_config.AI_QUOTA_BACKGROUND_RESERVE,
+    interactive_deadline=current_config.AI_QUOTA_INTERACTIVE_DEADLINE,
+    background_deadline=current_config.AI_QUOTA_BACKGROUND_DEADLINE,
+    enabled=current_config.AI_QUOTA_ENABLED
+)
@@ -0,0 +1,200 @@
+"""
+Single-flight coalescing of identical concurrent generation requests.
+
+When a class starts the same test at the same moment, only the first caller
+for a key runs the upstream call; everyone else waits for it and gets a copy
+of its result. Callers in the same process wait on an in-memory event.
+Other worker processes on the host find the leader through a lease row in the
+shared runtime SQLite file and poll for the result it publishes there.
+"""
+import copy
+import json
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config.settings import current_config
+from database.local_store import LocalStore
+
+FLIGHT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS flight_leases (
+    flight_key TEXT PRIMARY KEY,
+    flight_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS flight_results (
+    flight_id TEXT PRIMARY KEY,
+    value TEXT,
+    created_at REAL NOT NULL
+);
+'''
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, disk_path: Optional[str] = None, lease_seconds: float = 90, poll_interval: float = 0.1,
+                 result_ttl: float = 60, enabled: bool = True, clock=time.time):
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.enabled = enabled
+        self.clock = clock
+        self.store = LocalStore(disk_path, FLIGHT_SCHEMA) if disk_path else None
+
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            'leaders': 0,
+            'coalesced_local': 0,
+            'coalesced_remote': 0,
+            'leader_failures': 0
+        }
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run fn() once for all concurrent callers with the same key
+
+        Returns (result, shared); shared is True when the result came from
+        another caller's call. Shared results are deep copies, so callers may
+        modify them freely. Results must be JSON-serialisable to be shared
+        across processes.
+        """
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            self._count('coalesced_local')
+            if not call.done.wait(self.lease_seconds):
+                print(f"⚠️ Single-flight leader for {key} timed out - generating independently")
+                return fn(), False
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+
+        try:
+            result, shared = self._do_across_processes(key, fn)
+            # Snapshot before waking followers; the caller may modify `result`
+            call.result = copy.deepcopy(result)
+            return result, shared
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_across_processes(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        if self.store is None:
+            self._count('leaders')
+            return fn(), False
+
+        flight_id = uuid.uuid4().hex
+        try:
+            owner = self._acquire_lease(key, flight_id)
+        except Exception as e:
+            print(f"⚠️ Single-flight lease unavailable ({e}) - generating independently")
+            return fn(), False
+
+        if owner != flight_id:
+            result = self._await_result(key, owner)
+            if result is not None:
+                self._count('coalesced_remote')
+                return result, True
+            # Leader in another worker failed or vanished
+            return fn(), False
+
+        self._count('leaders')
+        result = None
+        try:
+            result = fn()
+            return result, False
+        except BaseException:
+            self._count('leader_failures')
+            raise
+        finally:
+            self._publish(key, flight_id, result)
+
+    def _acquire_lease(self, key: str, flight_id: str) -> str:
+        """Take the lease for `key` unless a live one exists; returns the owning flight id"""
+        connection = self.store.connection()
+        now = self.clock()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT flight_id, expires_at FROM flight_leases WHERE flight_key = ?', (key,)
+            ).fetchone()
+            if row and row[1] > now:
+                connection.execute('COMMIT')
+                return row[0]
+            connection.execute(
+                'INSERT OR REPLACE INTO flight_leases (flight_key, flight_id, expires_at) VALUES (?, ?, ?)',
+                (key, flight_id, now + self.lease_seconds)
+            )
+            connection.execute('COMMIT')
+            return flight_id
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _await_result(self, key: str, flight_id: str) -> Any:
+        """Poll for the result of another worker's flight; None if it failed or its lease lapsed"""
+        connection = self.store.connection()
+        deadline = self.clock() + self.lease_seconds
+        while self.clock() < deadline:
+            try:
+                row = connection.execute(
+                    'SELECT value FROM flight_results WHERE flight_id = ?', (flight_id,)
+                ).fetchone()
+                if row is not None:
+                    return json.loads(row[0]) if row[0] is not None else None
+
+                lease = connection.execute(
+                    'SELECT expires_at FROM flight_leases WHERE flight_key = ? AND flight_id = ?', (key, flight_id)
+                ).fetchone()
+                if lease is None or lease[0] <= self.clock():
+                    return None
+            except Exception as e:
+                print(f"⚠️ Single-flight result poll failed: {e}")
+                return None
+            time.sleep(self.poll_interval)
+        return None
+
+    def _publish(self, key: str, flight_id: str, result: Any):
+        """Hand the result (None for a failure) to waiting workers and release the lease"""
+        try:
+            now = self.clock()
+            value = json.dumps(result) if result is not None else None
+            connection = self.store.connection()
+            connection.execute(
+                'INSERT OR REPLACE INTO flight_results (flight_id, value, created_at) VALUES (?, ?, ?)',
+                (flight_id, value, now)
+            )
+            connection.execute('DELETE FROM flight_leases WHERE flight_key = ? AND flight_id = ?', (key, flight_id))
+            connection.execute('DELETE FROM flight_results WHERE created_at < ?', (now - self.result_ttl,))
+        except Exception as e:
+            print(f"⚠️ Single-flight publish failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
+
+single_flight = SingleFlight(
+    disk_path=current_config.AI_RUNTIME_DB_PATH,
+    lease_seconds=current_config.SINGLE_FLIGHT_LEASE_SECONDS,
+    enabled=current_config.SINGLE_FLIGHT_ENABLED
+)
@@ -0,0 +1,298 @@
+"""
+Background test creation for the job mode of POST /tests/start.
+
+The request returns 202 with a job id straight away and a bounded pool of
+worker threads runs generation and persistence, so slow generation no longer
+holds an HTTP connection and a server worker for its whole duration. Jobs are
+rows in the main database: any worker process can answer the client's polls,
+which report how many questions are ready and, once finished, the same
+response start_test would have returned.
+
+While a process holds a job, queued or running, a heartbeat thread keeps
+the job's heartbeat_at fresh. A poll fails a job only once its heartbeat is
+older than stale_seconds, which means the process that held it is gone.
+The outcome of a job is written with a conditional UPDATE, so a stale check
+and a worker that finishes late cannot overwrite each other.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import current_config
+from database.connection import db
+from models.test import TestResult
+from models.test_job import TestJob
+
+class TestJobService:
+    def __init__(self, workers: int = 8, max_pending: int = 200, stale_seconds: float = 300,
+                 retention_hours: float = 24, progress_interval: float = 0.5):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.stale_seconds = stale_seconds
+        self.retention_hours = retention_hours
+        self.progress_interval = progress_interval
+        self.app = None
+        self.test_service = None
+        self._executor = None
+        self._pending = 0
+        self._active = set()  # Ids of the jobs this process has queued or running
+        self._heartbeat = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0
+        }
+
+    def init_app(self, app):
+        """Remember the Flask app so job threads can open an app context"""
+        self.app = app
+
+    def bind_test_service(self, test_service):
+        """Use the given TestService to run jobs (first binding wins)"""
+        if self.test_service is None:
+            self.test_service = test_service
+
+    def submit(self, user_id: int, subject_id: int, topic_id: Optional[int] = None, question_count: int = 10,
+               fresh: bool = True) -> Tuple[Dict[str, Any], int]:
+        """Queue the creation of a test; returns the 202 response body with the job id"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                return {
+                    'success': False,
+                    'message': 'Too many tests are being prepared right now. Please try again shortly.'
+                }, 503
+            self._pending += 1
+            self._stats['submitted'] += 1
+
+        job = None
+        try:
+            job = TestJob(uuid.uuid4().hex, int(user_id), subject_id, question_count, topic_id, fresh)
+            db.session.add(job)
+            db.session.commit()
+            with self._lock:
+                self._active.add(job.id)
+            self._prune()
+            self._start_heartbeat()
+            self._get_executor().submit(self._run, job.id)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                if job is not None:
+                    self._active.discard(job.id)
+            raise
+
+        print(f"📨 Queued test job {job.id} ({question_count} questions)")
+        return {
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': f'/api/v1/tests/jobs/{job.id}',
+            'message': 'Your test is being prepared.'
+        }, 202
+
+    def get(self, job_id: str, user_id: int) -> Tuple[Dict[str, Any], int]:
+        """Job status, progress and, once completed, the created test"""
+        job = TestJob.query.get(job_id)
+        if not job or str(job.user_id) != str(user_id):
+            return {
+                'success': False,
+                'message': 'Test job not found'
+            }, 404
+
+        # A job whose worker process died never finishes on its own
+        if self._is_stale(job):
+            self._fail(job, 'Test preparation was interrupted. Please start the test again.', 500)
+            db.session.commit()
+
+        return dict(job.to_dict(), success=True), 200
+
+    def _is_stale(self, job: TestJob) -> bool:
+        if job.finished:
+            return False
+        with self._lock:
+            if job.id in self._active:
+                return False
+        last_seen = job.heartbeat_at or job.started_at or job.created_at
+        return last_seen < datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is not None or self.app is None:
+                return
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, name='test-job-heartbeat', daemon=True)
+            self._heartbeat.start()
+
+    def _heartbeat_loop(self):
+        while not self._stopping.wait(self.stale_seconds / 3):
+            try:
+                with self.app.app_context():
+                    try:
+                        self._beat()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                print(f"⚠️ Test job heartbeat failed: {e}")
+
+    def _beat(self):
+        """Refresh the heartbeat of every unfinished job this process holds"""
+        with self._lock:
+            job_ids = list(self._active)
+        if not job_ids:
+            return
+        try:
+            TestJob.query.filter(
+                TestJob.id.in_(job_ids),
+                TestJob.status.in_([TestJob.QUEUED, TestJob.RUNNING])
+            ).update({'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def shutdown(self):
+        """Stop the heartbeat and wait for the jobs already handed to the executor"""
+        self._stopping.set()
+        with self._lock:
+            executor, heartbeat = self._executor, self._heartbeat
+            self._executor = self._heartbeat = None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if heartbeat is not None:
+            heartbeat.join()
+        self._stopping.clear()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='test-job')
+        return self._executor
+
+    def _run(self, job_id: str):
+        try:
+            with self.app.app_context():
+                try:
+                    self._execute(job_id)
+                except Exception as e:
+                    print(f"⚠️ Test job {job_id} failed: {e}")
+                    db.session.rollback()
+                    job = TestJob.query.get(job_id)
+                    if job and not job.finished:
+                        self._fail(job, f'Failed to start test: {str(e)}', 500)
+                        db.session.commit()
+                finally:
+                    db.session.remove()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._active.discard(job_id)
+
+    def _execute(self, job_id: str):
+        now = datetime.utcnow()
+        started = TestJob.query.filter(TestJob.id == job_id, TestJob.status == TestJob.QUEUED).update(
+            {'status': TestJob.RUNNING, 'started_at': now, 'heartbeat_at': now}, synchronize_session=False
+        )
+        db.session.commit()
+        # Gone, or failed as stale while it waited in the queue
+        if not started:
+            return
+        job = TestJob.query.get(job_id)
+
+        questions = []
+        done = error = None
+        last_progress = time.monotonic()
+        # The streaming path reports each question as it is ready, which is the job's progress
+        events = self.test_service.start_test_stream(
+            user_id=job.user_id,
+            subject_id=job.subject_id,
+            topic_id=job.topic_id,
+            question_count=job.question_count,
+            fresh=job.fresh
+        )
+        for event in events:
+            if event['type'] == 'test':
+                job.test_id = event['test_id']
+                db.session.commit()
+            elif event['type'] == 'question':
+                questions.append(event['question'])
+                if time.monotonic() - last_progress >= self.progress_interval:
+                    job.questions_ready = len(questions)
+                    db.session.commit()
+                    last_progress = time.monotonic()
+            elif event['type'] == 'done':
+                done = event
+            elif event['type'] == 'error':
+                error = event
+
+        job.questions_ready = len(questions)
+        test_result = TestResult.query.get(job.test_id) if job.test_id else None
+        if done and test_result:
+            # The student only sees the questions now, so the timer starts now
+            test_result.started_at = datetime.utcnow()
+            finished = self._finish(job, status=TestJob.COMPLETED, status_code=200,
+                                    result=self.test_service.build_start_response(test_result, questions))
+            if finished:
+                self._count('completed')
+        else:
+            finished = self._fail(job, (error or {}).get('message', 'Failed to generate questions. Please try again.'),
+                                  (error or {}).get('status', 500))
+        if not finished:
+            # A poll failed the job as stale meanwhile; the client was already told to start again
+            db.session.rollback()
+            print(f"⚠️ Test job {job_id} finished after it was failed as stale; result dropped")
+            return
+        db.session.commit()
+        print(f"📬 Test job {job_id} {job.status} with {len(questions)} questions")
+
+    def _fail(self, job: TestJob, message: str, status_code: int) -> bool:
+        failed = self._finish(job, status=TestJob.FAILED, error=message, status_code=status_code)
+        if failed:
+            self._count('failed')
+        return failed
+
+    def _finish(self, job: TestJob, **values) -> bool:
+        """Write the job's outcome unless it already has one; True if this call finished it"""
+        values['finished_at'] = datetime.utcnow()
+        db.session.flush()
+        updated = TestJob.query.filter(
+            TestJob.id == job.id,
+            TestJob.status.in_([TestJob.QUEUED, TestJob.RUNNING])
+        ).update(values, synchronize_session=False)
+        # The bulk update bypasses the session, so reload the job on next access
+        db.session.expire(job)
+        return updated == 1
+
+    def _prune(self):
+        """Delete finished jobs past the retention period"""
+        cutoff = datetime.utcnow() - timedelta(hours=self.retention_hours)
+        try:
+            TestJob.query.filter(
+                TestJob.status.in_([TestJob.COMPLETED, TestJob.FAILED]),
+                TestJob.created_at < cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️ Test job cleanup failed: {e}")
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, pending=self._pending, workers=self.workers)
+
+test_job_service = TestJobService(
+    workers=current_config.TEST_JOB_WORKERS,
+    max_pending=current_config.TEST_JOB_MAX_PENDING,
+    stale_seconds=current_config.TEST_JOB_STALE_SECONDS,
+    retention_hours=current_config.TEST_JOB_RETENTION_HOURS
+)
@@ -1,14 +1,18 @@
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 import random
 
 from database.connection import db
-from models.test import TestResult, TestAnswer
+from models.test import TestResult, TestAnswer, TestQuestion
 from models.question import Question
 from models.subject import Subject
 from models.topic import Topic
 from services.question_service import QuestionService
+from services.near_duplicates import near_duplicates
+from services.explanation_service import explanation_service
+from services.question_writer import question_writer
 from enum import Enum
 
 class TestStatus(Enum):
@@ -19,9 +23,17 @@ class TestStatus(Enum):
 class TestService:
     def __init__(self):
         self.question_service = QuestionService()
+        self.near_duplicates = near_duplicates
+        self.explanation_service = explanation_service
+        self.question_writer = question_writer
+        self.question_writer.bind_test_service(self)
     
-    def start_test(self, user_id: int, subject_id: int, topic_id: int = None, question_count: int = 10) -> Dict[str, Any]:
-        """Start a new test session with timer functionality"""
+    def start_test(self, user_id: int, subject_id: int, topic_id: int = None, question_count: int = 10, fresh: bool = True) -> Dict[str, Any]:
+        """Start a new test session with timer functionality
+        
+        Questions bypass the generation cache unless fresh=False, so students
+        and retakes do not all get the same cached set.
+        """
         try:
             # Validate subject
             subject = Subject.query.get(subject_id)
@@ -52,7 +64,9 @@ class TestService:
                 subject_id=subject_id,
                 topic_id=topic_id,
                 num_questions=question_count,
-                difficulty='medium'  # Default difficulty for tests
+                difficulty='medium',  # Default difficulty for tests
+                use_inventory=True,
+                fresh=fresh
             )
             
             if not question_result.get('success'):
@@ -65,10 +79,9 @@ class TestService:
             generated_questions = question_result.get('questions', [])
             
             if len(generated_questions) < question_count:
-                return {
-                    'success': False,
-                    'message': f'Could not generate enough questions. Requested: {question_count}, Generated: {len(generated_questions)}'
-                }, 500
+                # Keep what was generated rather than making the student start over
+                print(f"⚠️ Starting a short test: {len(generated_questions)}/{question_count} questions available")
+                question_count = len(generated_questions)
             
             # Create test result record FIRST so we have subject_id and topic_id
             test_result = TestResult(
@@ -83,76 +96,169 @@ class TestService:
                 started_at=datetime.utcnow()
             )
             
-            db.session.add(test_result)
-            db.session.commit()
-            
-            # Save the original Azure OpenAI questions to database BEFORE transformation
-            print(f"🔧 DEBUG: Saving {len(generated_questions)} original questions to database...")
-            for i, gq in enumerate(generated_questions):
-                print(f"  Original Question {i}: ID={gq.get('id')}, Keys={list(gq.keys())}")
-            question_id_mapping = self._save_test_questions_to_database(generated_questions, test_result.subject_id, test_result.topic_id)
-            print(f"🔧 DEBUG: Original questions saved. ID mapping: {question_id_mapping}")
+            # Commits the test with its questions pending; they reach the question bank in the background
+            self.question_writer.save(test_result, generated_questions)
             
             # Now format questions for frontend response - handle both database and direct Azure OpenAI formats
-            questions = []
-            for question in generated_questions:
-                # Handle both formats: database questions (with options dict) and direct Azure OpenAI responses
-                if 'options' in question:
-                    # Database question format
-                    options = question['options']
-                else:
-                    # Direct Azure OpenAI format - convert to options object
-                    options = {
-                        'A': question.get('option_a'),
-                        'B': question.get('option_b'),
-                        'C': question.get('option_c'),
-                        'D': question.get('option_d')
-                    }
-                
-                questions.append({
-                    'id': question.get('id'),  # For frontend compatibility
-                    'question_id': question.get('id'),  # For API consistency
-                    'question_text': question.get('question_text'),
-                    'options': options,
-                    'subject_id': question.get('subject_id'),
-                    'topic_id': question.get('topic_id')
-                })
+            questions = [self._format_question_for_client(question) for question in generated_questions]
             
             print(f"✅ Generated {len(questions)} fresh questions from Azure OpenAI!")
             
-            # Calculate timer (1 minute per question)
-            timer_minutes = question_count
-            timer_seconds = timer_minutes * 60
-            end_time = datetime.utcnow() + timedelta(minutes=timer_minutes)
+            return self.build_start_response(test_result, questions), 200
             
+        except Exception as e:
+            db.session.rollback()
             return {
-                'success': True,
+                'success': False,
+                'message': f'Failed to start test: {str(e)}'
+            }, 500
+    
+    def build_start_response(self, test_result: TestResult, questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """start_test response for a created test and its client-formatted questions"""
+        # Calculate timer (1 minute per question unless a different one was announced)
+        timer_minutes = test_result.time_limit_minutes()
+        timer_seconds = timer_minutes * 60
+        end_time = test_result.started_at + timedelta(minutes=timer_minutes)
+        
+        return {
+            'success': True,
+            'test_id': test_result.id,
+            'questions': questions,
+            'total_questions': len(questions),
+            'timer_minutes': timer_minutes,
+            'timer_seconds': timer_seconds,
+            'start_time': test_result.started_at.isoformat(),
+            'end_time': end_time.isoformat(),
+            'auto_submit_at': end_time.isoformat(),
+            'message': f'Test started! You have {timer_minutes} minutes to complete {len(questions)} questions.',
+            'instructions': [
+                f'Total time: {timer_minutes} minutes ({timer_seconds} seconds)',
+                'Test will auto-submit when timer expires',
+                'Each question is worth equal points',
+                'Choose the best answer for each question'
+            ]
+        }
+    
+    def start_test_stream(self, user_id: int, subject_id: int, topic_id: int = None, question_count: int = 10, fresh: bool = True) -> Iterator[Dict[str, Any]]:
+        """Streaming variant of start_test
+        
+        Yields a 'test' event with the test id and timer, then one 'question'
+        event per question as soon as it is available, then 'done'. Failures
+        are reported as an 'error' event.
+        """
+        try:
+            subject = Subject.query.get(subject_id)
+            if not subject:
+                yield {'type': 'error', 'status': 404, 'message': 'Subject not found'}
+                return
+            
+            if topic_id:
+                topic = Topic.query.get(topic_id)
+                if not topic or topic.subject_id != subject_id:
+                    yield {'type': 'error', 'status': 404, 'message': 'Topic not found or does not belong to the specified subject'}
+                    return
+            
+            test_result = TestResult(
+                user_id=user_id,
+                subject_id=subject_id,
+                topic_id=topic_id,
+                total_questions=question_count,
+                correct_answers=0,
+                score_percentage=0.0,
+                time_taken=0,
+                status=TestStatus.IN_PROGRESS.value,
+                started_at=datetime.utcnow(),
+                # Announced before the questions arrive, so it holds even if fewer do
+                timer_minutes=question_count
+            )
+            db.session.add(test_result)
+            db.session.commit()
+            
+            timer_minutes = test_result.timer_minutes
+            end_time = test_result.started_at + timedelta(minutes=timer_minutes)
+            yield {
+                'type': 'test',
                 'test_id': test_result.id,
-                'questions': questions,
-                'total_questions': len(questions),
+                'total_questions': question_count,
                 'timer_minutes': timer_minutes,
-                'timer_seconds': timer_seconds,
+                'timer_seconds': timer_minutes * 60,
                 'start_time': test_result.started_at.isoformat(),
                 'end_time': end_time.isoformat(),
-                'auto_submit_at': end_time.isoformat(),
-                'message': f'Test started! You have {timer_minutes} minutes to complete {question_count} questions.',
-                'instructions': [
-                    f'Total time: {timer_minutes} minutes ({timer_seconds} seconds)',
-                    'Test will auto-submit when timer expires',
-                    'Each question is worth equal points',
-                    'Choose the best answer for each question'
-                ]
-            }, 200
+                'auto_submit_at': end_time.isoformat()
+            }
+            
+            generated_questions = []
+            for question in self.question_service.stream_questions(
+                subject_id=subject_id,
+                topic_id=topic_id,
+                num_questions=question_count,
+                difficulty='medium',
+                use_inventory=True,
+                fresh=fresh
+            ):
+                generated_questions.append(question)
+                yield {
+                    'type': 'question',
+                    'index': len(generated_questions) - 1,
+                    'question': self._format_question_for_client(question)
+                }
+            
+            if not generated_questions:
+                db.session.delete(test_result)
+                db.session.commit()
+                yield {'type': 'error', 'status': 500, 'message': 'Failed to generate questions. Please try again.'}
+                return
+            
+            if len(generated_questions) < question_count:
+                test_result.total_questions = len(generated_questions)
+                db.session.commit()
+            
+            self.question_writer.save(test_result, generated_questions)
+            
+            yield {
+                'type': 'done',
+                'test_id': test_result.id,
+                'total_questions': len(generated_questions),
+                'message': f'Test started! You have {timer_minutes} minutes to complete {len(generated_questions)} questions.'
+            }
             
         except Exception as e:
             db.session.rollback()
-            return {
-                'success': False,
-                'message': f'Failed to start test: {str(e)}'
-            }, 500
+            yield {'type': 'error', 'status': 500, 'message': f'Failed to start test: {str(e)}'}
+    
+    def _format_question_for_client(self, question: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a generated question for the frontend (no answer key)"""
+        # Handle both formats: database questions (with options dict) and direct Azure OpenAI responses
+        if 'options' in question:
+            # Database question format
+            options = question['options']
+        else:
+            # Direct Azure OpenAI format - convert to options object
+            options = {
+                'A': question.get('option_a'),
+                'B': question.get('option_b'),
+                'C': question.get('option_c'),
+                'D': question.get('option_d')
+            }
+        
+        return {
+            'id': question.get('id'),  # For frontend compatibility
+            'question_id': question.get('id'),  # For API consistency
+            'question_text': question.get('question_text'),
+            'options': options,
+            'subject_id': question.get('subject_id'),
+            'topic_id': question.get('topic_id')
+        }
     
-    def submit_test(self, test_id: int, answers: List[Dict[str, Any]], test_questions: List[Dict[str, Any]] = None, force_submit: bool = False) -> Dict[str, Any]:
-        """Submit test answers and calculate results"""
+    def submit_test(self, test_id: int, answers: List[Dict[str, Any]], force_submit: bool = False) -> Dict[str, Any]:
+        """Submit test answers and calculate results
+        
+        Answers are matched to the test's manifest by the question id the
+        client was given, or by their 'position' in the test, and graded
+        against the answer key stored when the test started. Questions without
+        an answer count as not attempted. Tests started before manifests were
+        written are graded from the bank questions the client answered.
+        """
         try:
             # Get test result
             test_result = TestResult.query.get(test_id)
@@ -168,162 +274,89 @@ class TestService:
                     'message': 'Test already completed'
                 }, 400
             
+            # Answers are saved against the bank's question rows, so the test's questions must be stored first
+            if not self.question_writer.flush(test_id, on_submit=True):
+                return {
+                    'success': False,
+                    'message': 'Your answers could not be saved right now. Please submit again.'
+                }, 503
+            
             # Calculate time taken
             time_taken = int((datetime.utcnow() - test_result.started_at).total_seconds())
             
             # Check if test expired - but don't block submission, just flag it
-            expected_duration = test_result.total_questions * 60  # 1 minute per question
+            expected_duration = test_result.time_limit_minutes() * 60
             is_expired = time_taken > expected_duration
             
-            # Create question ID mapping for questions that should already be in database
-            question_id_mapping = {}
-            if test_questions:
-                print(f"🔧 DEBUG: Creating mapping for {len(test_questions)} test questions...")
-                for i, tq in enumerate(test_questions):
-                    print(f"  Question {i}: ID={tq.get('id')}, Text='{tq.get('question_text', '')[:50]}...'")
-                    
-                    # Find existing question in database by question text and subject
-                    existing_question = Question.query.filter_by(
-                        question_text=tq.get('question_text'),
-                        subject_id=test_result.subject_id
-                    ).first()
-                    
-                    if existing_question:
-                        question_id_mapping[str(tq.get('id'))] = existing_question.id
-                        print(f"🔧 DEBUG: Mapped {tq.get('id')} -> {existing_question.id}")
-                    else:
-                        print(f"⚠️ Warning: Question not found in database: {tq.get('question_text', '')[:50]}...")
-                
-                print(f"🔧 DEBUG: Question ID mapping created: {question_id_mapping}")
-            else:
-                print("🔧 DEBUG: No test_questions provided to submit_test")
+            # One indexed read of the manifest instead of looking questions up from what the client sends
+            manifest = TestQuestion.query.filter_by(test_result_id=test_id).order_by(TestQuestion.position).all()
+            # A rebuilt manifest is in answer order, so positions the client sends do not index it
+            by_position = bool(manifest)
+            if not manifest:
+                manifest = self._legacy_manifest(test_result, answers)
+            if not manifest:
+                return {
+                    'success': False,
+                    'message': 'Questions of this test were not found'
+                }, 404
+            by_client_id = {entry.client_id: entry for entry in manifest if entry.client_id is not None}
+            submitted = {}
+            for answer_data in answers:
+                entry = by_client_id.get(str(answer_data.get('question_id')))
+                position = answer_data.get('position')
+                if entry is None and by_position and isinstance(position, int) and 0 <= position < len(manifest):
+                    entry = manifest[position]
+                if entry is not None:
+                    submitted[entry.position] = answer_data
+            questions = {
+                question.id: question
+                for question in Question.query.filter(Question.id.in_([entry.question_id for entry in manifest if entry.question_id])).all()
+            }
             
-            # Process answers and get all questions for this test
             correct_count = 0
+            attempted_questions = 0
             answer_details = []
-            answered_question_ids = set()
+            review_question_ids = []  # Wrong or skipped questions; their explanations are written first
             
-            # First, process submitted answers
-            for answer_data in answers:
-                question_identifier = answer_data.get('question_id')
-                user_answer = answer_data.get('answer', '').strip().upper()
-                answered_question_ids.add(question_identifier)
-                
-                print(f"🔧 DEBUG: Processing answer - question_id: '{question_identifier}', user_answer: '{user_answer}'")
-                
-                # Handle both database questions and fresh Azure OpenAI questions
-                question = None
-                correct_answer = None
-                question_text = ""
-                explanation = ""
-                options = {}
-                actual_question_id = None
-                
-                # Try to get from database first
-                if isinstance(question_identifier, int) or (isinstance(question_identifier, str) and question_identifier.isdigit()):
-                    question = Question.query.get(int(question_identifier))
-                    if question:
-                        actual_question_id = question.id
-                
-                # Store fresh question data for later use
-                fresh_question_data = None
-                if not question:
-                    # Fresh question from Azure OpenAI - find it in test_questions and mapping
-                    for tq in test_questions or []:
-                        if str(tq.get('id')) == str(question_identifier):
-                            fresh_question_data = tq
-                            break
-                    
-                    if fresh_question_data:
-                        correct_answer = fresh_question_data.get('correct_answer')
-                        question_text = fresh_question_data.get('question_text', '')
-                        explanation = fresh_question_data.get('explanation', '')
-                        
-                        # Handle both question formats: original Azure OpenAI (option_a/option_b/etc.) 
-                        # and transformed format (options object)
-                        if 'options' in fresh_question_data and fresh_question_data['options']:
-                            # Transformed format with options object
-                            options_obj = fresh_question_data['options']
-                            options = {
-                                'A': options_obj.get('A'),
-                                'B': options_obj.get('B'),
-                                'C': options_obj.get('C'),
-                                'D': options_obj.get('D')
-                            }
-                        else:
-                            # Original Azure OpenAI format with individual option fields
-                            options = {
-                                'A': fresh_question_data.get('option_a'),
-                                'B': fresh_question_data.get('option_b'),
-                                'C': fresh_question_data.get('option_c'),
-                                'D': fresh_question_data.get('option_d')
-                            }
-                        
-                        # Get the mapped database question ID
-                        actual_question_id = question_id_mapping.get(str(question_identifier))
-                        if actual_question_id:
-                            question = Question.query.get(actual_question_id)
-                
-                if question:
-                    # Use database question data
-                    correct_answer = question.correct_answer
-                    question_text = question.question_text
-                    explanation = question.explanation
-                    options = question.get_options()
-                    actual_question_id = question.id
+            for entry in manifest:
+                answer_data = submitted.get(entry.position, {})
+                user_answer = (answer_data.get('answer') or '').strip().upper()
+                question = questions.get(entry.question_id)
                 
                 # Only count as attempted if user provided an answer
                 is_attempted = bool(user_answer)
-                is_correct = False
-                
-                if is_attempted and correct_answer:
-                    is_correct = user_answer == correct_answer.upper()
-                    if is_correct:
-                        correct_count += 1
-                
-                # Save test answer - ALWAYS save, even if mapping fails
-                save_question_id = actual_question_id
-                print(f"🔧 DEBUG: actual_question_id = {actual_question_id}")
-                print(f"🔧 DEBUG: fresh_question_data available = {fresh_question_data is not None}")
-                
-                if not save_question_id and fresh_question_data:
-                    # If mapping failed but we have fresh question data, create/find the question
-                    print(f"🔧 DEBUG: Mapping failed for '{question_identifier}', creating question in database...")
-                    save_question_id = self._ensure_question_exists(fresh_question_data, test_result.subject_id, test_result.topic_id)
-                    print(f"🔧 DEBUG: Created/found question with ID: {save_question_id}")
+                is_correct = is_attempted and user_answer == entry.correct_answer
+                attempted_questions += is_attempted
+                correct_count += is_correct
                 
-                if save_question_id:
-                    print(f"🔧 DEBUG: Saving TestAnswer with question_id: {save_question_id}")
-                    test_answer = TestAnswer(
+                if question:
+                    db.session.add(TestAnswer(
                         test_result_id=test_id,
-                        question_id=save_question_id,
+                        question_id=question.id,
                         user_answer=user_answer if is_attempted else None,
                         is_correct=is_correct,
                         time_taken=answer_data.get('time_taken', 0)
-                    )
-                    db.session.add(test_answer)
+                    ))
+                    if not is_correct and not (entry.explanation or '').strip():
+                        review_question_ids.append(question.id)
                 else:
-                    print(f"🔧 DEBUG: FAILED to get question_id for '{question_identifier}' - TestAnswer NOT saved!")
-                    print(f"🔧 DEBUG: Debug info - actual_question_id: {actual_question_id}, fresh_question_data: {fresh_question_data is not None}")
-                    if fresh_question_data:
-                        print(f"🔧 DEBUG: Fresh question data keys: {list(fresh_question_data.keys())}")
-                        print(f"🔧 DEBUG: Fresh question text: {fresh_question_data.get('question_text', 'N/A')[:50]}...")
+                    print(f"⚠️ Question {entry.position} of test {test_id} is not in the bank - answer graded but not saved")
                 
-                # Add to answer details
+                explanation = self._served_explanation(entry, question)
                 answer_details.append({
-                    'question_id': actual_question_id or question_identifier,
-                    'question_text': question_text,
+                    'question_id': entry.question_id or entry.client_id,
+                    'question_text': self._served_text(entry, question),
                     'user_answer': user_answer if is_attempted else 'Not Attempted',
-                    'correct_answer': correct_answer,
+                    'correct_answer': entry.correct_answer,
                     'is_correct': is_correct,
                     'is_attempted': is_attempted,
                     'explanation': explanation,
-                    'options': options
+                    'explanation_pending': not (explanation or '').strip(),
+                    'options': self._served_options(entry, question)
                 })
             
             # Calculate score using NEET marking scheme
-            total_submitted_questions = len(answers)
-            attempted_questions = len([a for a in answers if a.get('answer', '').strip()])
+            total_submitted_questions = len(manifest)
             wrong_answers = attempted_questions - correct_count
             not_attempted = total_submitted_questions - attempted_questions
             
@@ -347,6 +380,7 @@ class TestService:
             test_result.completed_at = datetime.utcnow()
             
             db.session.commit()
+            self.explanation_service.request(review_question_ids)
             
             # Generate performance analysis
             performance = self._analyze_performance(score_percentage, time_taken, expected_duration)
@@ -392,7 +426,7 @@ class TestService:
             # Calculate time details
             now = datetime.utcnow()
             time_elapsed = int((now - test_result.started_at).total_seconds())
-            expected_duration = test_result.total_questions * 60  # 1 minute per question
+            expected_duration = test_result.time_limit_minutes() * 60
             time_remaining = max(0, expected_duration - time_elapsed)
             
             # Check if test should be auto-expired
@@ -438,18 +472,31 @@ class TestService:
             # Get all test answers
             test_answers = TestAnswer.query.filter_by(test_result_id=test_id).all()
             
+            questions = {question.id: question for question in
+                         Question.query.filter(Question.id.in_([answer.question_id for answer in test_answers])).all()}
+            # The questions as they were served, where the manifest kept them
+            served = {}
+            for entry in TestQuestion.query.filter_by(test_result_id=test_id).order_by(TestQuestion.position).all():
+                served.setdefault(entry.question_id, entry)
+            # Explanations deferred at generation time are written on the first view
+            self.explanation_service.ensure([question for question_id, question in questions.items()
+                                             if not (getattr(served.get(question_id), 'explanation', None) or '').strip()])
+            
             answer_details = []
             for answer in test_answers:
-                question = Question.query.get(answer.question_id)
+                question = questions.get(answer.question_id)
                 if question:
+                    entry = served.get(question.id)
+                    explanation = self._served_explanation(entry, question)
                     answer_details.append({
                         'question_id': question.id,
-                        'question_text': question.question_text,
+                        'question_text': self._served_text(entry, question),
                         'user_answer': answer.user_answer,
-                        'correct_answer': question.correct_answer,
+                        'correct_answer': entry.correct_answer if entry else question.correct_answer,
                         'is_correct': answer.is_correct,
-                        'explanation': question.explanation,
-                        'options': question.get_options(),
+                        'explanation': explanation,
+                        'explanation_pending': not (explanation or '').strip(),
+                        'options': self._served_options(entry, question),
                         'time_taken': answer.time_taken
                     })
             
@@ -457,7 +504,7 @@ class TestService:
             performance = self._analyze_performance(
                 test_result.score_percentage,
                 test_result.time_taken or 0,
-                test_result.total_questions * 60
+                test_result.time_limit_minutes() * 60
             )
             
             # Safely get new columns with fallbacks
@@ -741,154 +788,104 @@ class TestService:
         
         return suggestions
 
-    def _save_test_questions_to_database(self, test_questions: List[Dict[str, Any]], subject_id: int, topic_id: int = None) -> Dict[str, int]:
-        """Save fresh Azure OpenAI questions to database for test history and return mapping"""
-        question_id_mapping = {}
-        try:
-            for i, question_data in enumerate(test_questions):
-                print(f"🔧 DEBUG: Processing question {i} for saving - keys: {list(question_data.keys())}")
-                print(f"🔧 DEBUG: Question {i} data: {question_data}")
-                
-                # Check if question already exists (avoid duplicates)
-                existing_question = Question.query.filter_by(
-                    question_text=question_data.get('question_text'),
-                    subject_id=subject_id
-                ).first()
-                
-                if existing_question:
-                    # Use existing question
-                    question_id_mapping[str(question_data.get('id'))] = existing_question.id
-                    print(f"🔧 DEBUG: Using existing question with ID: {existing_question.id}")
-                else:
-                    # Handle both question formats: original Azure OpenAI (option_a/option_b/etc.) 
-                    # and transformed format (options object)
-                    if 'options' in question_data and question_data['options']:
-                        # Transformed format with options object
-                        print(f"🔧 DEBUG: Question {i} has transformed format with options object")
-                        options = question_data['options']
-                        option_a = options.get('A')
-                        option_b = options.get('B')
-                        option_c = options.get('C')
-                        option_d = options.get('D')
-                        print(f"🔧 DEBUG: Extracted options - A: {option_a}, B: {option_b}, C: {option_c}, D: {option_d}")
-                    else:
-                        # Original Azure OpenAI format with individual option fields
-                        print(f"🔧 DEBUG: Question {i} has original format with individual option fields")
-                        option_a = question_data.get('option_a')
-                        option_b = question_data.get('option_b')
-                        option_c = question_data.get('option_c')
-                        option_d = question_data.get('option_d')
-                        print(f"🔧 DEBUG: Direct options - A: {option_a}, B: {option_b}, C: {option_c}, D: {option_d}")
-                    
-                    # Validate that we have the required options
-                    if not all([option_a, option_b, option_c, option_d]):
-                        print(f"⚠️ Skipping question {i} - missing option data")
-                        continue
-                    
-                    # Create new question in database
-                    new_question = Question(
-                        question_text=question_data.get('question_text'),
-                        option_a=option_a,
-                        option_b=option_b,
-                        option_c=option_c,
-                        option_d=option_d,
-                        correct_answer=question_data.get('correct_answer'),
-                        explanation=question_data.get('explanation', ''),
-                        subject_id=subject_id,
-                        topic_id=topic_id,
-                        difficulty=question_data.get('difficulty', 'medium'),
-                        source='azure_openai'  # Mark as AI-generated
-                    )
-                    
-                    db.session.add(new_question)
-                    db.session.flush()  # Get the ID before commit
-                    question_id_mapping[str(question_data.get('id'))] = new_question.id
-                    print(f"🔧 DEBUG: Created new question with ID: {new_question.id}")
-                    
-            db.session.commit()
-            print(f"✅ Saved {len(question_id_mapping)} fresh questions to database")
-            
-        except Exception as e:
-            print(f"⚠️ Error saving questions to database: {e}")
-            db.session.rollback()
+    def _legacy_manifest(self, test_result: TestResult, answers: List[Dict[str, Any]]) -> List[TestQuestion]:
+        """Manifest for a test started before manifests were written, from the bank ids the client answered with
         
-        return question_id_mapping
-    
-    def _create_question_mapping(self, test_questions: List[Dict[str, Any]], answers: List[Dict[str, Any]]) -> Dict[str, int]:
-        """Create mapping from test question IDs to database question IDs"""
-        mapping = {}
-        
-        for answer in answers:
-            question_id = answer.get('question_id')
-            # Find matching test question
-            for tq in test_questions:
-                if str(tq.get('id')) == str(question_id):
-                    # Try to find in database
-                    saved_question = self._find_saved_question(tq)
-                    if saved_question:
-                        mapping[str(question_id)] = saved_question.id
-                    break
+        Such clients were given the bank id of stored questions; answers to
+        questions that were never stored cannot be graded and are left out.
+        The entries are added to the session, so they are committed with the
+        results and the test is shown from them afterwards.
+        """
+        question_ids = []
+        for answer_data in answers:
+            question_id = answer_data.get('question_id')
+            if isinstance(question_id, str) and question_id.isdigit():
+                question_id = int(question_id)
+            if isinstance(question_id, int) and not isinstance(question_id, bool) and question_id not in question_ids:
+                question_ids.append(question_id)
+        questions = {
+            question.id: question
+            for question in Question.query.filter(Question.id.in_(question_ids), Question.subject_id == test_result.subject_id).all()
+        }
         
-        return mapping
+        manifest = []
+        for question_id in question_ids:
+            question = questions.get(question_id)
+            if question:
+                manifest.append(TestQuestion(test_result.id, len(manifest), (question.correct_answer or '').strip().upper()[:1],
+                                             client_id=str(question_id), question_id=question_id))
+        if len(manifest) < len(answers):
+            print(f"⚠️ Test {test_result.id} has no manifest - grading {len(manifest)}/{len(answers)} answers found in the bank")
+        db.session.add_all(manifest)
+        return manifest
     
-    def _find_saved_question(self, question_data: Dict[str, Any]) -> Question:
-        """Find a saved question in database based on question data"""
-        try:
-            # Try to find by question text (most reliable)
-            question = Question.query.filter_by(
-                question_text=question_data.get('question_text')
-            ).first()
-            
-            return question
-            
-        except Exception as e:
-            print(f"Error finding saved question: {e}")
-            return None
+    def _served_text(self, entry: Optional[TestQuestion], question: Optional[Question]) -> str:
+        if entry is not None and entry.question_text:
+            return entry.question_text
+        return question.question_text if question else ''
     
-    def _ensure_question_exists(self, question_data: Dict[str, Any], subject_id: int, topic_id: int = None) -> int:
-        """Ensure a question exists in database and return its ID"""
-        try:
-            print(f"🔧 DEBUG: _ensure_question_exists called with question_data keys: {list(question_data.keys())}")
-            print(f"🔧 DEBUG: Question data: {question_data}")
-            
-            # Try to find existing question first
-            existing_question = Question.query.filter_by(
-                question_text=question_data.get('question_text'),
-                subject_id=subject_id
-            ).first()
-            
-            if existing_question:
-                print(f"🔧 DEBUG: Found existing question with ID: {existing_question.id}")
-                return existing_question.id
-            
-            # Handle both question formats: original Azure OpenAI (option_a/option_b/etc.) 
-            # and transformed format (options object)
-            if 'options' in question_data and question_data['options']:
-                # Transformed format with options object
-                print(f"🔧 DEBUG: Using transformed format with options object")
-                options = question_data['options']
-                option_a = options.get('A')
-                option_b = options.get('B')
-                option_c = options.get('C')
-                option_d = options.get('D')
-                print(f"🔧 DEBUG: Extracted options - A: {option_a}, B: {option_b}, C: {option_c}, D: {option_d}")
-            else:
-                # Original Azure OpenAI format with individual option fields
-                print(f"🔧 DEBUG: Using original format with individual option fields")
-                option_a = question_data.get('option_a')
-                option_b = question_data.get('option_b')
-                option_c = question_data.get('option_c')
-                option_d = question_data.get('option_d')
-                print(f"🔧 DEBUG: Direct options - A: {option_a}, B: {option_b}, C: {option_c}, D: {option_d}")
-            
-            # Validate that we have the required options
-            if not all([option_a, option_b, option_c, option_d]):
-                print(f"⚠️ Missing option data - A: {option_a}, B: {option_b}, C: {option_c}, D: {option_d}")
-                print(f"⚠️ Original question data: {question_data}")
-                return None
-            
-            # Create new question if not found
-            new_question = Question(
+    def _served_options(self, entry: Optional[TestQuestion], question: Optional[Question]) -> Dict[str, Any]:
+        if entry is not None and entry.options:
+            return entry.options
+        return question.get_options() if question else {}
+    
+    def _served_explanation(self, entry: Optional[TestQuestion], question: Optional[Question]) -> str:
+        """The explanation served with the question, else the bank's (deferred explanations are written there)"""
+        if entry is not None and (entry.explanation or '').strip():
+            return entry.explanation
+        return question.explanation if question else ''
+    
+    def _extract_options(self, question_data: Dict[str, Any]) -> Tuple[Any, Any, Any, Any]:
+        """Read options from the original AI format (option_a..option_d) or the transformed format (options object)"""
+        if 'options' in question_data and question_data['options']:
+            options = question_data['options']
+            return options.get('A'), options.get('B'), options.get('C'), options.get('D')
+        return (
+            question_data.get('option_a'),
+            question_data.get('option_b'),
+            question_data.get('option_c'),
+            question_data.get('option_d')
+        )
+    
+    def _persist_questions(self, questions: List[Dict[str, Any]], subject_id: int,
+                           topic_id: int = None) -> Tuple[List[Optional[int]], List[Tuple]]:
+        """Insert questions missing from the bank and return the database ID of each one
+        
+        Existing questions are found with one batched (subject_id, content_hash)
+        probe and new ones are written with a single INSERT that ignores rows
+        another worker inserted concurrently. Cost stays flat as the bank grows.
+        Questions of mixed tests carry their own topic_id, which takes precedence
+        over `topic_id` when it is one of the subject's topics.
+        Paraphrases of stored questions (or of each other) are still stored, since
+        answers are graded against them, but inactive so the bank never serves them.
+        Does not commit; returns None for questions that cannot be stored, and
+        the near-duplicate index entries of the new rows, for _index_questions
+        once the caller's commit succeeds.
+        """
+        content_hashes = [Question.compute_content_hash(q.get('question_text')) for q in questions]
+        known_ids = Question.find_ids_by_content_hashes(subject_id, content_hashes)
+        subject_topic_ids = {topic.id for topic in Topic.query.filter_by(subject_id=subject_id).all()}
+        
+        batch_index = self.near_duplicates.batch_index()
+        signatures = {}
+        new_rows = {}
+        index_entries = []
+        for question_data, content_hash in zip(questions, content_hashes):
+            if content_hash in known_ids or content_hash in new_rows:
+                continue
+            
+            option_a, option_b, option_c, option_d = self._extract_options(question_data)
+            if not question_data.get('question_text') or not all([option_a, option_b, option_c, option_d]):
+                print(f"⚠️ Skipping question - missing text or option data: {str(question_data.get('question_text'))[:50]}...")
+                continue
+            question_topic_id = question_data.get('topic_id')
+            if question_topic_id not in subject_topic_ids:
+                question_topic_id = topic_id
+            if not question_topic_id:
+                print(f"⚠️ Skipping question - no topic to file it under: {question_data.get('question_text', '')[:50]}...")
+                continue
+            
+            question = Question(
                 question_text=question_data.get('question_text'),
                 option_a=option_a,
                 option_b=option_b,
@@ -897,17 +894,52 @@ class TestService:
                 correct_answer=question_data.get('correct_answer'),
                 explanation=question_data.get('explanation', ''),
                 subject_id=subject_id,
-                topic_id=topic_id,
+                topic_id=question_topic_id,
                 difficulty=question_data.get('difficulty', 'medium'),
-                source='azure_openai'
+                source='azure_openai'  # Mark as AI-generated
             )
             
-            db.session.add(new_question)
-            db.session.flush()  # Get the ID immediately
-            print(f"🔧 DEBUG: Created new question with ID: {new_question.id}")
-            return new_question.id
-            
-        except Exception as e:
-            print(f"⚠️ Error ensuring question exists: {e}")
-            print(f"⚠️ Question data that failed: {question_data}")
-            return None
+            signature = signatures[content_hash] = self.near_duplicates.signature(question.question_text)
+            near_duplicate = None
+            if signature is not None:
+                near_duplicate = self.near_duplicates.find(subject_id, question.question_text, signature) or batch_index.query(signature)
+                batch_index.add(content_hash, signature)
+            if near_duplicate:
+                print(f"🧬 Near-duplicate of question {near_duplicate[0]} (similarity {near_duplicate[1]:.2f}) - storing it inactive")
+            
+            new_rows[content_hash] = {
+                'question_text': question.question_text,
+                'option_a': question.option_a,
+                'option_b': question.option_b,
+                'option_c': question.option_c,
+                'option_d': question.option_d,
+                'correct_answer': question.correct_answer,
+                'explanation': question.explanation or '',
+                'difficulty_level': question.difficulty_level,
+                'is_active': near_duplicate is None,
+                'created_at': datetime.utcnow(),
+                'subject_id': subject_id,
+                'topic_id': question_topic_id,
+                'source': question.source,
+                'content_hash': content_hash
+            }
+        
+        if new_rows:
+            # The database is SQLite; ON CONFLICT DO NOTHING on the unique hash index
+            # makes concurrent saves of the same question safe without a round trip each
+            db.session.execute(
+                sqlite_insert(Question).on_conflict_do_nothing(index_elements=['subject_id', 'content_hash']),
+                list(new_rows.values())
+            )
+            known_ids.update(Question.find_ids_by_content_hashes(subject_id, new_rows.keys()))
+            index_entries = [
+                (known_ids[content_hash], subject_id, row['question_text'], signatures[content_hash])
+                for content_hash, row in new_rows.items() if known_ids.get(content_hash)
+            ]
+        
+        return [known_ids.get(content_hash) for content_hash in content_hashes], index_entries
+    
+    def _index_questions(self, index_entries: List[Tuple]):
+        """Add committed questions to the near-duplicate index (entries from _persist_questions)"""
+        for question_id, subject_id, question_text, signature in index_entries:
+            self.near_duplicates.add(question_id, subject_id, question_text, signature=signature)
@@ -0,0 +1,144 @@
+"""
+Output-token budgets learned from the responses Gemini actually returns.
+
+A fixed maxOutputTokens over-reserves for small requests and truncates
+large ones whose questions run longer than assumed. Every response reports
+how many output tokens it used for how many questions, and this keeps an
+exponentially weighted mean and variance of tokens per question for each
+(subject, difficulty). The JSON wrapper's overhead is taken off each
+response first, since budget() adds it back once per request. A request's
+budget is its question count times the mean plus a safety margin of
+standard deviations, and chunks are sized so their budget fits the
+per-request ceiling. A response that ran into its
+budget is a lower-bound sample, which pushes the estimate up.
+
+Keys without samples in this process start from the usage ledger, which
+every worker writes to, and otherwise from the configured default.
+"""
+import math
+import threading
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import current_config
+from services.ai_usage import ai_usage
+
+class TokenBudget:
+    def __init__(self, default_per_question: int = 350, max_output_tokens: int = 2048, overhead_tokens: int = 200,
+                 margin: float = 2.0, alpha: float = 0.1, min_samples: int = 5, usage=None):
+        self.default_per_question = default_per_question
+        self.max_output_tokens = max_output_tokens    # Ceiling for one request
+        self.overhead_tokens = overhead_tokens        # JSON wrapper around the questions
+        self.margin = margin                          # Standard deviations of headroom per question
+        self.alpha = alpha                            # Weight of the newest sample
+        self.min_samples = min_samples
+        self.usage = usage
+        self._lock = threading.Lock()
+        self._estimates: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._seeded = set()
+
+    def _key(self, subject: Optional[str], difficulty: Optional[str]) -> Tuple[str, str]:
+        return (subject or 'General', (difficulty or 'medium').lower())
+
+    def _estimate(self, key: Tuple[str, str]) -> Optional[Dict[str, float]]:
+        """Running estimate for a key, seeded from the usage ledger the first time it is needed"""
+        with self._lock:
+            if key in self._seeded:
+                return self._estimates.get(key)
+            self._seeded.add(key)
+
+        estimate = None
+        if self.usage is not None:
+            try:
+                mean, calls = self.usage.tokens_per_question(*key, overhead_tokens=self.overhead_tokens)
+            except Exception as e:
+                print(f"⚠️ Token budget seeding failed: {e}")
+                mean, calls = None, 0
+            if mean:
+                # The ledger keeps totals only, so the spread starts from a prior
+                estimate = {'mean': mean, 'variance': (mean / 4) ** 2, 'samples': min(calls, self.min_samples), 'truncated': 0}
+
+        with self._lock:
+            return self._estimates.setdefault(key, estimate) if estimate else self._estimates.get(key)
+
+    def per_question(self, subject: Optional[str], difficulty: Optional[str]) -> int:
+        """Output tokens to allow per question: learned mean plus the safety margin"""
+        estimate = self._estimate(self._key(subject, difficulty))
+        if not estimate or estimate['samples'] < self.min_samples:
+            return self.default_per_question
+        return math.ceil(estimate['mean'] + self.margin * math.sqrt(estimate['variance']))
+
+    def expected_tokens(self, subject: Optional[str], difficulty: Optional[str], count: int) -> int:
+        """Likely output tokens of a request, used to reserve quota"""
+        estimate = self._estimate(self._key(subject, difficulty))
+        if not estimate or estimate['samples'] < self.min_samples:
+            return count * self.default_per_question
+        return math.ceil(count * estimate['mean'])
+
+    def budget(self, subject: Optional[str], difficulty: Optional[str], count: int) -> int:
+        """maxOutputTokens for a request of `count` questions"""
+        return min(self.max_output_tokens, self.overhead_tokens + count * self.per_question(subject, difficulty))
+
+    def chunk_capacity(self, subject: Optional[str], difficulty: Optional[str]) -> int:
+        """Most questions one request can ask for without exceeding the ceiling"""
+        return max(1, (self.max_output_tokens - self.overhead_tokens) // self.per_question(subject, difficulty))
+
+    def observe(self, subject: Optional[str], difficulty: Optional[str], questions: int,
+                output_tokens: Optional[int], budget: int):
+        """Learn from one response that produced `questions` complete questions within `budget`"""
+        if not output_tokens:
+            return
+        truncated = output_tokens >= 0.95 * budget
+        question_tokens = output_tokens - self.overhead_tokens
+        if question_tokens <= 0:
+            return
+        if truncated:
+            # The question that was cut off needed at least its share of the budget
+            sample = question_tokens / (questions + 1)
+        elif questions:
+            sample = question_tokens / questions
+        else:
+            return
+
+        key = self._key(subject, difficulty)
+        self._estimate(key)
+        with self._lock:
+            estimate = self._estimates.get(key)
+            if estimate is None:
+                self._estimates[key] = {'mean': sample, 'variance': (sample / 4) ** 2, 'samples': 1, 'truncated': int(truncated)}
+                return
+            difference = sample - estimate['mean']
+            increment = self.alpha * difference
+            estimate['mean'] += increment
+            estimate['variance'] = (1 - self.alpha) * (estimate['variance'] + difference * increment)
+            estimate['samples'] += 1
+            estimate['truncated'] += int(truncated)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            estimates = {key: dict(estimate) for key, estimate in self._estimates.items()}
+        return {
+            'default_per_question': self.default_per_question,
+            'max_output_tokens': self.max_output_tokens,
+            'estimates': [
+                {
+                    'subject': subject,
+                    'difficulty': difficulty,
+                    'mean_tokens_per_question': round(estimate['mean'], 1),
+                    'stddev': round(math.sqrt(estimate['variance']), 1),
+                    'samples': estimate['samples'],
+                    'truncated': estimate['truncated'],
+                    'budget_per_question': self.per_question(subject, difficulty),
+                    'chunk_capacity': self.chunk_capacity(subject, difficulty)
+                }
+                for (subject, difficulty), estimate in sorted(estimates.items())
+            ]
+        }
+
+token_budget = TokenBudget(
+    default_per_question=current_config.GEMINI_TOKENS_PER_QUESTION,
+    max_output_tokens=current_config.GEMINI_MAX_OUTPUT_TOKENS,
+    margin=current_config.GEMINI_TOKEN_BUDGET_MARGIN,
+    alpha=current_config.GEMINI_TOKEN_BUDGET_ALPHA,
+    min_samples=current_config.GEMINI_TOKEN_BUDGET_MIN_SAMPLES,
+    usage=ai_usage
+)
@@ -0,0 +1,117 @@
+"""
+Topic-weighted mixes for tests that span a whole subject.
+
+A mixed test asks the model for all of its questions in one prompt together
+with an exact per-topic allocation, instead of one call per topic. The
+returned questions name their topic; TopicMix maps those names back to
+topic ids so every question is stored under a real topic.
+"""
+from typing import List, Dict, Any, Optional
+
+from models.topic import Topic
+from utils.helpers import normalize_question_text
+
+def allocate(weights: Dict[Any, float], count: int) -> Dict[Any, int]:
+    """Split `count` across the keys of `weights` proportionally (largest remainder)
+
+    Ties for the leftover units go to the earlier keys, so the same topics
+    and count always give the same allocation.
+    """
+    total = sum(weights.values())
+    if count <= 0 or total <= 0:
+        return {}
+
+    shares = {key: count * weight / total for key, weight in weights.items()}
+    counts = {key: int(share) for key, share in shares.items()}
+    leftover = count - sum(counts.values())
+    order = sorted(shares, key=lambda key: shares[key] - counts[key], reverse=True)  # Stable: ties keep key order
+    for key in order[:leftover]:
+        counts[key] += 1
+    return {key: n for key, n in counts.items() if n > 0}
+
+def split_counts(counts: Dict[str, int], chunk_sizes: List[int]) -> List[Dict[str, int]]:
+    """Deal an allocation out over chunks of the given sizes"""
+    names = [name for name, n in counts.items() for _ in range(n)]
+    chunks = []
+    start = 0
+    for size in chunk_sizes:
+        chunk = {}
+        for name in names[start:start + size]:
+            chunk[name] = chunk.get(name, 0) + 1
+        chunks.append(chunk)
+        start += size
+    return chunks
+
+def remaining_counts(counts: Dict[str, int], questions: List[Dict[str, Any]], missing: int) -> Dict[str, int]:
+    """Allocation for `missing` more questions, favouring topics the answer under-delivered"""
+    delivered = {}
+    for question in questions:
+        name = normalize_question_text(question.get('topic'))
+        delivered[name] = delivered.get(name, 0) + 1
+
+    names = []
+    for name, wanted in counts.items():
+        names += [name] * max(0, wanted - delivered.get(normalize_question_text(name), 0))
+    # Answers with unrecognised topic names leave no deficit to follow; cycle through the mix
+    cycle = [name for name in counts for _ in range(counts[name])]
+    while len(names) < missing and cycle:
+        names += cycle
+
+    remaining = {}
+    for name in names[:missing]:
+        remaining[name] = remaining.get(name, 0) + 1
+    return remaining
+
+class TopicMix:
+    """Per-topic allocation of a mixed test and the mapping of answers back to topic ids"""
+
+    def __init__(self, topics: List[Topic], count: int):
+        self.topics = {topic.name: topic for topic in topics}
+        self.counts = allocate({topic.name: 1.0 for topic in topics}, count)
+        self._by_normalized_name = {normalize_question_text(topic.name): topic for topic in topics}
+
+    @classmethod
+    def for_subject(cls, subject_id: int, count: int) -> Optional['TopicMix']:
+        """Even mix over the subject's active topics, or None when it has none"""
+        topics = Topic.query.filter_by(subject_id=subject_id, is_active=True).order_by(Topic.id).all()
+        return cls(topics, count) if topics else None
+
+    def tag(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Set topic_id on every question from the topic name the model gave it
+
+        Names that do not match a topic (model paraphrased or left 'General')
+        go to whichever topic is furthest below its allocation.
+        """
+        deficits = dict(self.counts)
+        unmatched = []
+        for question in questions:
+            topic = self._match(question.get('topic'))
+            if topic is None:
+                unmatched.append(question)
+                continue
+            question['topic_id'] = topic.id
+            question['topic'] = topic.name
+            deficits[topic.name] = deficits.get(topic.name, 0) - 1
+
+        for question in unmatched:
+            # max() keeps the first of equal deficits; an empty allocation falls back to the first topic
+            name = max(deficits, key=deficits.get) if deficits else next(iter(self.topics))
+            question['topic_id'] = self.topics[name].id
+            question['topic'] = name
+            deficits[name] = deficits.get(name, 0) - 1
+
+        if unmatched:
+            print(f"🏷️ Assigned {len(unmatched)} questions with unrecognised topic names by allocation")
+        return questions
+
+    def _match(self, name: Optional[str]) -> Optional[Topic]:
+        normalized = normalize_question_text(name)
+        if not normalized:
+            return None
+        if normalized in self._by_normalized_name:
+            return self._by_normalized_name[normalized]
+        # "Organic Chemistry - Alcohols", "Mechanics (Kinematics)" and the like
+        for topic_name, topic in self._by_normalized_name.items():
+            if topic_name in normalized:
+                return topic
+        return None
@@ -1,3 +1,5 @@
+import re
+
 def generate_question(subject, topic):
     # Placeholder function to generate a question based on subject and topic
     return {
@@ -20,4 +22,11 @@ def format_results(score):
     elif score >= 50:
         return "Average"
     else:
-        return "Needs Improvement"
\ No newline at end of file
+        return "Needs Improvement"
+
+def normalize_question_text(text):
+    """Canonical form of a question stem used for duplicate detection"""
+    if not text:
+        return ''
+    text = re.sub(r'[^\w\s]', ' ', str(text).lower())
+    return ' '.join(text.split())
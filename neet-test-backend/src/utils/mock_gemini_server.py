@@ -0,0 +1,375 @@
+"""
+Local stand-in for the Gemini generateContent API.
+
+Lets the test-start pipeline be load-tested offline without spending quota.
+Point the backend at it with GEMINI_API_BASE_URL and run it from src/:
+
+    python -m utils.mock_gemini_server --port 8089 --latency lognormal:1.5,0.4 --error-rate 0.02
+    GEMINI_API_BASE_URL=http://127.0.0.1:8089 GEMINI_API_KEY=mock python main.py
+
+Serves :generateContent and :streamGenerateContent (alt=sse) for any model
+and answers with schema-valid NEET questions for the count, subject, topic and
+difficulty found in the prompt. Latency, errors, truncated or fenced output
+and throughput limits are configurable; GET /stats reports what was served.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional
+
+COUNT_PATTERN = re.compile(r'Generate (\d+) high-quality NEET (\w+) multiple choice questions(?: focusing specifically on ([^.\n]+))?')
+DIFFICULTY_PATTERN = re.compile(r'Difficulty Level: (\w+)')
+MIX_PATTERN = re.compile(r'Topic Distribution[^\n]*\n[^\n]*\n((?:- [^\n]+: \d+\n?)+)')
+EXPLAIN_PATTERN = re.compile(r'^\[id: (\d+)\].*\n(?:.*\n){4}Correct answer: ([A-D])', re.MULTILINE)
+
+class LatencyModel:
+    """Response latency in seconds drawn from a named distribution
+
+    Specs: 'fixed:S', 'uniform:LOW,HIGH', 'normal:MEAN,STDDEV' and
+    'lognormal:MEDIAN,SIGMA'. Samples are never negative. Draws come from
+    `rng` (the mock's seeded generator) so a --seed run replays the same latencies.
+    """
+
+    def __init__(self, spec: str = 'fixed:0', rng: Optional[random.Random] = None):
+        kind, _, params = spec.partition(':')
+        values = [float(value) for value in params.split(',') if value]
+        rng = rng or random.Random()
+        samplers = {
+            'fixed': lambda: values[0],
+            'uniform': lambda: rng.uniform(values[0], values[1]),
+            'normal': lambda: rng.gauss(values[0], values[1]),
+            'lognormal': lambda: rng.lognormvariate(0, values[1]) * values[0]
+        }
+        if kind not in samplers:
+            raise ValueError(f"Unknown latency distribution '{kind}'")
+        self.spec = spec
+        self._sampler = samplers[kind]
+
+    def sample(self) -> float:
+        return max(0.0, self._sampler())
+
+class RateLimiter:
+    """Token bucket refilled continuously at `per_minute` units per minute (0 disables it)"""
+
+    def __init__(self, per_minute: int):
+        self.per_minute = per_minute
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self, amount: float = 1) -> Optional[float]:
+        """Take `amount` units; returns None on success or the seconds to wait before retrying"""
+        if not self.per_minute:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * self.per_minute / 60.0)
+            self._updated = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return None
+            return (amount - self._tokens) * 60.0 / self.per_minute
+
+class MockGemini:
+    """Behaviour of the mock backend; shared by all request handler threads"""
+
+    def __init__(self, latency: str = 'fixed:0', per_question_latency: float = 0.0, error_rate: float = 0.0,
+                 error_codes: List[int] = (500, 503), truncate_rate: float = 0.0, fence_rate: float = 0.0,
+                 max_concurrent: int = 0, rpm: int = 0, tpm: int = 0, seed: Optional[int] = None):
+        self.random = random.Random(seed)
+        self.latency = LatencyModel(latency, self.random)
+        self.per_question_latency = per_question_latency
+        self.error_rate = error_rate
+        self.error_codes = list(error_codes)
+        self.truncate_rate = truncate_rate
+        self.fence_rate = fence_rate
+        self.max_concurrent = max_concurrent
+        self.requests_limit = RateLimiter(rpm)
+        self.tokens_limit = RateLimiter(tpm)
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._question_serial = 0
+        self.stats = {
+            'requests': 0,
+            'streamed': 0,
+            'ok': 0,
+            'injected_errors': 0,
+            'rate_limited': 0,
+            'truncated': 0,
+            'fenced': 0,
+            'questions': 0,
+            'explanations': 0,
+            'peak_in_flight': 0
+        }
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def enter(self) -> bool:
+        """Admit a request unless max_concurrent are already being served"""
+        with self._lock:
+            if self.max_concurrent and self._in_flight >= self.max_concurrent:
+                return False
+            self._in_flight += 1
+            self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self._in_flight)
+            return True
+
+    def leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def parse_prompt(self, prompt: str) -> Dict[str, Any]:
+        match = COUNT_PATTERN.search(prompt)
+        difficulty = DIFFICULTY_PATTERN.search(prompt)
+        mix = MIX_PATTERN.search(prompt)
+        topics = []
+        if mix:
+            for line in mix.group(1).strip().splitlines():
+                name, _, n = line[2:].rpartition(':')
+                topics += [name.strip()] * int(n)
+        explain = EXPLAIN_PATTERN.findall(prompt)
+        return {
+            'count': len(explain) if explain else int(match.group(1)) if match else 5,
+            'explain': [(int(question_id), answer) for question_id, answer in explain],
+            'with_explanations': '"explanation":' in prompt,
+            'subject': match.group(2) if match else 'Biology',
+            'topic': (match.group(3) or '').strip() if match else '',
+            'topics': topics,
+            'difficulty': difficulty.group(1) if difficulty else 'medium'
+        }
+
+    def make_questions(self, count: int, subject: str, topic: str, difficulty: str, topics: List[str] = (),
+                       with_explanations: bool = True) -> List[Dict[str, Any]]:
+        """Questions for one request; `topics` gives each question's topic for mixed tests"""
+        questions = []
+        for index in range(count):
+            question_topic = topics[index] if index < len(topics) else topic or 'General'
+            with self._lock:
+                self._question_serial += 1
+                serial = self._question_serial
+            answer = self.random.choice('ABCD')
+            values = [f"{self.random.randint(2, 99)} units" for _ in range(4)]
+            questions.append({
+                'question_text': f"[mock {serial}] Which value best describes concept {self.random.randint(1, 10 ** 6)} "
+                                 f"of {question_topic} in {subject}?",
+                'option_a': values[0],
+                'option_b': values[1],
+                'option_c': values[2],
+                'option_d': values[3],
+                'correct_answer': answer,
+                'explanation': f"Option {answer} follows from the mock reasoning for question {serial}.",
+                'difficulty': difficulty,
+                'topic': question_topic
+            })
+            if not with_explanations:
+                del questions[-1]['explanation']
+        self._count('questions', count)
+        return questions
+
+    def make_explanations(self, explain: List[tuple]) -> List[Dict[str, Any]]:
+        """Explanations for (question id, correct answer) pairs of an explanation prompt"""
+        self._count('explanations', len(explain))
+        return [
+            {'id': question_id, 'explanation': f"Option {answer} follows from the mock reasoning for question {question_id}."}
+            for question_id, answer in explain
+        ]
+
+    def render(self, questions: List[Dict[str, Any]], max_output_tokens: Optional[int] = None, key: str = 'questions') -> Dict[str, Any]:
+        """Model output text, possibly fenced and/or truncated like a MAX_TOKENS stop
+
+        Output longer than the request's maxOutputTokens is always cut off there.
+        """
+        text = json.dumps({key: questions}, indent=2)
+        finish_reason = 'STOP'
+
+        if self.random.random() < self.fence_rate:
+            text = f"Here are the questions:\n```json\n{text}\n```"
+            self._count('fenced')
+        if self.random.random() < self.truncate_rate:
+            text = text[:self.random.randint(len(text) // 4, len(text) - 1)]
+            finish_reason = 'MAX_TOKENS'
+            self._count('truncated')
+        elif max_output_tokens and estimate_tokens(text) > max_output_tokens:
+            text = text[:max_output_tokens * 4]
+            finish_reason = 'MAX_TOKENS'
+            self._count('truncated')
+        return {'text': text, 'finish_reason': finish_reason}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, in_flight=self._in_flight, latency=self.latency.spec)
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    mock: MockGemini = None
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass  # One line per request would drown out load tests
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.mock.snapshot())
+        else:
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        path = self.path.split('?', 1)[0]
+        streaming = path.endswith(':streamGenerateContent')
+        if not streaming and not path.endswith(':generateContent'):
+            self._send_json(404, {'error': {'code': 404, 'message': 'Not found', 'status': 'NOT_FOUND'}})
+            return
+
+        mock = self.mock
+        mock._count('requests')
+        if not mock.enter():
+            self._send_error(429, 'Too many concurrent requests', retry_after=1)
+            return
+        try:
+            self._generate(body, streaming)
+        finally:
+            mock.leave()
+
+    def _generate(self, body: Dict[str, Any], streaming: bool):
+        mock = self.mock
+        prompt = ''.join(part.get('text', '') for content in body.get('contents', []) for part in content.get('parts', []))
+        request = mock.parse_prompt(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+
+        wait = mock.requests_limit.try_take()
+        if wait is None:
+            wait = mock.tokens_limit.try_take(prompt_tokens + request['count'] * 300)
+        if wait is not None:
+            mock._count('rate_limited')
+            self._send_error(429, 'Resource has been exhausted (e.g. check quota).', retry_after=max(1, round(wait)))
+            return
+
+        latency = mock.latency.sample() + request['count'] * mock.per_question_latency
+
+        if mock.random.random() < mock.error_rate:
+            time.sleep(latency * mock.random.random())
+            mock._count('injected_errors')
+            self._send_error(mock.random.choice(mock.error_codes), 'Injected mock failure')
+            return
+
+        max_output_tokens = body.get('generationConfig', {}).get('maxOutputTokens')
+        if request['explain']:
+            output = mock.render(mock.make_explanations(request['explain']), max_output_tokens, key='explanations')
+        else:
+            questions = mock.make_questions(request['count'], request['subject'], request['topic'], request['difficulty'],
+                                            request['topics'], request['with_explanations'])
+            output = mock.render(questions, max_output_tokens)
+        usage = {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': estimate_tokens(output['text']),
+            'totalTokenCount': prompt_tokens + estimate_tokens(output['text'])
+        }
+        mock._count('ok')
+
+        if streaming:
+            mock._count('streamed')
+            self._stream(output, usage, latency)
+        else:
+            time.sleep(latency)
+            self._send_json(200, {
+                'candidates': [{
+                    'content': {'parts': [{'text': output['text']}], 'role': 'model'},
+                    'finishReason': output['finish_reason']
+                }],
+                'usageMetadata': usage
+            })
+
+    def _stream(self, output: Dict[str, Any], usage: Dict[str, Any], latency: float):
+        """Server-sent events: the text arrives in pieces spread over the latency"""
+        text = output['text']
+        pieces = [text[i:i + 200] for i in range(0, len(text), 200)] or ['']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        for index, piece in enumerate(pieces):
+            time.sleep(latency / len(pieces))
+            event = {'candidates': [{'content': {'parts': [{'text': piece}], 'role': 'model'}}]}
+            if index == len(pieces) - 1:
+                event['candidates'][0]['finishReason'] = output['finish_reason']
+                event['usageMetadata'] = usage
+            try:
+                self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8'))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return  # Client cancelled the stream
+
+    def _send_error(self, code: int, message: str, retry_after: Optional[int] = None):
+        status = {429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL', 503: 'UNAVAILABLE'}.get(code, 'UNKNOWN')
+        headers = {'Retry-After': str(retry_after)} if retry_after else {}
+        self._send_json(code, {'error': {'code': code, 'message': message, 'status': status}}, headers)
+
+    def _send_json(self, code: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def create_server(host: str = '127.0.0.1', port: int = 8089, **options) -> ThreadingHTTPServer:
+    """Build (but do not start) a mock server; options are MockGemini arguments"""
+    handler = type('Handler', (MockGeminiHandler,), {'mock': MockGemini(**options)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Gemini generateContent server for offline load testing')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='lognormal:1.5,0.4',
+                        help="fixed:S | uniform:LOW,HIGH | normal:MEAN,STDDEV | lognormal:MEDIAN,SIGMA (seconds)")
+    parser.add_argument('--per-question-latency', type=float, default=0.0, help='extra seconds per generated question')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests failing with --error-codes')
+    parser.add_argument('--error-codes', default='500,503', help='comma-separated HTTP codes used for injected errors')
+    parser.add_argument('--truncate-rate', type=float, default=0.0, help='fraction of outputs cut off mid-JSON')
+    parser.add_argument('--fence-rate', type=float, default=0.0, help='fraction of outputs wrapped in a markdown fence')
+    parser.add_argument('--max-concurrent', type=int, default=0, help='requests served at once before answering 429 (0 = unlimited)')
+    parser.add_argument('--rpm', type=int, default=0, help='requests per minute before answering 429 (0 = unlimited)')
+    parser.add_argument('--tpm', type=int, default=0, help='estimated tokens per minute before answering 429 (0 = unlimited)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = create_server(
+        args.host, args.port,
+        latency=args.latency,
+        per_question_latency=args.per_question_latency,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(',')],
+        truncate_rate=args.truncate_rate,
+        fence_rate=args.fence_rate,
+        max_concurrent=args.max_concurrent,
+        rpm=args.rpm,
+        tpm=args.tpm,
+        seed=args.seed
+    )
+    print(f"🧪 Mock Gemini listening on http://{args.host}:{args.port} (latency {args.latency}, error rate {args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
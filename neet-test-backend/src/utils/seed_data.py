@@ -243,6 +243,14 @@ def seed_sample_questions():
         # Combine all questions
         all_questions = physics_questions + chemistry_questions + biology_questions
         
+        # Check which sample questions already exist with one batched content-hash probe
+        existing_keys = {
+            (subject_id, content_hash)
+            for subject_id, content_hash in db.session.query(Question.subject_id, Question.content_hash).filter(
+                Question.content_hash.in_([Question.compute_content_hash(q['question_text']) for q in all_questions])
+            ).all()
+        }
+        
         # Add questions to database
         for q_data in all_questions:
             # Get subject and topic IDs
@@ -251,12 +259,10 @@ def seed_sample_questions():
             
             if subject and topic:
                 # Check if question already exists
-                existing = Question.query.filter_by(
-                    question_text=q_data['question_text'],
-                    subject_id=subject.id
-                ).first()
+                key = (subject.id, Question.compute_content_hash(q_data['question_text']))
                 
-                if not existing:
+                if key not in existing_keys:
+                    existing_keys.add(key)
                     question = Question(
                         question_text=q_data['question_text'],
                         option_a=q_data['option_a'],
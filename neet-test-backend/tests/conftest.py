@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Application modules import each other as top-level packages (models, services, ...)
+# the same way main.py does, so put src on the path for the tests as well
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
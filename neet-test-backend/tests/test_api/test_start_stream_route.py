@@ -0,0 +1,85 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+# The routes module builds its TestService (and Gemini client) at import time
+os.environ.setdefault('GEMINI_API_KEY', 'test-key')
+from api.routes import tests as tests_routes  # noqa: E402
+
+class FakeEvents:
+    """Stands in for the start_test_stream generator and records whether the route closed it"""
+
+    def __init__(self, events):
+        self.events = iter(events)
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        self.closed = True
+
+EVENTS = [
+    {'type': 'test', 'test_id': 7, 'total_questions': 2},
+    {'type': 'question', 'index': 0, 'question': {'id': 'q0'}},
+    {'type': 'question', 'index': 1, 'question': {'id': 'q1'}},
+    {'type': 'done', 'test_id': 7, 'total_questions': 2}
+]
+
+class TestStartStreamRoute(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['JWT_SECRET_KEY'] = 'test-secret'
+        JWTManager(self.app)
+        self.app.register_blueprint(tests_routes.tests_bp)
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            self.headers = {'Authorization': f'Bearer {create_access_token(identity="1")}'}
+
+    def start(self, body, **kwargs):
+        self.events = FakeEvents(EVENTS)
+        with mock.patch.object(tests_routes.test_service, 'start_test_stream', return_value=self.events) as start:
+            response = self.client.post('/tests/start/stream', json=body, headers=dict(self.headers, **kwargs.pop('headers', {})), **kwargs)
+            body = response.get_data(as_text=True)
+        return response, body, start
+
+    def test_events_stream_as_ndjson(self):
+        response, body, start = self.start({'subject_id': 1, 'question_count': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual([json.loads(line) for line in body.splitlines()], EVENTS)
+        self.assertEqual(start.call_args.kwargs['question_count'], 2)
+        self.assertTrue(self.events.closed)
+
+    def test_events_stream_as_sse(self):
+        response, body, _ = self.start({'subject_id': 1, 'question_count': 2}, headers={'Accept': 'text/event-stream'})
+
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        blocks = [block for block in body.split('\n\n') if block]
+        self.assertEqual(len(blocks), len(EVENTS))
+        self.assertTrue(blocks[0].startswith('event: test\ndata: '))
+        self.assertEqual(json.loads(blocks[-1].split('data: ', 1)[1]), EVENTS[-1])
+
+    def test_question_count_must_be_an_integer_in_range(self):
+        for question_count in ['10', 2.5, True, None, 0, 101]:
+            response, _, start = self.start({'subject_id': 1, 'question_count': question_count})
+            self.assertEqual(response.status_code, 400, question_count)
+            start.assert_not_called()
+
+    def test_fresh_must_be_a_boolean(self):
+        for fresh in ['false', 0, None]:
+            response, _, start = self.start({'subject_id': 1, 'question_count': 2, 'fresh': fresh})
+            self.assertEqual(response.status_code, 400, fresh)
+            start.assert_not_called()
+
+        response, _, start = self.start({'subject_id': 1, 'question_count': 2, 'fresh': False})
+        self.assertEqual((response.status_code, start.call_args.kwargs['fresh']), (200, False))
+
+if __name__ == '__main__':
+    unittest.main()
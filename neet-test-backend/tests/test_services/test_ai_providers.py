@@ -0,0 +1,180 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from services import ai_providers
+from services.ai_scheduler import AIScheduler
+from services.ai_providers import ProviderRegistry, ProviderError, GenerationCancelled, RestGeminiProvider
+from services.http_client import PooledHttpClient
+from utils.mock_gemini_server import create_server
+
+class FakeProvider:
+    def __init__(self, name, latency=0.0, status=None, total_tokens=None):
+        self.name = name
+        self.latency = latency
+        self.status = status
+        self.total_tokens = total_tokens
+        self.cancelled = []
+
+    def generate_content(self, body, cancelled=None):
+        deadline = time.monotonic() + self.latency
+        while time.monotonic() < deadline:
+            if cancelled is not None and cancelled.is_set():
+                self.cancelled.append(body)
+                raise GenerationCancelled(self.name)
+            time.sleep(0.005)
+        if self.status:
+            raise ProviderError(self.name, self.status)
+        result = {'answered_by': self.name}
+        if self.total_tokens is not None:
+            result['usageMetadata'] = {'totalTokenCount': self.total_tokens}
+        return result, 0
+
+class FakeQuota:
+    enabled = True
+
+    def __init__(self):
+        self.acquired = []
+        self.settled = []
+
+    def try_acquire(self, tokens, priority='interactive', waiter_id=None):
+        self.acquired.append(tokens)
+        return 0
+
+    def settle(self, estimated_tokens, actual_tokens):
+        self.settled.append((estimated_tokens, actual_tokens))
+
+def make_registry(primary, secondary, **options):
+    options.setdefault('hedge_min_samples', 3)
+    options.setdefault('hedge_min_delay', 0.0)
+    options.setdefault('hedge_max_ratio', 1.0)
+    registry = ProviderRegistry(order=[primary.name, secondary.name], pool_size=4, **options)
+    registry.register(primary.name, lambda: primary)
+    registry.register(secondary.name, lambda: secondary)
+    return registry
+
+class TestProviderRegistry(unittest.TestCase):
+
+    def test_slow_request_is_hedged_and_loser_cancelled(self):
+        primary, secondary = FakeProvider('primary', latency=0.02), FakeProvider('secondary', latency=0.02)
+        registry = make_registry(primary, secondary)
+        for _ in range(3):  # Warm up the primary's latency window
+            self.assertEqual(registry.generate_content({'n': 1})[2], 'primary')
+        self.assertEqual(registry.stats()['hedged'], 0)
+
+        primary.latency = 2.0
+        started = time.monotonic()
+        result, _, name = registry.generate_content({'n': 2})
+        self.assertEqual((result['answered_by'], name), ('secondary', 'secondary'))
+        self.assertLess(time.monotonic() - started, 1.0)
+
+        time.sleep(0.1)
+        self.assertEqual(primary.cancelled, [{'n': 2}])
+        stats = registry.stats()
+        self.assertEqual((stats['hedged'], stats['hedge_wins'], stats['cancelled']), (1, 1, 1))
+
+    def test_hedges_are_capped_to_a_share_of_requests(self):
+        primary, secondary = FakeProvider('primary', latency=0.02), FakeProvider('secondary')
+        registry = make_registry(primary, secondary, hedge_max_ratio=0.0)
+        for _ in range(3):
+            registry.generate_content({})
+        primary.latency = 0.2
+        self.assertEqual(registry.generate_content({})[2], 'primary')
+        self.assertEqual(registry.stats()['hedged'], 0)
+
+    def test_errors_and_unavailable_backends(self):
+        primary = FakeProvider('primary', status=503)
+        registry = ProviderRegistry(order=['missing', 'primary'], pool_size=2)
+        registry.register('missing', lambda: __import__('google.generativeai'))
+        registry.register('primary', lambda: primary)
+
+        with self.assertRaises(ProviderError):
+            registry.generate_content({})
+        providers = registry.stats()['providers']
+        self.assertTrue(providers['missing']['state'].startswith('unavailable'))
+        self.assertEqual(providers['primary']['errors'], 1)
+
+    def hedged(self, secondary, primary_latency=0.3):
+        primary = FakeProvider('primary', latency=0.02)
+        quota = FakeQuota()
+        registry = make_registry(primary, secondary, quota=quota)
+        for _ in range(3):
+            registry.generate_content({})
+        primary.latency = primary_latency
+        return registry, quota
+
+    def test_hedge_reservation_is_settled_with_its_usage(self):
+        registry, quota = self.hedged(FakeProvider('secondary', total_tokens=150))
+
+        self.assertEqual(registry.generate_content({}, estimated_tokens=500)[2], 'secondary')
+        self.assertEqual(quota.acquired, [500])
+        self.assertEqual(quota.settled, [(500, 150)])
+
+    def test_rejected_hedge_is_refunded(self):
+        registry, quota = self.hedged(FakeProvider('secondary', status=503))
+
+        self.assertEqual(registry.generate_content({}, estimated_tokens=500)[2], 'primary')
+        self.assertEqual(quota.settled, [(500, 0)])
+
+    def test_hedge_takes_a_scheduler_slot_or_is_skipped(self):
+        scheduler = AIScheduler(concurrency=2)
+        primary = FakeProvider('primary', latency=0.02)
+        registry = make_registry(primary, FakeProvider('secondary', latency=0.05), scheduler=scheduler)
+        for _ in range(3):
+            registry.generate_content({})
+        primary.latency = 0.3
+
+        # The caller's own request holds one slot and the hedge takes the other
+        caller = scheduler.acquire()
+        self.assertEqual(registry.generate_content({})[2], 'secondary')
+        self.assertEqual(scheduler.stats()['classes']['interactive']['granted'], 2)
+
+        # With every slot taken the request waits for its primary instead
+        other = scheduler.acquire()
+        self.assertEqual(registry.generate_content({})[2], 'primary')
+        stats = registry.stats()
+        self.assertEqual((stats['hedged'], stats['hedges_without_slot']), (1, 1))
+
+        scheduler.release(caller)
+        scheduler.release(other)
+        time.sleep(0.1)  # The losing primary closes and the hedge's slot is back
+        self.assertEqual(scheduler.stats()['running'], 0)
+
+    def test_sdk_backend_refuses_a_non_google_base_url(self):
+        with mock.patch.object(ai_providers.current_config, 'GEMINI_API_BASE_URL', 'http://127.0.0.1:8090'):
+            with self.assertRaises(ValueError):
+                ai_providers._create_sdk_provider()
+
+class TestRestGeminiProvider(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = create_server(port=0, latency='fixed:0.3')
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        base_url = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        cls.provider = RestGeminiProvider('gemini-rest', base_url, 'mock', 'key', PooledHttpClient(max_retries=0))
+        cls.body = {'contents': [{'parts': [{'text': 'Generate 2 high-quality NEET Physics multiple choice questions.'}]}]}
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_streamed_answer_has_the_generate_content_shape(self):
+        plain, _ = self.provider.generate_content(self.body)
+        streamed, _ = self.provider.generate_content(self.body, threading.Event())
+        self.assertEqual(streamed['candidates'][0]['content']['parts'][0]['text'][:20],
+                         plain['candidates'][0]['content']['parts'][0]['text'][:20])
+        self.assertIn('totalTokenCount', streamed['usageMetadata'])
+
+    def test_cancelled_stream_stops_early(self):
+        cancelled = threading.Event()
+        threading.Timer(0.05, cancelled.set).start()
+        started = time.monotonic()
+        with self.assertRaises(GenerationCancelled):
+            self.provider.generate_content(self.body, cancelled)
+        self.assertLess(time.monotonic() - started, 0.3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from services.ai_scheduler import AIScheduler, parse_weights
+from services.quota_governor import INTERACTIVE, BACKGROUND
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not reached')
+        time.sleep(0.005)
+
+class TestAIScheduler(unittest.TestCase):
+
+    def queue_behind_blocker(self, scheduler, priorities, cost=1000):
+        """Queue one job per priority behind a held slot, release it and return (dispatch order, jobs)"""
+        blocker = scheduler.acquire(cost, INTERACTIVE)
+        order, jobs, threads = [], [], []
+
+        def worker(priority):
+            job = scheduler.acquire(cost, priority)
+            jobs.append(job)
+            if job.granted:
+                order.append(priority)
+                scheduler.release(job)
+
+        for index, priority in enumerate(priorities):
+            thread = threading.Thread(target=worker, args=(priority,))
+            thread.start()
+            threads.append(thread)
+            wait_until(lambda: len(jobs) + sum(c['waiting'] for c in scheduler.stats()['classes'].values()) == index + 1)
+        scheduler.release(blocker)
+        for thread in threads:
+            thread.join(2)
+        return order, jobs
+
+    def test_weighted_fair_order_between_classes(self):
+        scheduler = AIScheduler(concurrency=1, weights=parse_weights('interactive:4,background:1'), spike_queue=100)
+        order, _ = self.queue_behind_blocker(scheduler, [BACKGROUND] * 3 + [INTERACTIVE] * 8)
+        # Background keeps one slot in five (the blocker used one interactive share) instead of waiting for the queue to drain
+        self.assertEqual(order, [INTERACTIVE] * 3 + [BACKGROUND] + [INTERACTIVE] * 4 + [BACKGROUND, INTERACTIVE, BACKGROUND])
+        self.assertEqual(scheduler.stats()['running'], 0)
+
+    def test_interactive_spike_preempts_queued_background_jobs(self):
+        scheduler = AIScheduler(concurrency=1, spike_queue=3)
+        order, jobs = self.queue_behind_blocker(scheduler, [BACKGROUND, BACKGROUND] + [INTERACTIVE] * 3)
+        self.assertEqual(order, [INTERACTIVE] * 3)
+        self.assertEqual(sorted(job.state for job in jobs if not job.granted), ['preempted', 'preempted'])
+        self.assertEqual(scheduler.stats()['classes'][BACKGROUND]['preempted'], 2)
+
+        job = scheduler.acquire(10, BACKGROUND)  # The spike is over
+        self.assertTrue(job.granted)
+        scheduler.release(job)
+
+    def test_queued_job_gives_up_at_its_deadline(self):
+        scheduler = AIScheduler(concurrency=1, deadlines={INTERACTIVE: 1.0, BACKGROUND: 0.05})
+        blocker = scheduler.acquire(10)
+        job = scheduler.acquire(10, BACKGROUND)
+        self.assertEqual((job.granted, job.state), (False, 'queue_timeout'))
+        stats = scheduler.stats()['classes'][BACKGROUND]
+        self.assertEqual((stats['timed_out'], stats['waiting']), (1, 0))
+        scheduler.release(blocker)
+        self.assertEqual(scheduler.stats()['running'], 0)
+
+    def test_try_acquire_only_takes_a_free_slot(self):
+        scheduler = AIScheduler(concurrency=2)
+        held = scheduler.try_acquire(10, BACKGROUND)
+        self.assertTrue(held.granted)
+        blocker = scheduler.acquire(10)
+        self.assertIsNone(scheduler.try_acquire(10))
+
+        waiting = threading.Thread(target=lambda: scheduler.release(scheduler.acquire(10)))
+        waiting.start()
+        wait_until(lambda: scheduler.stats()['classes'][INTERACTIVE]['waiting'] == 1)
+        scheduler.release(held)
+        waiting.join(2)
+        self.assertEqual(scheduler.stats()['classes'][INTERACTIVE]['granted'], 2)
+        scheduler.release(blocker)
+        self.assertEqual(scheduler.stats()['running'], 0)
+
+    def test_async_acquire_waits_for_a_released_slot(self):
+        scheduler = AIScheduler(concurrency=1)
+        blocker = scheduler.acquire(10)
+
+        async def main():
+            asyncio.get_running_loop().call_later(0.05, scheduler.release, blocker)
+            job = await scheduler.acquire_async(10, BACKGROUND)
+            scheduler.release(job)
+            return job
+
+        self.assertTrue(asyncio.run(main()).granted)
+        self.assertEqual(scheduler.stats()['classes'][BACKGROUND]['granted'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
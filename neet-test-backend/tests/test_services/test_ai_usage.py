@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from services.ai_usage import AIUsageLedger
+
+class TestAIUsageLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.now = 1000000.0
+        self.ledger = AIUsageLedger(os.path.join(self.tmpdir.name, 'runtime.db'), recent_size=3, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def record_physics_calls(self):
+        usage = {'promptTokenCount': 400, 'candidatesTokenCount': 1500, 'totalTokenCount': 1900}
+        self.ledger.record('generate', 'success', 'Physics', 'Optics', 'medium', 5, 5, usage, latency=2.0)
+        self.ledger.record('generate', 'partial', 'Physics', 'Optics', 'medium', 5, 3, usage, latency=4.0, retries=1)
+        self.ledger.record('followup', 'success', 'Physics', 'Optics', 'medium', 2, 2, usage, latency=1.0)
+        self.ledger.record('cache', 'cache_hit', 'Physics', 'Optics', 'medium', 5, 5)
+
+    def test_summary_groups_by_subject_topic_and_difficulty(self):
+        self.record_physics_calls()
+        self.ledger.record('stream', 'parse_error', 'Biology', None, 'hard', 10, 0, latency=3.0)
+
+        groups = {(g['subject'], g['topic'], g['difficulty']): g for g in self.ledger.summary()}
+        physics = groups[('Physics', 'Optics', 'medium')]
+        self.assertEqual(physics['calls'], 4)
+        self.assertEqual(physics['upstream_calls'], 3)
+        self.assertEqual(physics['prompt_tokens'], 1200)
+        self.assertEqual(physics['output_tokens'], 4500)
+        self.assertEqual(physics['questions_yielded'], 15)
+        self.assertEqual(physics['avg_latency_ms'], 2333)
+        self.assertEqual(physics['retries'], 1)
+        self.assertEqual(physics['outcomes'], {'success': 2, 'partial': 1, 'cache_hit': 1})
+        self.assertEqual(groups[('Biology', None, 'hard')]['outcomes'], {'parse_error': 1})
+
+    def test_summary_by_kind_and_time_window(self):
+        self.record_physics_calls()
+        self.now += 7200
+        self.ledger.record('generate', 'http_error', 'Physics', 'Optics', 'medium', 5, 0, latency=0.5)
+
+        by_kind = {g['kind']: g['calls'] for g in self.ledger.summary(since_seconds=None, group_by=['kind'])}
+        self.assertEqual(by_kind, {'generate': 3, 'followup': 1, 'cache': 1})
+        last_hour = self.ledger.summary(since_seconds=3600, group_by=['kind'])
+        self.assertEqual([(g['kind'], g['outcomes']) for g in last_hour], [('generate', {'http_error': 1})])
+
+    def test_recent_calls_are_kept_in_a_ring_buffer(self):
+        self.record_physics_calls()
+        recent = self.ledger.recent()
+        self.assertEqual([row['kind'] for row in recent], ['generate', 'followup', 'cache'])
+        self.assertEqual(recent[0]['latency_ms'], 4000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import threading
+import unittest
+
+from services.async_gemini_service import EventLoopThread, AsyncTransport, AsyncGeminiService
+from services.circuit_breaker import CircuitBreaker
+from services.token_budget import TokenBudget
+
+class TestEventLoopThread(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = EventLoopThread(name='test-loop')
+
+    def tearDown(self):
+        self.runner.loop.call_soon_threadsafe(self.runner.loop.stop)
+
+    def test_run_returns_result(self):
+        async def add(a, b):
+            await asyncio.sleep(0)
+            return a + b
+        self.assertEqual(self.runner.run(add(2, 3)), 5)
+
+    def test_run_timeout_cancels_coroutine(self):
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with self.assertRaises(Exception):
+            self.runner.run(slow(), timeout=0.05)
+        self.assertTrue(cancelled.wait(1))
+
+    def test_closing_iterator_cancels_async_generator(self):
+        cleaned_up = threading.Event()
+
+        async def numbers():
+            try:
+                for n in range(100):
+                    yield n
+                    await asyncio.sleep(0.01)
+            finally:
+                cleaned_up.set()
+
+        stream = self.runner.iterate(numbers(), stall_timeout=1)
+        self.assertEqual([next(stream) for _ in range(3)], [0, 1, 2])
+        stream.close()
+        self.assertTrue(cleaned_up.wait(1))
+
+class TestAsyncTransportSlots(unittest.TestCase):
+
+    def test_concurrency_is_bounded(self):
+        transport = AsyncTransport(max_concurrency=3, pool_size=3, connect_timeout=1, read_timeout=1,
+                                   max_retries=0, backoff_factor=0)
+
+        async def call():
+            async with transport.slot():
+                await asyncio.sleep(0.02)
+
+        async def many():
+            await asyncio.gather(*[call() for _ in range(12)])
+
+        transport.runner.run(many(), timeout=5)
+        stats = transport.stats()
+        self.assertEqual(stats['calls'], 12)
+        self.assertEqual(stats['peak_in_flight'], 3)
+        self.assertEqual(stats['in_flight'], 0)
+        transport.runner.loop.call_soon_threadsafe(transport.runner.loop.stop)
+
+class ThreadRecorder:
+    """Stands in for the SQLite-backed cache, quota and usage ledger, noting the threads they run on"""
+
+    def __init__(self):
+        self.threads = []
+        self.stored = None
+
+    def note(self):
+        self.threads.append(threading.get_ident())
+
+    # generation cache
+    def make_key(self, prompt):
+        return prompt
+
+    def get(self, key):
+        self.note()
+        return None
+
+    def set(self, key, questions):
+        self.note()
+        self.stored = questions
+
+    # usage ledger and quota
+    def record(self, *args, **kwargs):
+        self.note()
+
+    def settle(self, estimated_tokens, actual_tokens):
+        self.note()
+
+    async def acquire_async(self, tokens):
+        return True
+
+class FakeScheduler:
+    class Job:
+        granted = True
+        state = 'granted'
+
+    async def acquire_async(self, cost):
+        return self.Job()
+
+    def release(self, job):
+        pass
+
+class FakeTransport:
+    """Answers each chunk with one question short the first time, then with the missing ones"""
+
+    def __init__(self):
+        self.requests = []
+        self.serial = 0
+
+    async def post_json(self, url, headers, body):
+        count, batch = body['contents'][0]['parts'][0]['text'].split('|')
+        count = int(count)
+        short = batch not in [b for _, b in self.requests]
+        self.requests.append((count, batch))
+        questions = []
+        for _ in range(count - 1 if short else count):
+            self.serial += 1
+            questions.append({'question_text': f'Question {self.serial}?', 'option_a': 'a', 'option_b': 'b',
+                              'option_c': 'c', 'option_d': 'd', 'correct_answer': 'A'})
+        text = json.dumps({'questions': questions})
+        return 200, {'candidates': [{'content': {'parts': [{'text': text}]}}],
+                     'usageMetadata': {'totalTokenCount': 80, 'candidatesTokenCount': 60}}, 0
+
+class TestAsyncGeneration(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = ThreadRecorder()
+        self.service = AsyncGeminiService.__new__(AsyncGeminiService)
+        self.service.url, self.service.headers = 'http://gemini.test', {}
+        self.service.transport = FakeTransport()
+        self.service.cache = self.service.quota = self.service.usage = self.recorder
+        self.service.scheduler = FakeScheduler()
+        self.service.breaker = CircuitBreaker('test')
+        # Room for (700 - 200) // 100 = 5 questions per request
+        self.service.token_budget = TokenBudget(default_per_question=100, max_output_tokens=700, overhead_tokens=200)
+        self.service.salvage_followups = 1
+        self.service.defer_explanations = False
+        self.service._create_neet_prompt = lambda subject, topic, count, difficulty, batch=None, topic_mix=None: f'{count}|{batch}'
+
+    def test_chunks_are_salvaged_and_bookkeeping_stays_off_the_loop(self):
+        async def generate():
+            return threading.get_ident(), await self.service.agenerate_neet_questions('Physics', count=8)
+
+        # asyncio.run waits for the executor, so the ledger writes handed to it have finished
+        loop_thread, questions = asyncio.run(generate())
+
+        self.assertEqual(len(questions), 8)
+        # Cache lookup and store, four settles and four usage rows
+        self.assertEqual(len(self.recorder.threads), 10)
+        self.assertEqual(sorted(self.service.transport.requests),
+                         [(1, '(0, 2)'), (1, '(1, 2)'), (4, '(0, 2)'), (4, '(1, 2)')])
+        self.assertEqual(self.recorder.stored, questions)
+        self.assertNotIn(loop_thread, self.recorder.threads)
+        self.assertEqual(self.service.breaker.state, CircuitBreaker.CLOSED)
+
+if __name__ == '__main__':
+    unittest.main()
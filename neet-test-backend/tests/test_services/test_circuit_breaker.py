@@ -0,0 +1,198 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from services.ai_scheduler import AIScheduler
+from services.async_gemini_service import AsyncGeminiService
+from services.circuit_breaker import CircuitBreaker
+from services.gemini_service_new import GeminiService
+from services.generation_cache import GenerationCache
+from services.quota_governor import quota_priority, BACKGROUND
+from services.token_budget import TokenBudget
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(
+            'test',
+            window_size=10,
+            min_calls=4,
+            failure_rate_threshold=0.5,
+            slow_call_seconds=5.0,
+            slow_call_rate_threshold=0.75,
+            open_seconds=30.0,
+            clock=self.clock
+        )
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.record_success(0.1)
+        self.breaker.record_success(0.1)
+        self.breaker.record_failure(0.1)
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_opens_on_slow_calls(self):
+        for _ in range(4):
+            self.breaker.record_success(6.0)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_half_open_trial_success_closes(self):
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 31
+        self.assertFalse(self.breaker.is_open())
+
+        self.assertTrue(self.breaker.allow_request())   # the single trial call
+        self.assertFalse(self.breaker.allow_request())  # others keep failing fast
+        self.breaker.record_success(0.2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+    def test_half_open_trial_failure_reopens(self):
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 31
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.stats()['times_opened'], 2)
+
+    def test_lost_trial_is_replaced_after_the_cool_down(self):
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 31
+        self.assertTrue(self.breaker.allow_request())  # trial that never reports back
+        self.clock.now += 29
+        self.assertTrue(self.breaker.is_open())
+        self.assertFalse(self.breaker.allow_request())
+
+        self.clock.now += 1
+        self.assertFalse(self.breaker.is_open())
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_success(0.2)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_released_trial_lets_the_next_call_through(self):
+        for _ in range(4):
+            self.breaker.record_failure(0.1)
+        self.clock.now += 31
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.release_trial()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+
+class FakeJob:
+    def __init__(self, state):
+        self.state = state
+        self.granted = state == 'running'
+
+class FakeScheduler:
+    def __init__(self, state):
+        self.state = state
+
+    def acquire(self, cost):
+        return FakeJob(self.state)
+
+    async def acquire_async(self, cost):
+        return FakeJob(self.state)
+
+    def release(self, job):
+        pass
+
+class FakeQuota:
+    def acquire(self, tokens):
+        return False
+
+    async def acquire_async(self, tokens):
+        return False
+
+class TestTrialRelease(unittest.TestCase):
+    """A half-open trial whose call never goes upstream must not wedge the breaker"""
+
+    def half_open_service(self, cls, scheduler_state='running'):
+        clock = FakeClock()
+        breaker = CircuitBreaker('test', min_calls=1, open_seconds=30.0, clock=clock)
+        breaker.record_failure(0.1)
+        clock.now += 31
+        service = cls.__new__(cls)
+        service.breaker = breaker
+        service.scheduler = FakeScheduler(scheduler_state)
+        service.quota = FakeQuota()
+        service.usage = mock.Mock()
+        service.cache = GenerationCache(enabled=False)
+        service.token_budget = TokenBudget(default_per_question=100, max_output_tokens=4000, overhead_tokens=200)
+        service.salvage_followups = 0
+        service.defer_explanations = False
+        service.explanation_tokens = 100
+        return service
+
+    def assert_recovers(self, service):
+        self.assertEqual(service.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(service.breaker.is_open())
+        self.assertTrue(service.breaker.allow_request())
+
+    def sync_calls(self):
+        question = {'id': 1, 'question_text': 'Q?', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+                    'correct_answer': 'A'}
+        return [
+            lambda service: service.generate_neet_questions('Physics', count=3, fallback=False),
+            lambda service: service.generate_explanations('Physics', [question]),
+            lambda service: list(service.stream_neet_questions('Physics', count=3)),
+        ]
+
+    def async_calls(self):
+        return [
+            lambda service: service.agenerate_neet_questions('Physics', count=3, fallback=False),
+            lambda service: self.drain(service.astream_neet_questions('Physics', count=3)),
+        ]
+
+    def test_quota_timeout_releases_the_trial(self):
+        for call in self.sync_calls():
+            service = self.half_open_service(GeminiService)
+            service.http = mock.Mock(read_timeout=5)
+            self.assertFalse(call(service))
+            self.assert_recovers(service)
+
+    def test_async_quota_timeout_releases_the_trial(self):
+        for call in self.async_calls():
+            service = self.half_open_service(AsyncGeminiService)
+            service.transport = mock.Mock(read_timeout=5)
+            self.assertFalse(asyncio.run(call(service)))
+            self.assert_recovers(service)
+
+    def test_preempted_background_call_releases_the_trial(self):
+        # With no room for a spike, every background job is preempted as soon as it asks for a slot
+        for cls, calls in ((GeminiService, self.sync_calls()), (AsyncGeminiService, self.async_calls())):
+            for call in calls:
+                service = self.half_open_service(cls)
+                service.scheduler = AIScheduler(concurrency=1, spike_queue=0)
+                service.http = service.transport = mock.Mock(read_timeout=5)
+                with quota_priority(BACKGROUND):
+                    result = call(service) if cls is GeminiService else asyncio.run(call(service))
+                self.assertFalse(result)
+                self.assertEqual(service.usage.record.call_args.args[1], 'preempted')
+                self.assertEqual(service.scheduler.stats()['classes'][BACKGROUND]['preempted'], 1)
+                self.assert_recovers(service)
+
+    async def drain(self, stream):
+        return [question async for question in stream]
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from unittest import mock
+
+from flask import Flask
+from sqlalchemy import text
+
+from database.connection import db
+from database.migrations import question_content_hash
+from models.user import User  # noqa: F401 - registers the users table test_results references
+from models.subject import Subject
+from models.topic import Topic
+from models.question import Question
+from services.near_duplicates import QuestionNearDuplicateIndex
+from services.test_service import TestService
+
+def make_question(question_text, serial=1):
+    return {
+        'question_text': question_text,
+        'option_a': f'{serial} N', 'option_b': f'{serial + 1} N', 'option_c': f'{serial + 2} N', 'option_d': f'{serial + 3} N',
+        'correct_answer': 'B',
+        'explanation': 'Because.',
+        'difficulty': 'medium'
+    }
+
+class TestComputeContentHash(unittest.TestCase):
+
+    def test_trivially_different_copies_hash_equal(self):
+        original = Question.compute_content_hash('What is the SI unit of force?')
+        self.assertEqual(Question.compute_content_hash('  what is the SI unit of FORCE ? '), original)
+        self.assertEqual(Question.compute_content_hash('What is the SI unit of force'), original)
+        self.assertNotEqual(Question.compute_content_hash('What is the SI unit of power?'), original)
+        self.assertEqual(len(original), 64)
+
+class DatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.physics = Subject('Physics')
+        self.chemistry = Subject('Chemistry')
+        db.session.add_all([self.physics, self.chemistry])
+        db.session.commit()
+        self.mechanics = Topic('Mechanics', self.physics.id)
+        self.elements = Topic('Elements', self.chemistry.id)
+        db.session.add_all([self.mechanics, self.elements])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add_question(self, question_text, subject, topic):
+        question = Question(question_text, 'a', 'b', 'c', 'd', 'A', '', subject.id, topic.id)
+        db.session.add(question)
+        db.session.commit()
+        return question.id
+
+class TestContentHashMigration(DatabaseTestCase):
+
+    def drop_content_hash(self):
+        """Put the questions table back in its pre-migration shape"""
+        with db.engine.begin() as connection:
+            connection.execute(text(f'DROP INDEX {question_content_hash.INDEX_NAME}'))
+            connection.execute(text('ALTER TABLE questions DROP COLUMN content_hash'))
+
+    def hashes(self):
+        with db.engine.connect() as connection:
+            return dict(connection.execute(text('SELECT id, content_hash FROM questions')).fetchall())
+
+    def test_backfill_marks_duplicates_and_runs_once(self):
+        first = self.add_question('What is the SI unit of force?', self.physics, self.mechanics)
+        copy = self.add_question('Placeholder', self.physics, self.mechanics)
+        other = self.add_question('What is the SI unit of power?', self.physics, self.mechanics)
+        other_subject = self.add_question('What is the SI unit of force?', self.chemistry, self.elements)
+        db.session.remove()
+        self.drop_content_hash()
+        # Copies like this could be stored before the unique index existed
+        with db.engine.begin() as connection:
+            connection.execute(text("UPDATE questions SET question_text = 'what is the SI unit of force' WHERE id = :id"),
+                               {'id': copy})
+
+        question_content_hash.upgrade()
+
+        hashes = self.hashes()
+        force = Question.compute_content_hash('What is the SI unit of force?')
+        self.assertEqual(hashes[first], force)
+        self.assertEqual(hashes[copy], f'{question_content_hash.DUPLICATE_MARKER}{copy}')
+        self.assertEqual(hashes[other], Question.compute_content_hash('What is the SI unit of power?'))
+        self.assertEqual(hashes[other_subject], force)
+
+        # Nothing is left NULL, so the next startup has nothing to backfill
+        with mock.patch.object(Question, 'compute_content_hash') as compute:
+            question_content_hash.upgrade()
+        compute.assert_not_called()
+        self.assertEqual(self.hashes(), hashes)
+
+    def test_column_added_by_a_concurrent_worker_is_tolerated(self):
+        self.add_question('What is the SI unit of force?', self.physics, self.mechanics)
+        stale = mock.Mock()
+        stale.get_table_names.return_value = ['questions']
+        stale.get_columns.return_value = [{'name': 'id'}, {'name': 'question_text'}]
+
+        with mock.patch.object(question_content_hash, 'inspect', return_value=stale):
+            question_content_hash.upgrade()
+
+        self.assertNotIn(None, self.hashes().values())
+
+class TestPersistQuestions(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.service = TestService.__new__(TestService)
+        self.service.near_duplicates = QuestionNearDuplicateIndex(enabled=False)
+
+    def test_stored_and_repeated_questions_resolve_to_one_row(self):
+        stored = self.add_question('What is the SI unit of force?', self.physics, self.mechanics)
+
+        ids, _ = self.service._persist_questions([
+            make_question('What is the SI unit of force?'),
+            make_question('Which law relates force and acceleration?', 2),
+            make_question('which law relates force and acceleration', 3)
+        ], self.physics.id, self.mechanics.id)
+        db.session.commit()
+
+        self.assertEqual(ids[0], stored)
+        self.assertIsNotNone(ids[1])
+        self.assertEqual(ids[2], ids[1])
+        self.assertEqual(Question.query.filter_by(subject_id=self.physics.id).count(), 2)
+
+    def test_row_inserted_concurrently_is_not_inserted_twice(self):
+        # Another worker stores the question after this one probed the bank and found nothing
+        probe = Question.find_ids_by_content_hashes
+        calls = []
+        def stale_probe(subject_id, content_hashes):
+            calls.append(subject_id)
+            if len(calls) == 1:
+                self.concurrent_id = self.add_question('What is the SI unit of force?', self.physics, self.mechanics)
+                return {}
+            return probe(subject_id, content_hashes)
+
+        with mock.patch.object(Question, 'find_ids_by_content_hashes', side_effect=stale_probe):
+            ids, _ = self.service._persist_questions([make_question('What is the SI unit of force?')],
+                                                  self.physics.id, self.mechanics.id)
+        db.session.commit()
+
+        self.assertEqual(ids, [self.concurrent_id])
+        self.assertEqual(Question.query.filter_by(subject_id=self.physics.id).count(), 1)
+
+    def test_questions_are_indexed_only_once_committed(self):
+        self.service.near_duplicates = QuestionNearDuplicateIndex()
+        question_text = 'Which law relates the net force on a body to its acceleration?'
+
+        self.service._persist_questions([make_question(question_text)], self.physics.id, self.mechanics.id)
+        db.session.rollback()
+        self.assertIsNone(self.service.near_duplicates.find(self.physics.id, question_text))
+
+        ids, index_entries = self.service._persist_questions([make_question(question_text)], self.physics.id, self.mechanics.id)
+        db.session.commit()
+        self.service._index_questions(index_entries)
+        self.assertEqual(self.service.near_duplicates.find(self.physics.id, question_text)[0], ids[0])
+        self.assertTrue(Question.query.get(ids[0]).is_active)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import threading
+import time
+import unittest
+
+from flask import Flask
+
+from database.connection import db
+from models.user import User  # noqa: F401 - tables referenced by foreign keys
+from models.subject import Subject
+from models.topic import Topic
+from models.question import Question
+from services.explanation_service import ExplanationService
+
+class FakeAIService:
+    def __init__(self, gate=None):
+        self.requests = []
+        self.gate = gate
+        self.left_out = set()  # ids the model leaves out of its answer
+
+    def generate_explanations(self, subject, questions):
+        self.requests.append([question['id'] for question in questions])
+        if self.gate is not None:
+            self.gate.wait(2)
+        return {question['id']: f"{subject}: {question['correct_answer']} is right."
+                for question in questions if question['id'] not in self.left_out}
+
+class TestExplanationService(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.subject = Subject('Physics')
+        db.session.add(self.subject)
+        db.session.commit()
+        self.topic = Topic('Optics', self.subject.id)
+        db.session.add(self.topic)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def add_questions(self, explanations):
+        questions = [Question(f"Question {index}?", 'a', 'b', 'c', 'd', 'C', explanation, self.subject.id, self.topic.id)
+                     for index, explanation in enumerate(explanations)]
+        db.session.add_all(questions)
+        db.session.commit()
+        return questions
+
+    def test_missing_explanations_are_written_in_batches(self):
+        questions = self.add_questions(['', ' ', 'Kept as written.', '', ''])
+        ai_service = FakeAIService()
+        ai_service.left_out.add(questions[4].id)
+        service = ExplanationService(batch_size=2)
+        service.bind_ai_service(ai_service)
+
+        self.assertEqual(service.ensure(questions), 1)
+        self.assertEqual(ai_service.requests, [[questions[0].id, questions[1].id], [questions[3].id, questions[4].id]])
+        self.assertEqual([question.explanation for question in questions],
+                         ['Physics: C is right.', 'Physics: C is right.', 'Kept as written.', 'Physics: C is right.', ''])
+        self.assertEqual((service.stats()['generated_on_view'], service.stats()['failed']), (3, 1))
+
+        # Only the question left out is asked for again
+        ai_service.left_out.clear()
+        self.assertEqual(service.ensure(questions), 0)
+        self.assertEqual(ai_service.requests[-1], [questions[4].id])
+        self.assertEqual(service.ensure(questions), 0)
+        self.assertEqual(len(ai_service.requests), 3)
+
+    def test_question_being_explained_is_waited_for(self):
+        question = self.add_questions([''])[0]
+        gate = threading.Event()
+        ai_service = FakeAIService(gate)
+        service = ExplanationService()
+        service.bind_ai_service(ai_service)
+
+        def first_view():
+            with self.app.app_context():
+                service.ensure([Question.query.get(question.id)])
+
+        thread = threading.Thread(target=first_view)
+        thread.start()
+        while not service.stats()['in_flight']:
+            pass
+        waiter = threading.Timer(0.05, gate.set)
+        waiter.start()
+        self.assertEqual(service.ensure([question]), 0)
+        thread.join(2)
+        self.assertEqual(len(ai_service.requests), 1)
+        self.assertEqual(question.explanation, 'Physics: C is right.')
+
+    def wait_for_explanations(self, questions):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            db.session.expire_all()
+            if not any(ExplanationService.is_missing(question) for question in questions):
+                return
+            time.sleep(0.02)
+        self.fail('explanations were never written')
+
+    def test_view_returns_by_the_view_timeout(self):
+        questions = self.add_questions(['', '', ''])
+        gate = threading.Event()
+        ai_service = FakeAIService(gate)
+        service = ExplanationService(batch_size=1, view_timeout=0.2)
+        service.init_app(self.app)
+        service.bind_ai_service(ai_service)
+
+        started = time.monotonic()
+        self.assertEqual(service.ensure(questions), 3)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(service.stats()['view_timeouts'], 1)
+
+        # The view worker stores the batch it was on; the batches it never started go to the background writer
+        gate.set()
+        self.wait_for_explanations(questions)
+        self.assertEqual(sorted(ai_service.requests), [[question.id] for question in questions])
+        stats = service.stats()
+        self.assertEqual((stats['generated'], stats['generated_on_view']), (3, 1))
+
+if __name__ == '__main__':
+    unittest.main()
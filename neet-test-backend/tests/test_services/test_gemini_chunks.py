@@ -0,0 +1,68 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from services import gemini_service_new
+from services.circuit_breaker import CircuitBreaker
+from services.gemini_service_new import GeminiService
+from services.generation_cache import GenerationCache
+from services.token_budget import TokenBudget
+
+def make_question(text):
+    return {'question_text': text, 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd', 'correct_answer': 'A'}
+
+class TestChunkedGeneration(unittest.TestCase):
+
+    def setUp(self):
+        # Room for (700 - 200) // 100 = 5 questions per request
+        self.service = GeminiService.__new__(GeminiService)
+        self.service.token_budget = TokenBudget(default_per_question=100, max_output_tokens=700, overhead_tokens=200)
+        self.service.cache = GenerationCache(enabled=False)
+        self.service.breaker = CircuitBreaker('test')
+        self.service.usage = mock.Mock()
+        self.service.salvage_followups = 0
+        self.service.defer_explanations = False
+        self.running = self.peak = 0
+        self.lock = threading.Lock()
+
+    def fake_request(self, subject, topic, count, difficulty, batch=None, topic_mix=None, kind='generate'):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        index = batch[0] if batch else 0
+        # Every chunk repeats the first question of chunk 0, with different spacing and case
+        return [make_question('  what is  the SI unit of FORCE? ')] + \
+            [make_question(f'Chunk {index} question {n}?') for n in range(count - 1)]
+
+    def test_plan_splits_into_near_equal_chunks_within_the_budget(self):
+        self.assertEqual(self.service._plan_chunks(5), [5])
+        self.assertEqual(self.service._plan_chunks(6), [3, 3])
+        self.assertEqual(self.service._plan_chunks(12), [4, 4, 4])
+        self.assertEqual(self.service._plan_chunks(16), [4, 4, 4, 4])
+        self.assertTrue(all(size <= 5 for size in self.service._plan_chunks(47)))
+        self.assertEqual(sum(self.service._plan_chunks(47)), 47)
+
+    def test_merge_drops_repeats_across_chunks(self):
+        merged = self.service._merge_unique([
+            [make_question('What is the SI unit of force?'), make_question('Define power.')],
+            [make_question('what is the  SI unit of force ?'), make_question('')],
+            [make_question('Define work.')]
+        ])
+        self.assertEqual([q['question_text'] for q in merged], ['What is the SI unit of force?', 'Define power.', 'Define work.'])
+
+    def test_chunks_run_in_parallel_up_to_the_pool_size(self):
+        self.service._request_chunk = self.fake_request
+        with mock.patch.object(gemini_service_new, '_chunk_executor', ThreadPoolExecutor(max_workers=2)):
+            questions = self.service.generate_neet_questions('Physics', 'Mechanics', 20, use_cache=False)
+        self.assertEqual(self.peak, 2)
+        # Four chunks of five, the shared question kept once: 1 + 4 * 4
+        self.assertEqual(len(questions), 17)
+        self.assertEqual(len({q['question_text'] for q in questions}), 17)
+
+if __name__ == '__main__':
+    unittest.main()
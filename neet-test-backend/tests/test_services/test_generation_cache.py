@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+from services.generation_cache import GenerationCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestGenerationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.clock = FakeClock()
+        self.cache = GenerationCache(
+            disk_path=os.path.join(self.tmpdir.name, 'cache.db'),
+            max_entries=2,
+            ttl_seconds=60,
+            clock=self.clock
+        )
+        self.questions = [{'question_text': 'What is the SI unit of current?', 'correct_answer': 'B'}]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_depends_only_on_prompt(self):
+        self.assertEqual(GenerationCache.make_key('prompt'), GenerationCache.make_key('prompt'))
+        self.assertNotEqual(GenerationCache.make_key('prompt'), GenerationCache.make_key('prompt 2'))
+
+    def test_memory_hit_returns_independent_copy(self):
+        self.cache.set('k', self.questions)
+        first = self.cache.get('k')
+        first[0]['id'] = 'test_1'
+        self.assertNotIn('id', self.cache.get('k')[0])
+        self.assertEqual(self.cache.stats()['memory_hits'], 2)
+
+    def test_disk_tier_serves_after_lru_eviction(self):
+        self.cache.set('a', self.questions)
+        self.cache.set('b', self.questions)
+        self.cache.set('c', self.questions)  # evicts 'a' from memory
+
+        self.assertEqual(self.cache.get('a'), self.questions)
+        stats = self.cache.stats()
+        self.assertEqual(stats['evictions'], 2)  # 'a' evicted, then 'b' when 'a' was promoted
+        self.assertEqual(stats['disk_hits'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.set('k', self.questions)
+        self.clock.now += 61
+        self.assertIsNone(self.cache.get('k'))
+        stats = self.cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.0)
+
+    def test_disabled_cache_never_hits(self):
+        cache = GenerationCache(enabled=False)
+        cache.set('k', self.questions)
+        self.assertIsNone(cache.get('k'))
+
+if __name__ == '__main__':
+    unittest.main()
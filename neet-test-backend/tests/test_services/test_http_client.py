@@ -0,0 +1,69 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import unittest
+
+from services.http_client import PooledHttpClient
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    failures_left = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if _Handler.failures_left > 0:
+            _Handler.failures_left -= 1
+            status, body = 503, b'{}'
+        else:
+            status, body = 200, b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestPooledHttpClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/generate'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        _Handler.failures_left = 0
+        self.client = PooledHttpClient(pool_size=2, max_retries=3, backoff_factor=0.01)
+
+    def test_reuses_kept_alive_connection(self):
+        for _ in range(5):
+            response = self.client.post(self.url, json={'n': 1})
+            self.assertEqual(response.status_code, 200)
+
+        stats = self.client.stats()
+        self.assertEqual(stats['requests'], 5)
+        self.assertEqual(stats['pool_misses'], 1)
+        self.assertEqual(stats['pool_hits'], 4)
+
+    def test_retries_5xx_then_succeeds(self):
+        _Handler.failures_left = 2
+        response = self.client.post(self.url, json={})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 2)
+        self.assertEqual(self.client.stats()['retries'], 2)
+
+    def test_gives_up_after_max_retries(self):
+        _Handler.failures_left = 10
+        response = self.client.post(self.url, json={})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.retries, 3)
+        self.assertEqual(self.client.stats()['errors'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
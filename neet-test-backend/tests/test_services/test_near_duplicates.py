@@ -0,0 +1,74 @@
+import unittest
+
+from services.near_duplicates import MinHasher, LSHIndex, QuestionNearDuplicateIndex, NEGATION_WEIGHT, similarity
+
+ORIGINAL = ('A particle moves in a straight line with constant acceleration. If it covers 20 m in the '
+            'first 2 seconds and 60 m in the next 4 seconds, what is its acceleration?')
+PARAPHRASE = ('A particle moves in a straight line with constant acceleration. It covers 20 m in the '
+              'first 2 seconds and 60 m in the next 4 seconds. What is its acceleration?')
+UNRELATED = 'Which orbital has the highest energy according to the aufbau principle?'
+# Different questions that share almost every word
+DISTINCT_PAIRS = [
+    ('What is the SI unit of force?', 'What is the SI unit of power?'),
+    ('Which of the following is an alkali metal?', 'Which of the following is not an alkali metal?'),
+    ('Which of the following is an alkali metal?', "Which of the following isn't an alkali metal?")
+]
+
+class TestMinHash(unittest.TestCase):
+
+    def test_signatures_estimate_similarity(self):
+        hasher = MinHasher()
+        original = hasher.signature(ORIGINAL)
+        self.assertEqual(hasher.signature(ORIGINAL.upper()), original)
+        self.assertGreater(similarity(original, hasher.signature(PARAPHRASE)), 0.85)
+        self.assertLess(similarity(original, hasher.signature(UNRELATED)), 0.2)
+        self.assertIsNone(hasher.signature(''))
+
+    def test_negated_stem_gets_weighted_features(self):
+        hasher = MinHasher()
+        positive = hasher.shingles('Which of the following is an alkali metal?')
+        negative = hasher.shingles('Which of the following is not an alkali metal?')
+        self.assertEqual(len(negative - positive), 3 + NEGATION_WEIGHT)  # not, "is not", "not an" and the weight
+        self.assertFalse(any(feature.startswith('negated:') for feature in positive))
+
+    def test_lsh_index_finds_paraphrases_within_the_group(self):
+        hasher = MinHasher()
+        index = LSHIndex(threshold=0.85)
+        index.add(1, hasher.signature(ORIGINAL), group='physics')
+        index.add(2, hasher.signature(UNRELATED), group='physics')
+
+        key, score = index.query(hasher.signature(PARAPHRASE), group='physics')
+        self.assertEqual(key, 1)
+        self.assertGreaterEqual(score, 0.85)
+        self.assertIsNone(index.query(hasher.signature(PARAPHRASE), group='chemistry'))
+
+    def test_questions_differing_in_one_word_are_not_matched(self):
+        hasher = MinHasher()
+        for first, second in DISTINCT_PAIRS:
+            index = LSHIndex()
+            index.add(1, hasher.signature(first))
+            self.assertIsNone(index.query(hasher.signature(second)), (first, second))
+
+class TestQuestionNearDuplicateIndex(unittest.TestCase):
+
+    def test_find_and_add_by_subject(self):
+        index = QuestionNearDuplicateIndex()
+        index.add(7, 1, ORIGINAL)
+        index.add(7, 1, ORIGINAL)  # Adding twice is harmless
+        index.add(8, 1, 'What is the SI unit of force?')
+
+        self.assertEqual(index.find(1, PARAPHRASE)[0], 7)
+        self.assertIsNone(index.find(2, PARAPHRASE))
+        self.assertIsNone(index.find(1, UNRELATED))
+        self.assertIsNone(index.find(1, 'What is the SI unit of power?'))
+        stats = index.stats()
+        self.assertEqual((stats['indexed'], stats['checks'], stats['near_duplicates']), (2, 4, 1))
+
+    def test_disabled_index_never_matches(self):
+        index = QuestionNearDuplicateIndex(enabled=False)
+        index.add(7, 1, ORIGINAL)
+        self.assertIsNone(index.find(1, ORIGINAL))
+        self.assertIsNone(index.signature(ORIGINAL))
+
+if __name__ == '__main__':
+    unittest.main()
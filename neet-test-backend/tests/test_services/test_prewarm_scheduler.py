@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+from datetime import datetime
+
+from flask import Flask
+
+from database.connection import db
+from models.user import User  # noqa: F401 - tables referenced by foreign keys
+from models.subject import Subject
+from models.topic import Topic
+from models.question_stock import QuestionStock  # noqa: F401 - creates the stock table
+from services.prewarm_scheduler import PrewarmScheduler, next_start
+from services.question_inventory import QuestionInventory
+
+NOW = datetime(2026, 10, 16, 17, 0)  # a Friday
+
+class FakeAIService:
+    def __init__(self):
+        self.requests = []
+
+    def generate_neet_questions(self, subject, topic=None, count=5, difficulty='medium', fallback=True, use_cache=True, topic_mix=None):
+        self.requests.append((topic, count))
+        questions = []
+        for _ in range(count):
+            words = [uuid.uuid4().hex[:8] for _ in range(6)]
+            questions.append({
+                'question_text': f"Which of {' '.join(words)} describes the {topic or subject} result?",
+                'option_a': words[0], 'option_b': words[1], 'option_c': words[2], 'option_d': words[3],
+                'correct_answer': 'A',
+                'explanation': 'Because.',
+                'difficulty': difficulty,
+                'topic': topic
+            })
+        return questions
+
+class TestPrewarmScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.subject = Subject('Physics')
+        db.session.add(self.subject)
+        db.session.commit()
+        self.optics, self.kinematics = Topic('Optics', self.subject.id), Topic('Kinematics', self.subject.id)
+        db.session.add_all([self.optics, self.kinematics])
+        db.session.commit()
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.calendar_path = os.path.join(self.directory.name, 'calendar.json')
+        self.ai_service = FakeAIService()
+        self.inventory = QuestionInventory(refill_batch=10)
+        self.inventory.bind_ai_service(self.ai_service)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.directory.cleanup()
+
+    def write_calendar(self, sessions):
+        with open(self.calendar_path, 'w') as f:
+            json.dump({'sessions': sessions}, f)
+
+    def make_scheduler(self, **options):
+        options.setdefault('disk_path', os.path.join(self.directory.name, 'runtime.db'))
+        return PrewarmScheduler(self.calendar_path, lead_minutes=120, margin=0.0, inventory=self.inventory,
+                                now=lambda: NOW, **options)
+
+    def test_session_in_window_is_warmed_until_ready(self):
+        self.write_calendar([
+            {'name': 'Batch A', 'subject': 'physics', 'topics': ['Optics', 'Kinematics'], 'headcount': 20,
+             'questions_per_test': 5, 'time': '18:00', 'days': ['fri']},
+            {'name': 'Tomorrow', 'subject': self.subject.id, 'headcount': 30, 'questions_per_test': 10,
+             'starts_at': '2026-10-17T18:00'}
+        ])
+        self.inventory.add(self.subject.id, self.optics.id, 'medium', self.ai_service.generate_neet_questions('Physics', 'Optics', 20))
+        scheduler = self.make_scheduler()
+
+        batch_a, tomorrow = scheduler.report()
+        self.assertEqual((batch_a['status'], batch_a['demand'], batch_a['covered']), ('warming', 100, 20))
+        self.assertEqual(batch_a['starts_at'], '2026-10-16T18:00')
+        self.assertEqual(tomorrow['status'], 'scheduled')
+
+        self.assertEqual(scheduler.tick(), 80)
+        self.assertEqual(self.inventory.stock_level(self.subject.id, self.optics.id, 'medium'), 50)
+        self.assertEqual(self.inventory.stock_level(self.subject.id, self.kinematics.id, 'medium'), 50)
+        self.assertEqual(self.inventory.stock_level(self.subject.id, None, 'medium'), 0)
+        self.assertEqual(scheduler.report()[0]['status'], 'ready')
+        self.assertEqual(scheduler.tick(), 0)
+
+    def test_only_the_lease_holder_warms(self):
+        self.write_calendar([{'subject': 'Physics', 'headcount': 2, 'questions_per_test': 10, 'time': '17:30'}])
+        leader, follower = self.make_scheduler(), self.make_scheduler()
+        self.assertEqual(leader.tick(), 20)
+        self.write_calendar([{'subject': 'Physics', 'headcount': 4, 'questions_per_test': 10, 'time': '17:30'}])
+        self.assertEqual(follower.tick(), 0)
+        self.assertFalse(follower.stats()['leader'])
+        self.assertEqual(follower.report()[0]['status'], 'warming')
+
+    def test_unknown_references_are_reported(self):
+        self.write_calendar([{'name': 'Typo', 'subject': 'Physics', 'topics': ['Optiks'], 'headcount': 5, 'time': '18:00'}])
+        session = self.make_scheduler().report()[0]
+        self.assertEqual(session['status'], 'invalid')
+        self.assertIn('Optiks', session['error'])
+
+    def test_next_start_of_recurring_sessions(self):
+        self.assertEqual(next_start({'time': '18:00', 'days': ['mon']}, NOW), datetime(2026, 10, 19, 18, 0))
+        self.assertEqual(next_start({'time': '16:00'}, NOW), datetime(2026, 10, 17, 16, 0))
+        self.assertEqual(next_start({'starts_at': '2026-10-16T09:00'}, NOW), datetime(2026, 10, 16, 9, 0))
+
+if __name__ == '__main__':
+    unittest.main()
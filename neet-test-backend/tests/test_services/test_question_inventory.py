@@ -0,0 +1,101 @@
+import os
+import tempfile
+import time
+import unittest
+import uuid
+
+from flask import Flask
+
+from database.connection import db
+from models.user import User  # noqa: F401 - tables referenced by foreign keys
+from models.subject import Subject
+from models.topic import Topic
+from models.question_stock import QuestionStock
+from services.question_inventory import QuestionInventory
+
+class FakeAIService:
+    def __init__(self):
+        self.requests = []
+
+    def generate_neet_questions(self, subject, topic=None, count=5, difficulty='medium', fallback=True, use_cache=True, topic_mix=None):
+        self.requests.append((topic, count, use_cache))
+        questions = []
+        for _ in range(count):
+            words = [uuid.uuid4().hex[:8] for _ in range(6)]
+            questions.append({
+                'question_text': f"Which of {' '.join(words)} describes the {topic or subject} result?",
+                'option_a': words[0], 'option_b': words[1], 'option_c': words[2], 'option_d': words[3],
+                'correct_answer': 'A',
+                'explanation': 'Because.',
+                'difficulty': difficulty
+            })
+        return questions
+
+class TestQuestionInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        # A file database: the refiller thread needs its own connection
+        self.directory = tempfile.TemporaryDirectory()
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'test.db')
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.subject = Subject('Physics')
+        db.session.add(self.subject)
+        db.session.commit()
+        self.topic = Topic('Optics', self.subject.id)
+        db.session.add(self.topic)
+        db.session.commit()
+        self.ai_service = FakeAIService()
+        self.inventory = QuestionInventory(low_watermark=5, high_watermark=12, refill_batch=5)
+        self.inventory.bind_ai_service(self.ai_service)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.directory.cleanup()
+
+    def test_take_removes_the_oldest_unclaimed_rows(self):
+        questions = self.ai_service.generate_neet_questions('Physics', 'Optics', 4)
+        self.inventory.add(self.subject.id, self.topic.id, 'Medium', questions)
+        # A row another taker has claimed is never handed out
+        claimed = QuestionStock.query.order_by(QuestionStock.id).first()
+        claimed.claimed_by = 'other'
+        db.session.commit()
+
+        taken = self.inventory.take(self.subject.id, self.topic.id, 'medium', 2)
+        self.assertEqual([q['question_text'] for q in taken], [q['question_text'] for q in questions[1:3]])
+        self.assertEqual(self.inventory.stock_level(self.subject.id, self.topic.id, 'medium'), 1)
+        self.assertEqual(len(self.inventory.take(self.subject.id, self.topic.id, 'medium', 5)), 1)
+        self.assertEqual(self.inventory.take(self.subject.id, None, 'medium', 5), [])
+        self.assertEqual(QuestionStock.query.count(), 1)
+
+    def test_refill_only_below_the_low_watermark(self):
+        key = self.inventory.make_key(self.subject.id, self.topic.id, 'medium')
+        self.assertEqual(self.inventory.refill(key), 12)
+        self.assertEqual(self.ai_service.requests, [('Optics', 5, False), ('Optics', 5, False), ('Optics', 2, False)])
+
+        self.inventory.take(self.subject.id, self.topic.id, 'medium', 7)
+        self.assertEqual(self.inventory.refill(key), 0)  # 5 left: at the low watermark
+        self.inventory.take(self.subject.id, self.topic.id, 'medium', 1)
+        self.assertEqual(self.inventory.refill(key), 8)
+        self.assertEqual(self.inventory.stock_level(self.subject.id, self.topic.id, 'medium'), 12)
+
+    def test_request_refill_runs_in_the_background_once_per_key(self):
+        self.inventory.request_refill(self.subject.id, self.topic.id, 'medium')
+        self.assertEqual(self.ai_service.requests, [])  # No app yet: nothing to run in
+
+        self.inventory.init_app(self.app)
+        self.inventory.request_refill(self.subject.id, self.topic.id, 'medium')
+        self.inventory.request_refill(self.subject.id, self.topic.id, 'MEDIUM')
+        deadline = time.monotonic() + 2
+        while self.inventory._pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.inventory.stock_level(self.subject.id, self.topic.id, 'medium'), 12)
+        self.assertEqual(sum(count for _, count, _ in self.ai_service.requests), 12)
+
+if __name__ == '__main__':
+    unittest.main()
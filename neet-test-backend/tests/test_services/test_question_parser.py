@@ -0,0 +1,59 @@
+import json
+import unittest
+
+from services.question_parser import IncrementalQuestionParser
+
+def make_question(n):
+    return {
+        'question_text': f'Question {n} with "quotes", braces {{}} and brackets []?',
+        'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+        'correct_answer': 'A',
+        'explanation': 'Escaped \\ backslash and } brace'
+    }
+
+class TestIncrementalQuestionParser(unittest.TestCase):
+
+    def setUp(self):
+        self.questions = [make_question(n) for n in range(3)]
+        self.payload = json.dumps({'questions': self.questions}, indent=2)
+
+    def test_whole_payload(self):
+        parser = IncrementalQuestionParser()
+        self.assertEqual(parser.feed(self.payload), self.questions)
+        self.assertTrue(parser.done)
+
+    def test_questions_emitted_as_soon_as_complete(self):
+        parser = IncrementalQuestionParser()
+        emitted = []
+        first_seen_at = None
+        for i, char in enumerate(self.payload):
+            emitted += parser.feed(char)
+            if emitted and first_seen_at is None:
+                first_seen_at = i
+        self.assertEqual(emitted, self.questions)
+        self.assertLess(first_seen_at, len(self.payload) // 2)
+
+    def test_markdown_fence_and_preamble(self):
+        parser = IncrementalQuestionParser()
+        text = 'Here you go:\n```json\n' + self.payload + '\n```'
+        self.assertEqual(parser.feed(text), self.questions)
+
+    def test_bare_array(self):
+        parser = IncrementalQuestionParser()
+        self.assertEqual(parser.feed('```json\n' + json.dumps(self.questions)), self.questions)
+
+    def test_truncated_payload_keeps_complete_questions(self):
+        parser = IncrementalQuestionParser()
+        cut = self.payload.rindex('"option_c"')
+        self.assertEqual(parser.feed(self.payload[:cut]), self.questions[:2])
+        self.assertFalse(parser.done)
+
+    def test_fenced_and_truncated_payload(self):
+        parser = IncrementalQuestionParser()
+        text = '```json\n' + self.payload
+        cut = text.rindex('"explanation"')
+        self.assertEqual(parser.feed(text[:cut]), self.questions[:2])
+        self.assertEqual(parser.invalid_objects, 0)
+
+if __name__ == '__main__':
+    unittest.main()
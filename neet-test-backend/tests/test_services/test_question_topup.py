@@ -0,0 +1,147 @@
+import unittest
+
+from flask import Flask
+
+from database.connection import db
+from models.user import User  # noqa: F401 - tables referenced by foreign keys
+from models.subject import Subject
+from models.topic import Topic
+from models.question import Question
+from services.circuit_breaker import CircuitBreaker
+from services.question_bank import QuestionBankSampler
+from services.question_service import QuestionService
+from services.question_validator import QuestionBatchValidator
+
+def make_question(serial, topic='Optics'):
+    return {
+        'question_text': f'Generated question number {serial} about lenses and mirrors?',
+        'option_a': f'{serial} cm', 'option_b': f'{serial + 1} cm', 'option_c': f'{serial + 2} cm', 'option_d': f'{serial + 3} cm',
+        'correct_answer': 'A',
+        'explanation': 'Because.',
+        'difficulty': 'medium',
+        'topic': topic
+    }
+
+class FakeAIService:
+    """Returns scripted batches, one per call"""
+
+    def __init__(self, batches, latency=None):
+        self.batches = list(batches)
+        self.requests = []
+        self.breaker = CircuitBreaker('fake')
+        self.providers = type('Providers', (), {'expected_latency': lambda _self: latency})()
+        self.usage = type('Usage', (), {'record': lambda *args, **kwargs: None})()
+
+    def generate_neet_questions(self, subject, topic=None, count=5, difficulty='medium', fallback=True, use_cache=True, topic_mix=None):
+        self.requests.append((count, use_cache))
+        return self.batches.pop(0) if self.batches else []
+
+    def stream_neet_questions(self, subject, topic=None, count=5, difficulty='medium', use_cache=True, topic_mix=None):
+        self.requests.append((count, use_cache))
+        yield from (self.batches.pop(0) if self.batches else [])
+
+class QuestionServiceTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.subject = Subject('Physics')
+        db.session.add(self.subject)
+        db.session.commit()
+        self.topic = Topic('Optics', self.subject.id)
+        db.session.add(self.topic)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def make_service(self, ai_service):
+        service = QuestionService.__new__(QuestionService)
+        service.ai_service = ai_service
+        service.question_bank = QuestionBankSampler()
+        service.single_flight = type('Flight', (), {'do': lambda _self, key, fn: (fn(), False)})()
+        service.validator = QuestionBatchValidator()
+        return service
+
+    def store_bank_questions(self, count):
+        for serial in range(count):
+            data = make_question(1000 + serial)
+            db.session.add(Question(data['question_text'], data['option_a'], data['option_b'], data['option_c'], data['option_d'],
+                                    'A', 'Because.', self.subject.id, self.topic.id))
+        db.session.commit()
+
+class TestQuestionTopUp(QuestionServiceTestCase):
+
+    def test_only_the_shortfall_is_requested_again(self):
+        short_batch = [make_question(1), make_question(2), make_question(2)]  # One duplicate
+        ai_service = FakeAIService([short_batch, [make_question(3), make_question(4)]])
+        result, status = self.make_service(ai_service).generate_questions(self.subject.id, self.topic.id, 4)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['questions']), 4)
+        self.assertEqual(ai_service.requests, [(4, True), (2, False)])
+
+    def test_bank_fills_when_the_deadline_is_close(self):
+        self.store_bank_questions(3)
+        ai_service = FakeAIService([[make_question(1)]], latency=3600)
+        result, status = self.make_service(ai_service).generate_questions(self.subject.id, self.topic.id, 3)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['questions']), 3)
+        self.assertEqual(len(ai_service.requests), 1)
+        self.assertEqual(result['questions'][0]['question_text'], make_question(1)['question_text'])
+
+    def test_generated_questions_are_kept_when_everything_runs_dry(self):
+        ai_service = FakeAIService([[make_question(1), make_question(2)]])
+        result, status = self.make_service(ai_service).generate_questions(self.subject.id, self.topic.id, 5)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['questions']), 2)
+
+class TestStreamBankFallback(QuestionServiceTestCase):
+
+    def stream(self, ai_service, count):
+        service = self.make_service(ai_service)
+        return list(service.stream_questions(self.subject.id, self.topic.id, count))
+
+    def test_bank_delivers_what_the_stream_could_not(self):
+        self.store_bank_questions(3)
+        ai_service = FakeAIService([[make_question(1), make_question(1)]])  # One duplicate
+        questions = self.stream(ai_service, 3)
+
+        self.assertEqual(ai_service.requests, [(3, True)])
+        self.assertEqual([q['id'].rsplit('_', 1)[1] for q in questions], ['0', '1', '2'])
+        self.assertEqual(questions[0]['question_text'], make_question(1)['question_text'])
+        self.assertEqual(len({q['question_text'] for q in questions}), 3)
+
+    def test_open_breaker_streams_only_from_the_bank(self):
+        self.store_bank_questions(2)
+        ai_service = FakeAIService([[make_question(1)]])
+        for _ in range(5):
+            ai_service.breaker.record_failure(0.1)
+        questions = self.stream(ai_service, 2)
+
+        self.assertEqual(ai_service.requests, [])
+        self.assertEqual(len(questions), 2)
+        self.assertTrue(all(q['subject_id'] == self.subject.id for q in questions))
+
+    def test_mixed_stream_is_tagged_over_the_whole_allocation(self):
+        for name in ('Mechanics', 'Waves'):
+            db.session.add(Topic(name, self.subject.id))
+        db.session.commit()
+        # The model named no real topic; per-question tagging sent all three to the same one
+        ai_service = FakeAIService([[make_question(serial, topic='General') for serial in range(3)]])
+        questions = list(self.make_service(ai_service).stream_questions(self.subject.id, None, 3))
+
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(sorted(q['topic_id'] for q in questions),
+                         sorted(topic.id for topic in Topic.query.filter_by(subject_id=self.subject.id)))
+
+if __name__ == '__main__':
+    unittest.main()
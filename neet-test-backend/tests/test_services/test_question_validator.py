@@ -0,0 +1,70 @@
+import unittest
+
+from services.question_validator import QuestionBatchValidator
+
+def make_question(text='What is the SI unit of force?', answer='B', **overrides):
+    question = {
+        'question_text': text,
+        'option_a': 'Joule',
+        'option_b': 'Newton',
+        'option_c': 'Watt',
+        'option_d': 'Pascal',
+        'correct_answer': answer,
+        'explanation': 'Force is measured in newtons.',
+        'difficulty': 'easy'
+    }
+    question.update(overrides)
+    return question
+
+class TestQuestionBatchValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.validator = QuestionBatchValidator()
+
+    def test_answer_letters_are_repaired(self):
+        for answer in ['b', '(B)', 'B)', 'Option B', 'Answer: (b) Newton', 'Newton']:
+            valid, rejects = self.validator.validate([make_question(answer=answer)])
+            self.assertEqual(rejects, [], answer)
+            self.assertEqual(valid[0]['correct_answer'], 'B', answer)
+
+    def test_unusable_questions_are_rejected_with_reasons(self):
+        questions = [
+            make_question(answer='E'),
+            make_question(text='Which is largest?', option_c='joule'),
+            make_question(text='  ', option_d=''),
+            make_question(text='Unit of power?', answer='C')
+        ]
+        valid, rejects = self.validator.validate(questions)
+        self.assertEqual(len(valid), 1)
+        self.assertEqual([r['reasons'] for r in rejects], [
+            ['invalid_answer'],
+            ['duplicate_options'],
+            ['missing_question_text', 'missing_option']
+        ])
+
+    def test_duplicates_within_the_batch_are_dropped(self):
+        questions = [make_question(), make_question(text='what is the SI unit of force')]
+        valid, rejects = self.validator.validate(questions)
+        self.assertEqual(len(valid), 1)
+        self.assertEqual(rejects[0]['reasons'], ['duplicate_in_batch'])
+        self.assertEqual(rejects[0]['index'], 1)
+
+    def test_layout_labels_and_explanation_are_normalised(self):
+        question = make_question(explanation='', difficulty='Hard')
+        for field in ['option_a', 'option_b', 'option_c', 'option_d']:
+            del question[field]
+        question['options'] = ['A) Joule', '(B) Newton', 'C. Watt', 'Pascal']
+
+        valid, _ = self.validator.validate([question])
+        self.assertEqual([valid[0][f] for f in ['option_a', 'option_b', 'option_c', 'option_d']],
+                         ['Joule', 'Newton', 'Watt', 'Pascal'])
+        self.assertEqual(valid[0]['explanation'], 'The correct answer is (B) Newton.')
+        self.assertEqual(valid[0]['difficulty'], 'hard')
+        self.assertEqual(self.validator.stats()['repairs']['missing_explanation'], 1)
+
+    def test_explanation_left_blank_when_deferred(self):
+        valid, _ = QuestionBatchValidator(require_explanation=False).validate([make_question(explanation=None)])
+        self.assertEqual(valid[0]['explanation'], '')
+
+if __name__ == '__main__':
+    unittest.main()
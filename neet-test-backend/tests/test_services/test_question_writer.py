@@ -0,0 +1,172 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from database.connection import db
+from models.user import User
+from models.subject import Subject
+from models.topic import Topic
+from models.question import Question
+from models.test import TestResult
+from models.pending_question_save import PendingQuestionSave
+from services.question_writer import QuestionWriter
+
+class FakeTestService:
+    def __init__(self, failures=0, gate=None):
+        self.failures = failures
+        self.gate = gate
+        self.calls = 0
+
+    def _persist_questions(self, questions, subject_id, topic_id=None):
+        self.calls += 1
+        if self.gate is not None:
+            self.gate.wait(2)
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        rows = [Question(q['question_text'], q['option_a'], q['option_b'], q['option_c'], q['option_d'],
+                         q['correct_answer'], q.get('explanation', ''), subject_id, topic_id) for q in questions]
+        db.session.add_all(rows)
+        db.session.flush()
+        return [row.id for row in rows], []
+
+    def _index_questions(self, index_entries):
+        pass
+
+def make_questions(count):
+    return [{'question_text': f'Question {index}?', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd',
+             'correct_answer': 'B', 'explanation': 'Because.', 'difficulty': 'medium', 'raw': object()}
+            for index in range(count)]
+
+class TestQuestionWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        # A file database: writer threads need their own connections
+        self.directory = tempfile.TemporaryDirectory()
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'test.db')
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User('student', 'student@example.com', 'secret')
+        self.subject = Subject('Physics')
+        db.session.add_all([self.user, self.subject])
+        db.session.commit()
+        self.topic = Topic('Optics', self.subject.id)
+        db.session.add(self.topic)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.directory.cleanup()
+
+    def new_test(self):
+        return TestResult(user_id=self.user.id, subject_id=self.subject.id, topic_id=self.topic.id, total_questions=3)
+
+    def add_orphan(self, age_seconds):
+        """A pending save as a process leaves it when it stops before writing it"""
+        orphan = self.new_test()
+        db.session.add(orphan)
+        db.session.flush()
+        pending = PendingQuestionSave(orphan.id, self.subject.id, [
+            {'question_text': 'Orphan?', 'option_a': 'a', 'option_b': 'b', 'option_c': 'c', 'option_d': 'd', 'correct_answer': 'A'}
+        ], self.topic.id)
+        pending.created_at = datetime.utcnow() - timedelta(seconds=age_seconds)
+        db.session.add(pending)
+        db.session.commit()
+        return orphan.id
+
+    def wait_until_written(self, writer):
+        deadline = time.monotonic() + 2
+        while writer.stats()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        db.session.expire_all()
+
+    def test_failed_save_stays_pending_until_submit(self):
+        writer = QuestionWriter(enabled=False)
+        writer.bind_test_service(FakeTestService(failures=1))
+        test_result = self.new_test()
+
+        writer.save(test_result, make_questions(3))
+        self.assertIsNotNone(test_result.id)
+        pending = PendingQuestionSave.query.get(test_result.id)
+        self.assertEqual((pending.attempts, pending.last_error), (1, 'database is locked'))
+        self.assertNotIn('raw', pending.questions[0])
+        self.assertEqual(Question.query.count(), 0)
+
+        self.assertTrue(writer.flush(test_result.id, on_submit=True))
+        self.assertIsNone(PendingQuestionSave.query.get(test_result.id))
+        self.assertEqual(Question.query.count(), 3)
+        self.assertTrue(writer.flush(test_result.id, on_submit=True))
+        self.assertEqual((writer.stats()['written_on_submit'], writer.stats()['failed']), (1, 1))
+
+    def test_background_writes_and_recovery(self):
+        writer = QuestionWriter()
+        writer.init_app(self.app)
+        test_service = FakeTestService()
+        writer.bind_test_service(test_service)
+
+        self.add_orphan(age_seconds=3600)
+
+        writer.recover()
+        writer.save(self.new_test(), make_questions(2))
+        self.wait_until_written(writer)
+
+        self.assertEqual(PendingQuestionSave.query.count(), 0)
+        self.assertEqual(Question.query.count(), 3)
+        self.assertEqual(test_service.calls, 2)
+        self.assertEqual((writer.stats()['written'], writer.stats()['recovered']), (2, 1))
+
+    def test_recent_pending_saves_are_left_to_their_process(self):
+        writer = QuestionWriter(recover_grace_seconds=0.3)
+        writer.init_app(self.app)
+        writer.bind_test_service(FakeTestService())
+        recent = self.add_orphan(age_seconds=0)
+
+        writer.recover()
+        self.assertEqual(writer.stats()['recovered'], 0)
+        self.assertIsNotNone(PendingQuestionSave.query.get(recent))
+
+        # Its process never wrote it, so the second look after the grace period does
+        deadline = time.monotonic() + 2
+        while not writer.stats()['recovered'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.wait_until_written(writer)
+        self.assertIsNone(PendingQuestionSave.query.get(recent))
+
+    def test_concurrent_flushes_write_once_and_drop_the_lock(self):
+        gate = threading.Event()
+        test_service = FakeTestService(gate=gate)
+        writer = QuestionWriter(enabled=False)
+        writer.bind_test_service(test_service)
+        test_id = self.add_orphan(age_seconds=0)
+
+        def flush():
+            with self.app.app_context():
+                results.append(writer.flush(test_id))
+                db.session.remove()
+
+        results = []
+        threads = [threading.Thread(target=flush) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while writer._test_locks.get(test_id, [None, 0])[1] < 3:
+            time.sleep(0.01)
+        gate.set()
+        for thread in threads:
+            thread.join(2)
+
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(test_service.calls, 1)
+        self.assertEqual(writer._test_locks, {})
+
+if __name__ == '__main__':
+    unittest.main()
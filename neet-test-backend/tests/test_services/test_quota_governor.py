@@ -0,0 +1,106 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from services.quota_governor import QuotaGovernor, quota_priority, current_priority, INTERACTIVE, BACKGROUND
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TestQuotaGovernor(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'runtime.db')
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def governor(self, **options):
+        options.setdefault('requests_per_minute', 6)
+        options.setdefault('tokens_per_minute', 6000)
+        return QuotaGovernor(self.path, clock=self.clock, **options)
+
+    def test_requests_per_minute_are_enforced_and_refill(self):
+        governor = self.governor()
+        for _ in range(6):
+            self.assertEqual(governor.try_acquire(100), 0)
+        self.assertAlmostEqual(governor.try_acquire(100), 10.0)
+
+        self.clock.now += 10
+        self.assertEqual(governor.try_acquire(100), 0)
+
+    def test_workers_share_the_buckets(self):
+        first, second = self.governor(), self.governor()
+        for _ in range(3):
+            self.assertEqual(first.try_acquire(100), 0)
+            self.assertEqual(second.try_acquire(100), 0)
+        self.assertGreater(first.try_acquire(100), 0)
+
+    def test_background_keeps_out_of_the_reserve(self):
+        governor = self.governor(background_reserve=0.5)
+        for _ in range(3):
+            self.assertEqual(governor.try_acquire(100, BACKGROUND), 0)
+        self.assertGreater(governor.try_acquire(100, BACKGROUND), 0)
+        self.assertEqual(governor.try_acquire(100, INTERACTIVE), 0)
+
+    def test_background_yields_to_waiting_interactive_callers(self):
+        governor = self.governor(requests_per_minute=60, background_reserve=0.0)
+        for _ in range(60):
+            governor.try_acquire(1)
+        self.assertGreater(governor.try_acquire(1, INTERACTIVE, waiter_id='student'), 0)
+
+        self.clock.now += 5
+        self.assertGreater(governor.try_acquire(1, BACKGROUND), 0)
+        self.assertEqual(governor.try_acquire(1, INTERACTIVE, waiter_id='student'), 0)
+        self.assertEqual(governor.try_acquire(1, BACKGROUND), 0)
+
+    def test_acquire_gives_up_at_the_deadline(self):
+        governor = self.governor(requests_per_minute=1, poll_interval=0.01)
+        self.assertTrue(governor.acquire(10))
+        self.assertFalse(governor.acquire(10, deadline=0))
+        self.assertFalse(asyncio.run(governor.acquire_async(10, deadline=0)))
+        self.assertEqual(governor.stats()['timed_out'], 2)
+
+    def test_acquire_async_keeps_sqlite_off_the_event_loop(self):
+        governor = self.governor(requests_per_minute=1)
+        store_threads = []
+        try_acquire = governor.try_acquire
+        def recording_try_acquire(*args):
+            store_threads.append(threading.get_ident())
+            return try_acquire(*args)
+        governor.try_acquire = recording_try_acquire
+
+        async def acquire():
+            return threading.get_ident(), await governor.acquire_async(10), await governor.acquire_async(10, deadline=0)
+
+        loop_thread, first, second = asyncio.run(acquire())
+        self.assertEqual((first, second), (True, False))
+        self.assertEqual(len(store_threads), 2)
+        self.assertNotIn(loop_thread, store_threads)
+
+    def test_settle_corrects_the_token_estimate(self):
+        governor = self.governor()
+        governor.try_acquire(1000)
+        governor.settle(1000, 3000)
+        self.assertEqual(governor.stats()['bucket_levels']['tokens'], 3000)
+        # A call the upstream rejected gets its reservation back; unknown usage changes nothing
+        governor.settle(3000, 0)
+        governor.settle(1000, None)
+        self.assertEqual(governor.stats()['bucket_levels']['tokens'], 6000)
+
+    def test_priority_comes_from_the_context(self):
+        self.assertEqual(current_priority(), INTERACTIVE)
+        with quota_priority(BACKGROUND):
+            self.assertEqual(current_priority(), BACKGROUND)
+        self.assertEqual(current_priority(), INTERACTIVE)
+
+if __name__ == '__main__':
+    unittest.main()
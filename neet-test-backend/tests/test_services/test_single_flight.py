@@ -0,0 +1,78 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from services.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'runtime.db')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_concurrently(self, flights, key, fn, callers=8):
+        results = []
+        lock = threading.Lock()
+
+        def call(flight):
+            result = flight.do(key, fn)
+            with lock:
+                results.append(result)
+
+        threads = [threading.Thread(target=call, args=(flights[i % len(flights)],)) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def slow_generation(self, calls):
+        def generate():
+            calls.append(1)
+            time.sleep(0.2)
+            return [{'question_text': 'q1'}, {'question_text': 'q2'}]
+        return generate
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+        flight = SingleFlight(disk_path=None)
+        results = self.run_concurrently([flight], 'physics:1:5', self.slow_generation(calls))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sum(1 for _, shared in results if shared), 7)
+        self.assertTrue(all(result == [{'question_text': 'q1'}, {'question_text': 'q2'}] for result, _ in results))
+
+    def test_shared_results_are_independent_copies(self):
+        flight = SingleFlight(disk_path=None)
+        results = self.run_concurrently([flight], 'key', self.slow_generation([]), callers=3)
+        results[0][0][0]['question_text'] = 'changed'
+        self.assertEqual(results[1][0][0]['question_text'], 'q1')
+
+    def test_workers_coalesce_through_the_lease(self):
+        calls = []
+        workers = [SingleFlight(disk_path=self.path, poll_interval=0.01) for _ in range(2)]
+        results = self.run_concurrently(workers, 'chem:2:10', self.slow_generation(calls))
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(len(result) == 2 for result, _ in results))
+        stats = [worker.stats() for worker in workers]
+        self.assertEqual(sum(s['leaders'] for s in stats), 1)
+        self.assertEqual(sum(s['coalesced_remote'] for s in stats), 1)
+
+    def test_failed_leader_does_not_poison_later_calls(self):
+        flight = SingleFlight(disk_path=self.path)
+
+        def failing():
+            raise RuntimeError('upstream down')
+
+        with self.assertRaises(RuntimeError):
+            flight.do('bio:3:5', failing)
+        self.assertEqual(flight.do('bio:3:5', lambda: ['ok']), (['ok'], False))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+
+from database.connection import db
+from models.user import User  # noqa: F401 - tables referenced by foreign keys
+from models.subject import Subject  # noqa: F401
+from models.topic import Topic  # noqa: F401
+from models.question import Question  # noqa: F401
+from models.test import TestResult
+from models.test_job import TestJob
+from services.test_job_service import TestJobService
+
+class FakeTestService:
+    """Stands in for TestService.start_test_stream / build_start_response"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.release = threading.Event()
+        self.fresh = None
+
+    def start_test_stream(self, user_id, subject_id, topic_id=None, question_count=10, fresh=True):
+        self.fresh = fresh
+        test_result = TestResult(user_id=user_id, subject_id=subject_id, topic_id=topic_id, total_questions=question_count)
+        db.session.add(test_result)
+        db.session.commit()
+        yield {'type': 'test', 'test_id': test_result.id}
+        for index in range(question_count):
+            yield {'type': 'question', 'index': index, 'question': {'id': f'q{index}'}}
+            if index == 0:
+                self.release.wait(5)
+        if self.fail:
+            yield {'type': 'error', 'status': 500, 'message': 'Failed to generate questions. Please try again.'}
+        else:
+            yield {'type': 'done', 'test_id': test_result.id}
+
+    def build_start_response(self, test_result, questions):
+        return {'success': True, 'test_id': test_result.id, 'questions': questions}
+
+class TestTestJobService(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        # A file database: job threads need their own connections
+        self.directory = tempfile.TemporaryDirectory()
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.directory.name, 'test.db')
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.services = []
+
+    def tearDown(self):
+        for service in self.services:
+            service.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+        self.directory.cleanup()
+
+    def make_service(self, test_service, workers=2):
+        service = TestJobService(workers=workers, stale_seconds=60, progress_interval=0)
+        service.init_app(self.app)
+        service.bind_test_service(test_service)
+        self.services.append(service)
+        return service
+
+    def wait_for(self, service, job_id, status, user_id=1):
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            db.session.expire_all()
+            result, _ = service.get(job_id, user_id)
+            if result['status'] == status:
+                return result
+            time.sleep(0.02)
+        self.fail(f'job never reached {status}: {result}')
+
+    def test_job_reports_progress_and_returns_the_test(self):
+        fake = FakeTestService()
+        service = self.make_service(fake)
+        body, status = service.submit(user_id=1, subject_id=1, question_count=3)
+        self.assertEqual(status, 202)
+
+        running = self.wait_for(service, body['job_id'], 'running')
+        while running['progress']['questions_ready'] < 1:
+            running = self.wait_for(service, body['job_id'], 'running')
+        fake.release.set()
+
+        done = self.wait_for(service, body['job_id'], 'completed')
+        self.assertEqual(done['progress'], {'questions_ready': 3, 'total_questions': 3})
+        self.assertEqual([q['id'] for q in done['test']['questions']], ['q0', 'q1', 'q2'])
+        self.assertEqual(done['test']['test_id'], done['test_id'])
+        # Tests skip the generation cache unless asked, so no two students share a cached set
+        self.assertTrue(fake.fresh)
+
+    def test_failed_generation_fails_the_job(self):
+        fake = FakeTestService(fail=True)
+        fake.release.set()
+        service = self.make_service(fake)
+        body, _ = service.submit(user_id=1, subject_id=1, question_count=2)
+
+        failed = self.wait_for(service, body['job_id'], 'failed')
+        self.assertEqual(failed['status_code'], 500)
+        self.assertIn('Failed to generate', failed['message'])
+
+    def test_jobs_are_private_and_bounded(self):
+        fake = FakeTestService()
+        service = self.make_service(fake)
+        service.max_pending = 1
+        body, _ = service.submit(user_id=1, subject_id=1, question_count=2)
+
+        self.assertEqual(service.get(body['job_id'], user_id=2)[1], 404)
+        self.assertEqual(service.submit(user_id=1, subject_id=1, question_count=2)[1], 503)
+        fake.release.set()
+        self.wait_for(service, body['job_id'], 'completed')
+
+    def backdate(self, *job_ids):
+        """Make the jobs look like nothing has touched them for two minutes"""
+        past = datetime.utcnow() - timedelta(seconds=120)
+        TestJob.query.filter(TestJob.id.in_(job_ids)).update(
+            {'created_at': past, 'started_at': past, 'heartbeat_at': past}, synchronize_session=False
+        )
+        db.session.commit()
+
+    def test_queued_job_of_a_live_process_is_not_failed(self):
+        fake = FakeTestService()
+        service = self.make_service(fake, workers=1)
+        # The second process polls jobs the first one holds
+        other = self.make_service(FakeTestService())
+        running, _ = service.submit(user_id=1, subject_id=1, question_count=2)
+        queued, _ = service.submit(user_id=1, subject_id=1, question_count=2)
+        self.wait_for(service, running['job_id'], 'running')
+        self.backdate(running['job_id'], queued['job_id'])
+
+        self.assertEqual(service.get(queued['job_id'], 1)[0]['status'], 'queued')
+        service._beat()
+        self.assertEqual(other.get(queued['job_id'], 1)[0]['status'], 'queued')
+        self.assertEqual(other.get(running['job_id'], 1)[0]['status'], 'running')
+
+        fake.release.set()
+        self.wait_for(service, queued['job_id'], 'completed')
+
+    def test_job_of_a_dead_process_is_failed(self):
+        job = TestJob('abandoned', 1, 1, 2)
+        db.session.add(job)
+        db.session.commit()
+        service = self.make_service(FakeTestService())
+
+        self.assertEqual(service.get('abandoned', 1)[0]['status'], 'queued')
+        self.backdate('abandoned')
+        failed, _ = service.get('abandoned', 1)
+        self.assertEqual(failed['status'], 'failed')
+        self.assertIn('interrupted', failed['message'])
+
+    def test_late_result_does_not_overwrite_a_stale_failure(self):
+        fake = FakeTestService()
+        service = self.make_service(fake)
+        other = self.make_service(FakeTestService())
+        body, _ = service.submit(user_id=1, subject_id=1, question_count=2)
+        self.wait_for(service, body['job_id'], 'running')
+        # The holding process looks dead to the other one, say after a long pause
+        self.backdate(body['job_id'])
+        self.assertEqual(other.get(body['job_id'], 1)[0]['status'], 'failed')
+
+        fake.release.set()
+        deadline = time.time() + 5
+        while service.stats()['pending'] and time.time() < deadline:
+            time.sleep(0.02)
+        db.session.expire_all()
+        result, _ = other.get(body['job_id'], 1)
+        self.assertEqual(result['status'], 'failed')
+        self.assertNotIn('test', result)
+        self.assertEqual(service.stats()['completed'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import threading
+import time
+import unittest
+
+from flask import Flask
+from sqlalchemy import inspect, text
+
+from database.connection import db
+from database.migrations import test_question_content
+from models.user import User
+from models.subject import Subject
+from models.topic import Topic
+from models.question import Question
+from models.test import TestResult, TestAnswer, TestQuestion
+from services.explanation_service import ExplanationService
+from services.near_duplicates import QuestionNearDuplicateIndex
+from services.question_writer import QuestionWriter
+from services.test_service import TestService
+
+def make_question(serial, answer):
+    return {
+        'id': f'test_1_{serial}',
+        'question_text': f'Generated question number {serial} about lenses and mirrors?',
+        'option_a': f'{serial} cm', 'option_b': f'{serial + 1} cm', 'option_c': f'{serial + 2} cm', 'option_d': f'{serial + 3} cm',
+        'correct_answer': answer,
+        'explanation': 'Because.',
+        'difficulty': 'medium'
+    }
+
+class SlowExplanations:
+    def __init__(self, gate):
+        self.gate = gate
+
+    def generate_explanations(self, subject, questions):
+        self.gate.wait(2)
+        return {question['id']: f"{question['correct_answer']} is right." for question in questions}
+
+class ShortStream:
+    """Streams fewer questions than were asked for"""
+
+    def __init__(self, questions):
+        self.questions = questions
+
+    def stream_questions(self, **options):
+        yield from self.questions
+
+class TestSubmitFromManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+        db.init_app(self.app)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.user = User('student', 'student@example.com')
+        self.subject = Subject('Physics')
+        db.session.add_all([self.user, self.subject])
+        db.session.commit()
+        self.topic = Topic('Optics', self.subject.id)
+        db.session.add(self.topic)
+        db.session.commit()
+
+        self.service = TestService.__new__(TestService)
+        self.service.near_duplicates = QuestionNearDuplicateIndex(enabled=False)
+        self.service.explanation_service = ExplanationService()
+        self.service.question_writer = QuestionWriter(enabled=False)
+        self.service.question_writer.bind_test_service(self.service)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.context.pop()
+
+    def start(self, questions):
+        test_result = TestResult(user_id=self.user.id, subject_id=self.subject.id, topic_id=self.topic.id,
+                                 total_questions=len(questions))
+        self.service.question_writer.save(test_result, questions)
+        return test_result.id
+
+    def test_answers_are_graded_against_the_manifest(self):
+        test_id = self.start([make_question(1, 'A'), make_question(2, 'b'), make_question(3, 'C')])
+        manifest = TestQuestion.query.filter_by(test_result_id=test_id).order_by(TestQuestion.position).all()
+        self.assertEqual([(entry.client_id, entry.correct_answer) for entry in manifest],
+                         [('test_1_1', 'A'), ('test_1_2', 'B'), ('test_1_3', 'C')])
+        self.assertTrue(all(entry.question_id for entry in manifest))
+
+        result, status = self.service.submit_test(test_id, [
+            {'question_id': 'test_1_1', 'answer': 'a'},
+            {'position': 1, 'answer': 'D'},  # Matched by position
+            {'question_id': 'unknown', 'answer': 'C'}
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual({key: result['results'][key] for key in ['correct_answers', 'wrong_answers', 'not_attempted', 'neet_score']},
+                         {'correct_answers': 1, 'wrong_answers': 1, 'not_attempted': 1, 'neet_score': 3})
+        self.assertEqual([detail['question_id'] for detail in result['answer_details']], [entry.question_id for entry in manifest])
+        self.assertEqual(result['answer_details'][1]['options']['D'], '5 cm')
+        self.assertEqual(TestAnswer.query.filter_by(test_result_id=test_id).count(), 3)
+
+    def test_submit_waits_for_unsaved_questions(self):
+        def failing_persist(questions, subject_id, topic_id=None):
+            raise RuntimeError('database is locked')
+
+        self.service._persist_questions, persist = failing_persist, self.service._persist_questions
+        test_id = self.start([make_question(1, 'A')])
+        result, status = self.service.submit_test(test_id, [{'question_id': 'test_1_1', 'answer': 'A'}])
+        self.assertEqual(status, 503)
+        self.assertEqual(TestResult.query.get(test_id).status, 'in_progress')
+
+        self.service._persist_questions = persist
+        result, status = self.service.submit_test(test_id, [{'question_id': 'test_1_1', 'answer': 'A'}])
+        self.assertEqual((status, result['results']['correct_answers']), (200, 1))
+
+    def add_bank_question(self, question_text, correct_answer, explanation='From the bank.'):
+        question = Question(question_text, 'w', 'x', 'y', 'z', correct_answer, explanation, self.subject.id, self.topic.id)
+        db.session.add(question)
+        db.session.commit()
+        return question
+
+    def test_results_show_the_question_as_served(self):
+        # An earlier test stored the same stem with other options; the served question resolves to that row
+        stored = self.add_bank_question(make_question(1, 'A')['question_text'], 'D')
+        test_id = self.start([make_question(1, 'A')])
+        self.assertEqual(TestQuestion.query.filter_by(test_result_id=test_id).one().question_id, stored.id)
+
+        result, status = self.service.submit_test(test_id, [{'question_id': 'test_1_1', 'answer': 'A'}])
+        self.assertEqual(status, 200)
+        detail = result['answer_details'][0]
+        self.assertEqual((detail['is_correct'], detail['options']['A'], detail['explanation']), (True, '1 cm', 'Because.'))
+
+        result, _ = self.service.get_test_results(test_id)
+        detail = result['answer_details'][0]
+        self.assertEqual((detail['correct_answer'], detail['options'], detail['explanation']),
+                         ('A', {'A': '1 cm', 'B': '2 cm', 'C': '3 cm', 'D': '4 cm'}, 'Because.'))
+
+    def test_test_started_without_a_manifest_is_graded_from_the_bank(self):
+        first = self.add_bank_question('Which mirror forms a virtual erect image?', 'B')
+        second = self.add_bank_question('What is the power of a lens of focal length 1 m?', 'C')
+        test_result = TestResult(user_id=self.user.id, subject_id=self.subject.id, topic_id=self.topic.id, total_questions=3)
+        db.session.add(test_result)
+        db.session.commit()
+
+        result, status = self.service.submit_test(test_result.id, [
+            {'question_id': str(first.id), 'answer': 'B', 'position': 1},
+            {'question_id': second.id, 'answer': 'A'},
+            {'question_id': 'test_9_9', 'answer': 'A', 'position': 0}  # Never stored, so it cannot be graded
+        ])
+        self.assertEqual(status, 200)
+        self.assertEqual((result['results']['correct_answers'], result['results']['wrong_answers']), (1, 1))
+        self.assertEqual(TestQuestion.query.filter_by(test_result_id=test_result.id).count(), 2)
+
+        result, status = self.service.get_test_results(test_result.id)
+        self.assertEqual(status, 200)
+        self.assertEqual([detail['question_text'] for detail in result['answer_details']],
+                         [first.question_text, second.question_text])
+
+    def test_migration_adds_the_served_columns_once(self):
+        test_id = self.start([make_question(1, 'A')])
+        db.session.remove()
+        with db.engine.begin() as connection:
+            for name, _ in test_question_content.COLUMNS:
+                connection.execute(text(f'ALTER TABLE test_questions DROP COLUMN {name}'))
+
+        test_question_content.upgrade()
+        test_question_content.upgrade()
+
+        columns = {column['name'] for column in inspect(db.engine).get_columns('test_questions')}
+        self.assertTrue({'question_text', 'options', 'explanation'} <= columns)
+        # Entries from before the migration are shown from the bank row
+        result, status = self.service.submit_test(test_id, [{'question_id': 'test_1_1', 'answer': 'A'}])
+        self.assertEqual((status, result['answer_details'][0]['options']['A']), (200, '1 cm'))
+
+    def test_short_streamed_test_keeps_the_announced_timer(self):
+        self.service.question_service = ShortStream([make_question(1, 'A'), make_question(2, 'B')])
+        events = list(self.service.start_test_stream(self.user.id, self.subject.id, self.topic.id, question_count=5))
+        announced, done = events[0], events[-1]
+        self.assertEqual((announced['type'], announced['timer_minutes'], done['type'], done['total_questions']),
+                         ('test', 5, 'done', 2))
+
+        test_result = TestResult.query.get(done['test_id'])
+        self.assertEqual(test_result.total_questions, 2)
+        status, _ = self.service.get_test_status(test_result.id)
+        self.assertEqual(status['expected_duration_minutes'], 5)
+        self.assertGreater(status['time_remaining_seconds'], 4 * 60)
+        self.assertEqual(self.service.build_start_response(test_result, [])['end_time'], announced['end_time'])
+
+    def test_results_view_does_not_wait_past_the_view_timeout(self):
+        gate = threading.Event()
+        ai_service = SlowExplanations(gate)
+        self.service.explanation_service = ExplanationService(view_timeout=0.2)
+        self.service.explanation_service.init_app(self.app)
+        self.service.explanation_service.bind_ai_service(ai_service)
+        test_id = self.start([dict(make_question(1, 'A'), explanation=''), dict(make_question(2, 'B'), explanation='')])
+        self.service.submit_test(test_id, [{'question_id': 'test_1_1', 'answer': 'A'}])
+
+        started = time.monotonic()
+        result, status = self.service.get_test_results(test_id)
+        self.assertEqual(status, 200)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertTrue(all(detail['explanation_pending'] for detail in result['answer_details']))
+
+        gate.set()
+        deadline = time.time() + 5
+        while time.time() < deadline and result['answer_details'][0]['explanation_pending']:
+            time.sleep(0.02)
+            db.session.expire_all()
+            result, _ = self.service.get_test_results(test_id)
+        self.assertEqual(result['answer_details'][0]['explanation'], 'A is right.')
+
+if __name__ == '__main__':
+    unittest.main()
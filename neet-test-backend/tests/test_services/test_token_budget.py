@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+from services.ai_usage import AIUsageLedger
+from services.token_budget import TokenBudget
+
+class TestTokenBudget(unittest.TestCase):
+
+    def test_default_until_enough_samples(self):
+        budget = TokenBudget(default_per_question=350, max_output_tokens=2048, min_samples=3)
+        self.assertEqual(budget.budget('Physics', 'medium', 1), 550)
+        self.assertEqual(budget.chunk_capacity('Physics', 'medium'), 5)
+        budget.observe('Physics', 'medium', 5, 1000, 2000)
+        self.assertEqual(budget.per_question('Physics', 'medium'), 350)
+
+    def test_budget_and_chunks_follow_observed_tokens(self):
+        budget = TokenBudget(default_per_question=350, max_output_tokens=2048, min_samples=3, alpha=0.5)
+        for _ in range(10):
+            budget.observe('Biology', 'easy', 5, 950, 2000)  # 200 of overhead and 150 tokens per question
+
+        per_question = budget.per_question('Biology', 'easy')
+        self.assertTrue(150 <= per_question < 200, per_question)
+        self.assertEqual(budget.budget('Biology', 'easy', 2), 200 + 2 * per_question)
+        self.assertGreater(budget.chunk_capacity('Biology', 'easy'), 5)
+        # Other subjects and difficulties keep their own statistics
+        self.assertEqual(budget.per_question('Biology', 'hard'), 350)
+
+    def test_truncated_responses_raise_the_estimate(self):
+        budget = TokenBudget(default_per_question=350, max_output_tokens=2048, min_samples=1, alpha=0.5)
+        budget.observe('Chemistry', 'hard', 5, 1500, 2000)  # 300 per question
+        before = budget.per_question('Chemistry', 'hard')
+        budget.observe('Chemistry', 'hard', 3, 1990, 2000)  # Hit the budget with 3 complete questions
+        self.assertGreater(budget.per_question('Chemistry', 'hard'), before)
+        self.assertEqual(budget.stats()['estimates'][0]['truncated'], 1)
+
+    def test_overhead_is_not_counted_per_question(self):
+        budget = TokenBudget(default_per_question=350, overhead_tokens=200, min_samples=1, alpha=0.5)
+        for _ in range(20):
+            # Both responses spent 200 tokens on the wrapper and 100 on each question
+            budget.observe('Physics', 'easy', 2, 400, 2000)
+            budget.observe('Physics', 'easy', 8, 1000, 2000)
+
+        estimate = budget.stats()['estimates'][0]
+        self.assertEqual((estimate['mean_tokens_per_question'], estimate['stddev']), (100.0, 0.0))
+
+    def test_seeded_from_usage_ledger(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            ledger = AIUsageLedger(os.path.join(tmpdir, 'runtime.db'))
+            for _ in range(5):
+                ledger.record('generate', 'success', 'Physics', None, 'medium', 4, 4, {'candidatesTokenCount': 1000})
+            ledger.record('generate', 'partial', 'Physics', None, 'medium', 4, 1, {'candidatesTokenCount': 2000})
+
+            budget = TokenBudget(default_per_question=350, min_samples=5, usage=ledger)
+            # (1000 - 200 overhead) / 4 = 200 mean + 2 x 50 prior spread
+            self.assertEqual(budget.per_question('Physics', 'medium'), 300)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+from types import SimpleNamespace
+
+from services.topic_mix import allocate, split_counts, remaining_counts, TopicMix
+
+TOPICS = [
+    SimpleNamespace(id=1, name='Mechanics'),
+    SimpleNamespace(id=2, name='Optics'),
+    SimpleNamespace(id=3, name='Modern Physics')
+]
+
+class TestAllocation(unittest.TestCase):
+
+    def test_allocate_is_proportional_and_exact(self):
+        counts = allocate({'a': 2.0, 'b': 1.0, 'c': 1.0}, 8)
+        self.assertEqual(counts, {'a': 4, 'b': 2, 'c': 2})
+        self.assertEqual(sum(allocate({'a': 1, 'b': 1, 'c': 1}, 7).values()), 7)
+
+    def test_small_test_covers_a_subset_of_topics_deterministically(self):
+        counts = allocate({name: 1.0 for name in 'abcdefg'}, 3)
+        self.assertEqual(counts, {'a': 1, 'b': 1, 'c': 1})
+        self.assertEqual([allocate({name: 1.0 for name in 'abcdefg'}, 10) for _ in range(5)],
+                         [{'a': 2, 'b': 2, 'c': 2, 'd': 1, 'e': 1, 'f': 1, 'g': 1}] * 5)
+
+    def test_split_counts_over_chunks(self):
+        chunks = split_counts({'a': 3, 'b': 2}, [3, 2])
+        self.assertEqual(chunks, [{'a': 3}, {'b': 2}])
+
+    def test_remaining_counts_follow_the_deficit(self):
+        answered = [{'topic': 'a'}, {'topic': 'a'}, {'topic': 'b'}]
+        self.assertEqual(remaining_counts({'a': 2, 'b': 2, 'c': 1}, answered, 2), {'b': 1, 'c': 1})
+
+class TestTopicMixTagging(unittest.TestCase):
+
+    def test_tags_by_name_and_assigns_unrecognised_topics_by_deficit(self):
+        mix = TopicMix(TOPICS, 3)
+        questions = [
+            {'topic': 'mechanics'},
+            {'topic': 'Optics (Lenses)'},
+            {'topic': 'General'}
+        ]
+        mix.tag(questions)
+        self.assertEqual([q['topic_id'] for q in questions], [1, 2, 3])
+        self.assertEqual(questions[2]['topic'], 'Modern Physics')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import random
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from services.question_parser import IncrementalQuestionParser
+from utils.mock_gemini_server import LatencyModel, MockGemini, create_server
+
+PROMPT = ('Generate 3 high-quality NEET Physics multiple choice questions focusing specifically on Optics.\n'
+          'Difficulty Level: hard\n')
+
+class TestLatencyModel(unittest.TestCase):
+
+    def test_seeded_generator_replays_the_same_latencies(self):
+        first = LatencyModel('lognormal:1.5,0.4', random.Random(7))
+        second = LatencyModel('lognormal:1.5,0.4', random.Random(7))
+        self.assertEqual([first.sample() for _ in range(5)], [second.sample() for _ in range(5)])
+
+    def test_samples_are_never_negative(self):
+        model = LatencyModel('normal:0,1', random.Random(1))
+        self.assertTrue(all(model.sample() >= 0 for _ in range(200)))
+        self.assertEqual(LatencyModel('fixed:0.25').sample(), 0.25)
+        with self.assertRaises(ValueError):
+            LatencyModel('poisson:1')
+
+    def test_mock_seed_covers_latency_and_content(self):
+        runs = []
+        for _ in range(2):
+            mock = MockGemini(latency='uniform:0,2', seed=11)
+            runs.append(([mock.latency.sample() for _ in range(3)], mock.make_questions(2, 'Physics', 'Optics', 'easy')))
+        self.assertEqual(runs[0], runs[1])
+
+class TestMockGeminiServer(unittest.TestCase):
+
+    def start(self, **options):
+        server = create_server(port=0, seed=3, **options)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_address[1]}'
+
+    def post(self, base, method='generateContent', prompt=PROMPT, **config):
+        body = json.dumps({'contents': [{'parts': [{'text': prompt}]}], 'generationConfig': config}).encode('utf-8')
+        request = urllib.request.Request(f'{base}/v1beta/models/gemini:{method}?key=mock', data=body,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, response.headers, response.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read().decode('utf-8')
+
+    def stats(self, base):
+        with urllib.request.urlopen(f'{base}/stats', timeout=5) as response:
+            return json.loads(response.read())
+
+    def test_generate_content_answers_with_the_prompted_questions(self):
+        base = self.start()
+        status, _, body = self.post(base)
+        result = json.loads(body)
+
+        self.assertEqual(status, 200)
+        questions = IncrementalQuestionParser().feed(result['candidates'][0]['content']['parts'][0]['text'])
+        self.assertEqual(len(questions), 3)
+        self.assertTrue(all(q['topic'] == 'Optics' and q['difficulty'] == 'hard' for q in questions))
+        self.assertEqual(result['usageMetadata']['totalTokenCount'],
+                         result['usageMetadata']['promptTokenCount'] + result['usageMetadata']['candidatesTokenCount'])
+
+    def test_stream_sends_the_same_answer_as_server_sent_events(self):
+        base = self.start()
+        status, headers, body = self.post(base, 'streamGenerateContent')
+        events = [json.loads(line[len('data: '):]) for line in body.split('\r\n') if line.startswith('data: ')]
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Type'], 'text/event-stream')
+        text = ''.join(event['candidates'][0]['content']['parts'][0]['text'] for event in events)
+        self.assertEqual(len(IncrementalQuestionParser().feed(text)), 3)
+        self.assertIn('usageMetadata', events[-1])
+        self.assertEqual(self.stats(base)['streamed'], 1)
+
+    def test_output_is_cut_at_max_output_tokens(self):
+        base = self.start()
+        _, _, body = self.post(base, maxOutputTokens=50)
+        candidate = json.loads(body)['candidates'][0]
+
+        self.assertEqual(candidate['finishReason'], 'MAX_TOKENS')
+        self.assertEqual(len(candidate['content']['parts'][0]['text']), 200)
+
+    def test_injected_errors_and_rate_limits(self):
+        failing = self.start(error_rate=1.0, error_codes=[503])
+        status, _, body = self.post(failing)
+        self.assertEqual(status, 503)
+        self.assertEqual(json.loads(body)['error']['status'], 'UNAVAILABLE')
+
+        limited = self.start(rpm=1)
+        self.assertEqual(self.post(limited)[0], 200)
+        status, headers, _ = self.post(limited)
+        self.assertEqual(status, 429)
+        self.assertGreaterEqual(int(headers['Retry-After']), 1)
+        self.assertEqual(self.stats(limited)['rate_limited'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
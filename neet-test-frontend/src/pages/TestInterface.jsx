@@ -202,17 +202,18 @@ const TestInterface = () => {
     
     try {
       // Create answers array for ALL questions in the test, not just answered ones
-      const answersArray = questions.map(question => {
+      const answersArray = questions.map((question, position) => {
         const questionId = question.question_id || question.id;
         const userAnswer = answers[questionId];
         
         if (userAnswer) {
           // User answered this question
-          return userAnswer;
+          return { ...userAnswer, position };
         } else {
           // User didn't answer this question
           return {
             question_id: questionId,
+            position,
             answer: '',
             time_taken: 0
           };
@@ -223,8 +224,8 @@ const TestInterface = () => {
       console.log('Total questions:', questions.length);
       console.log('Answered questions:', Object.keys(answers).length);
       
-      // Pass both answers and test questions to backend
-      const response = await testAPI.submitTest(testId, answersArray, questions);
+      // The backend grades against the questions it stored when the test started
+      const response = await testAPI.submitTest(testId, answersArray);
       
       if (response.data.success) {
         setTestSubmitted(true);
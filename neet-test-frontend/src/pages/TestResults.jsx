@@ -27,6 +27,7 @@ const TestResults = () => {
   const [results, setResults] = useState(null);
   const [loading, setLoading] = useState(true);
   const [showAnswers, setShowAnswers] = useState(false);
+  const [loadingExplanations, setLoadingExplanations] = useState(false);
 
   useEffect(() => {
     if (contextTestResults && contextTestResults.test_id == testId) {
@@ -56,6 +57,43 @@ const TestResults = () => {
     }
   };
 
+  // Explanations may be written after the test; the results endpoint fills in missing ones
+  const fetchExplanations = async () => {
+    setLoadingExplanations(true);
+    try {
+      const response = await testAPI.getTestResults(testId);
+      if (response.data.success) {
+        const byId = {};
+        const byText = {};
+        response.data.answer_details.forEach((answer) => {
+          byId[answer.question_id] = answer;
+          byText[answer.question_text] = answer;
+        });
+        setResults((current) => ({
+          ...current,
+          answer_details: current.answer_details.map((answer) => {
+            const fresh = byId[answer.question_id] || byText[answer.question_text];
+            return fresh
+              ? { ...answer, explanation: fresh.explanation, explanation_pending: fresh.explanation_pending }
+              : answer;
+          })
+        }));
+      }
+    } catch (error) {
+      console.error('Error fetching explanations:', error);
+      toast.error('Failed to load explanations');
+    } finally {
+      setLoadingExplanations(false);
+    }
+  };
+
+  const handleToggleAnswers = () => {
+    if (!showAnswers && results.answer_details.some((answer) => answer.explanation_pending)) {
+      fetchExplanations();
+    }
+    setShowAnswers(!showAnswers);
+  };
+
   const handleRetakeTest = () => {
     dispatch({ type: 'RESET_TEST' });
     navigate('/test-selection');
@@ -267,7 +305,7 @@ const TestResults = () => {
             <span>Detailed Solutions</span>
           </h2>
           <button
-            onClick={() => setShowAnswers(!showAnswers)}
+            onClick={handleToggleAnswers}
             className="btn-secondary"
           >
             {showAnswers ? 'Hide' : 'Show'} Answers
@@ -321,11 +359,17 @@ const TestResults = () => {
                   )}
                 </div>
                 
-                {answer.explanation && (
+                {answer.explanation ? (
                   <div className="bg-blue-50 border border-blue-200 rounded-lg p-3">
                     <h4 className="text-sm font-medium text-blue-900 mb-2">Explanation:</h4>
                     <p className="text-blue-800 text-sm">{answer.explanation}</p>
                   </div>
+                ) : answer.explanation_pending && (
+                  <div className="bg-blue-50 border border-blue-200 rounded-lg p-3">
+                    <p className="text-blue-800 text-sm">
+                      {loadingExplanations ? 'Preparing explanation...' : 'Explanation is not available yet.'}
+                    </p>
+                  </div>
                 )}
               </div>
             ))}
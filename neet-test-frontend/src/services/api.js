@@ -69,10 +69,7 @@ export const testAPI = {
 
   // Tests
   startTest: (data) => api.post('/tests/start', data),
-  submitTest: (testId, answers, testQuestions = null) => api.post(`/tests/${testId}/submit`, { 
-    answers, 
-    test_questions: testQuestions 
-  }),
+  submitTest: (testId, answers) => api.post(`/tests/${testId}/submit`, { answers }),
   getTestStatus: (testId) => api.get(`/tests/${testId}/status`),
   getTestResults: (testId) => api.get(`/tests/${testId}/results`),
   